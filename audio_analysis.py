@@ -0,0 +1,333 @@
+"""
+SpotifyClone audio analysis - waveform peak pyramids and ReplayGain-style loudness
+
+Decoders turn a file into PCM frames; WAV is read straight from a memory
+map. Other codecs can be added by registering a decoder in ``DECODERS``.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import struct
+import sys
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Set
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Finest waveform level: one min/max pair per this many frames
+BASE_FRAMES_PER_PEAK = 256
+# Levels are halved until the coarsest one has at most this many peaks
+OVERVIEW_PEAKS = 256
+# Frames decoded and analysed at a time (rounded to whole peaks and loudness sub-blocks)
+BLOCK_FRAMES = 1 << 20
+
+PEAKS_MAGIC = b"VXPK"
+PEAKS_VERSION = 1
+PEAKS_HEADER = struct.Struct("<4sHIQIH")
+
+# ReplayGain 2.0 reference level
+REPLAYGAIN_REFERENCE = -18.0
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+
+
+class AnalysisError(Exception):
+    """Raised for files that cannot be decoded"""
+
+
+class PcmSource:
+    """Decoded PCM frames; ``read`` returns float32 samples in [-1, 1]"""
+
+    def __init__(self, frames: int, channels: int, sample_rate: int,
+                 read: Callable[[int, int], "np.ndarray"]):
+        self.frames = frames
+        self.channels = channels
+        self.sample_rate = sample_rate
+        self.read = read
+
+
+def open_wav(path: Path) -> PcmSource:
+    """Memory-map the data chunk of a PCM or float WAV file"""
+    with open(path, "rb") as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+            raise AnalysisError("Missing RIFF/WAVE header")
+        fmt = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                raise AnalysisError("No data chunk")
+            chunk_id, size = struct.unpack("<4sI", chunk)
+            if chunk_id == b"fmt ":
+                fmt = f.read(size + (size & 1))
+            elif chunk_id == b"data":
+                offset = f.tell()
+                break
+            else:
+                f.seek(size + (size & 1), os.SEEK_CUR)
+    if fmt is None:
+        raise AnalysisError("data chunk before fmt chunk")
+
+    tag, channels, sample_rate, _, block_align, bits = struct.unpack("<HHIIHH", fmt[:16])
+    if tag == 0xFFFE and len(fmt) >= 26:
+        # WAVE_FORMAT_EXTENSIBLE: the real format is the start of the sub-format GUID
+        tag = struct.unpack("<H", fmt[24:26])[0]
+    if not channels or not sample_rate or block_align != channels * bits // 8:
+        raise AnalysisError("Inconsistent fmt chunk")
+
+    # A truncated upload claims more data than it has
+    size = min(size, os.path.getsize(path) - offset)
+    frames = size // block_align
+    if frames == 0:
+        raise AnalysisError("No audio frames")
+
+    if tag == 3 and bits in (32, 64):
+        samples = np.memmap(path, dtype=f"<f{bits // 8}", mode="r", offset=offset, shape=(frames, channels))
+        return PcmSource(frames, channels, sample_rate,
+                         lambda start, stop: np.asarray(samples[start:stop], dtype=np.float32))
+    if tag != 1 or bits not in (8, 16, 24, 32):
+        raise AnalysisError(f"Unsupported WAV encoding (format {tag}, {bits} bits)")
+
+    if bits == 24:
+        raw = np.memmap(path, dtype=np.uint8, mode="r", offset=offset, shape=(frames, channels, 3))
+
+        def read_24(start: int, stop: int) -> "np.ndarray":
+            block = raw[start:stop].astype(np.int32)
+            values = block[..., 0] | (block[..., 1] << 8) | (block[..., 2] << 16)
+            values = np.where(values >= 1 << 23, values - (1 << 24), values)
+            return values.astype(np.float32) / (1 << 23)
+
+        return PcmSource(frames, channels, sample_rate, read_24)
+
+    if bits == 8:
+        # 8-bit WAV is unsigned with a 128 midpoint
+        samples = np.memmap(path, dtype=np.uint8, mode="r", offset=offset, shape=(frames, channels))
+        return PcmSource(frames, channels, sample_rate,
+                         lambda start, stop: (samples[start:stop].astype(np.float32) - 128) / 128)
+
+    samples = np.memmap(path, dtype=f"<i{bits // 8}", mode="r", offset=offset, shape=(frames, channels))
+    scale = float(1 << (bits - 1))
+    return PcmSource(frames, channels, sample_rate,
+                     lambda start, stop: samples[start:stop].astype(np.float32) / scale)
+
+
+DECODERS: Dict[str, Callable[[Path], PcmSource]] = {
+    ".wav": open_wav,
+}
+
+
+def _k_weighting_power(sample_rate: int, n: int) -> "np.ndarray":
+    """|H(f)|^2 of the BS.1770 K-weighting filter at the rfft bins of an n-sample block"""
+    # Stage 1: high shelf
+    k = math.tan(math.pi * 1681.974450955533 / sample_rate)
+    q = 0.7071752369554196
+    vh = 10 ** (3.999843853973347 / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf_b = [(vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0]
+    shelf_a = [1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+    # Stage 2: high pass
+    k = math.tan(math.pi * 38.13547087602444 / sample_rate)
+    q = 0.5003270373238773
+    a0 = 1 + k / q + k * k
+    pass_b = [1.0, -2.0, 1.0]
+    pass_a = [1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+
+    z = np.exp(-1j * np.pi * np.arange(n // 2 + 1) / (n / 2))
+    response = np.ones_like(z)
+    for b, a in ((shelf_b, shelf_a), (pass_b, pass_a)):
+        response *= (b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)
+    return np.abs(response) ** 2
+
+
+def _integrated_loudness(powers: "np.ndarray") -> Optional[float]:
+    """Gated loudness (LUFS) from per-channel K-weighted power of 100ms sub-blocks"""
+    if len(powers) < 4:
+        return None
+    # 400ms gating blocks overlapping by 75%, summed over channels
+    summed = powers.sum(axis=1)
+    blocks = (summed[:-3] + summed[1:-2] + summed[2:-1] + summed[3:]) / 4
+    with np.errstate(divide="ignore"):
+        loudness = -0.691 + 10 * np.log10(blocks)
+    gated = blocks[loudness > ABSOLUTE_GATE]
+    if not len(gated):
+        return None
+    threshold = -0.691 + 10 * math.log10(gated.mean()) + RELATIVE_GATE
+    gated = blocks[(loudness > ABSOLUTE_GATE) & (loudness > threshold)]
+    return -0.691 + 10 * math.log10(gated.mean())
+
+
+def _write_peaks(out_path: Path, sample_rate: int, frames: int, levels):
+    # Per process, so workers analysing the same file never share a temp file
+    temp_path = out_path.with_suffix(f".{os.getpid()}.tmp")
+    with open(temp_path, "wb") as f:
+        f.write(PEAKS_HEADER.pack(PEAKS_MAGIC, PEAKS_VERSION, sample_rate, frames,
+                                  BASE_FRAMES_PER_PEAK, len(levels)))
+        f.write(struct.pack(f"<{len(levels)}I", *(len(low) for low, _ in levels)))
+        for low, high in levels:
+            pairs = np.stack([low, high], axis=1)
+            f.write(np.round(pairs * 32767).clip(-32767, 32767).astype("<i2").tobytes())
+    os.replace(temp_path, out_path)
+
+
+def analyze_file(path: Path, out_path: Path) -> Dict[str, Any]:
+    """Compute the peak pyramid (written to ``out_path``) and loudness of a file.
+
+    Runs in a worker process. Returns the loudness fields for the library.
+    """
+    decoder = DECODERS.get(Path(path).suffix.lower())
+    if decoder is None:
+        raise AnalysisError(f"No decoder for {Path(path).suffix}")
+    try:
+        source = decoder(path)
+    except (struct.error, ValueError) as e:
+        raise AnalysisError(f"Malformed file: {e}") from e
+
+    sub_block = round(source.sample_rate * 0.1)
+    step = math.lcm(BASE_FRAMES_PER_PEAK, sub_block)
+    block_frames = max(1, BLOCK_FRAMES // step) * step
+    weights = _k_weighting_power(source.sample_rate, sub_block)
+    # One-sided spectrum: every bin but DC (and Nyquist) stands for two
+    weights[1:(sub_block + 1) // 2] *= 2
+
+    lows, highs, powers = [], [], []
+    peak = 0.0
+    for start in range(0, source.frames, block_frames):
+        x = source.read(start, min(start + block_frames, source.frames))
+
+        pad = -len(x) % BASE_FRAMES_PER_PEAK
+        # Repeating the last frame leaves min/max unchanged
+        padded = np.pad(x, ((0, pad), (0, 0)), mode="edge") if pad else x
+        # Frames are contiguous, so each row holds one peak's samples of every channel
+        buckets = padded.reshape(-1, BASE_FRAMES_PER_PEAK * source.channels)
+        lows.append(buckets.min(axis=1))
+        highs.append(buckets.max(axis=1))
+        peak = max(peak, float(highs[-1].max()), -float(lows[-1].min()))
+
+        whole = len(x) // sub_block
+        if whole:
+            spectrum = np.fft.rfft(x[:whole * sub_block].reshape(whole, sub_block, source.channels), axis=1)
+            # Parseval: mean square of the filtered block from its weighted spectrum
+            powers.append(np.einsum("bfc,f->bc", spectrum.real ** 2 + spectrum.imag ** 2, weights) / sub_block ** 2)
+
+    low, high = np.concatenate(lows), np.concatenate(highs)
+    levels = [(low, high)]
+    while len(low) > OVERVIEW_PEAKS:
+        if len(low) % 2:
+            low, high = np.append(low, low[-1]), np.append(high, high[-1])
+        low, high = low.reshape(-1, 2).min(axis=1), high.reshape(-1, 2).max(axis=1)
+        levels.append((low, high))
+    _write_peaks(out_path, source.sample_rate, source.frames, levels)
+
+    loudness = _integrated_loudness(np.concatenate(powers)) if powers else None
+    return {
+        "loudness": round(loudness, 2) if loudness is not None else None,
+        "replaygain_gain": round(REPLAYGAIN_REFERENCE - loudness, 2) if loudness is not None else None,
+        "replaygain_peak": round(peak, 6),
+    }
+
+
+def read_peaks(path: Path, zoom: int = 0) -> Dict[str, Any]:
+    """One level of a stored peak pyramid; zoom 0 is the overview.
+
+    Each zoom step doubles the resolution; zooms past the finest level are
+    clamped. Peaks are interleaved min/max pairs scaled to +/-32767.
+    """
+    with open(path, "rb") as f:
+        magic, version, sample_rate, frames, base, count = PEAKS_HEADER.unpack(f.read(PEAKS_HEADER.size))
+        if magic != PEAKS_MAGIC or version != PEAKS_VERSION:
+            raise AnalysisError("Not a peaks file")
+        lengths = struct.unpack(f"<{count}I", f.read(4 * count))
+        zoom = min(zoom, count - 1)
+        level = count - 1 - zoom
+        f.seek(4 * sum(lengths[:level]), os.SEEK_CUR)
+        peaks = array("h")
+        peaks.frombytes(f.read(4 * lengths[level]))
+    if sys.byteorder == "big":
+        peaks.byteswap()
+    return {
+        "sample_rate": sample_rate,
+        "duration": round(frames / sample_rate, 3),
+        "zoom": zoom,
+        "max_zoom": count - 1,
+        "frames_per_peak": base << level,
+        "peaks": peaks.tolist(),
+    }
+
+
+class AnalysisPipeline:
+    """Analyses uploaded files on a background process pool.
+
+    The pyramid for ``files_dir/<name>`` is stored as ``cache_dir/<name>.peaks``
+    and ``on_result(filename, fields)`` receives the loudness fields on the
+    event loop. Files that fail get empty fields so they are not retried.
+    """
+
+    def __init__(self, files_dir: Path, cache_dir: Path,
+                 on_result: Callable[[str, Dict[str, Any]], None], max_workers: int = 2):
+        self.files_dir = Path(files_dir)
+        self.cache_dir = Path(cache_dir)
+        self.on_result = on_result
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending: Set[str] = set()
+        self.processed = 0
+        self.failed = 0
+
+    def supports(self, filename: str) -> bool:
+        return NUMPY_AVAILABLE and Path(filename).suffix.lower() in DECODERS
+
+    def peaks_path(self, filename: str) -> Path:
+        return self.cache_dir / f"{filename}.peaks"
+
+    def submit(self, filename: str):
+        """Queue a file for analysis; unsupported and already queued files are ignored"""
+        if filename in self._pending or not self.supports(filename):
+            return
+        if self._executor is None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        self._pending.add(filename)
+        asyncio.ensure_future(self._process(filename))
+
+    async def _process(self, filename: str):
+        loop = asyncio.get_running_loop()
+        try:
+            fields = await loop.run_in_executor(
+                self._executor, analyze_file, self.files_dir / filename, self.peaks_path(filename)
+            )
+            self.processed += 1
+        except FileNotFoundError:
+            return  # Deleted before we got to it
+        except (AnalysisError, OSError, ValueError) as e:
+            logger.warning(f"Could not analyse {filename}: {e}")
+            fields = {"loudness": None, "replaygain_gain": None, "replaygain_peak": None}
+            self.failed += 1
+        finally:
+            self._pending.discard(filename)
+        self.on_result(filename, fields)
+
+    def remove(self, filename: str):
+        self.peaks_path(filename).unlink(missing_ok=True)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "available": NUMPY_AVAILABLE,
+            "pending": len(self._pending),
+            "processed": self.processed,
+            "failed": self.failed,
+        }
@@ -0,0 +1,207 @@
+"""
+SpotifyClone audio cache - size-bounded disk cache of frequently played YouTube audio
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Set
+
+import aiofiles
+
+from stream_relay import StreamRelay, UpstreamError
+
+logger = logging.getLogger(__name__)
+
+EVICTION_POLICIES = ("lru", "lfu")
+EXTENSIONS = {
+    "audio/webm": ".webm",
+    "audio/mp4": ".m4a",
+    "audio/mpeg": ".mp3",
+    "audio/ogg": ".ogg",
+}
+VIDEO_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+# Play counts are kept for at most this many uncached videos
+MAX_TRACKED_PLAYS = 10000
+
+
+class AudioCache:
+    """Keeps the audio of hot tracks on disk so replays skip YouTube.
+
+    A video's plays are counted, and once it reaches ``fetch_after`` plays
+    its audio is downloaded through the relay in the background. Downloads
+    go to a ``.part`` file that is renamed into place only when complete,
+    so a crash never leaves a truncated file in the index. When the cache
+    exceeds ``max_bytes`` the least recently used (``lru``) or least often
+    hit (``lfu``) tracks are evicted.
+    """
+
+    def __init__(self, root: Path, relay: StreamRelay, max_bytes: int,
+                 fetch_after: int = 3, policy: str = "lfu", max_fetches: int = 2):
+        if policy not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy {policy!r}")
+        self.root = Path(root)
+        self.index_path = self.root / "index.json"
+        self.relay = relay
+        self.max_bytes = max_bytes
+        self.fetch_after = fetch_after
+        self.policy = policy
+        self.max_fetches = max_fetches
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._plays: "OrderedDict[str, int]" = OrderedDict()
+        self._fetching: Set[str] = set()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._bytes = 0
+        self.hits = 0
+        self.fetched = 0
+        self.fetch_failures = 0
+        self.evictions = 0
+
+    def _path(self, entry: Dict[str, Any]) -> Path:
+        return self.root / entry["filename"]
+
+    def load(self):
+        """Read the index, dropping partial downloads and files it does not know"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        if self.index_path.exists():
+            try:
+                self.entries = json.loads(self.index_path.read_text())
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not read audio cache index, starting empty: {e}")
+                self.entries = {}
+
+        self.entries = {
+            video_id: entry for video_id, entry in self.entries.items()
+            if self._path(entry).exists()
+        }
+        known = {entry["filename"] for entry in self.entries.values()} | {self.index_path.name}
+        for path in self.root.iterdir():
+            # Interrupted downloads and files whose index entry was lost
+            if path.is_file() and path.name not in known:
+                path.unlink()
+        self._bytes = sum(entry["size"] for entry in self.entries.values())
+        self.save()
+        logger.info(f"Audio cache: {len(self.entries)} tracks, {self._bytes} bytes")
+
+    def save(self):
+        temp_path = self.index_path.with_suffix(".tmp")
+        temp_path.write_text(json.dumps(self.entries))
+        os.replace(temp_path, self.index_path)
+
+    def get(self, video_id: str, count: bool = True) -> Optional[Dict[str, Any]]:
+        """Cached entry (with its ``path``) for a video, or None"""
+        entry = self.entries.get(video_id)
+        if entry is None:
+            return None
+        path = self._path(entry)
+        if not path.exists():
+            self._drop(video_id)
+            return None
+        if count:
+            self.hits += 1
+            entry["hits"] += 1
+            entry["last_access"] = time.time()
+        return {**entry, "path": path}
+
+    def record_play(self, video_id: str, title: Optional[str] = None):
+        """Count a play and start a background fetch once the video is hot"""
+        if video_id in self.entries or video_id in self._fetching or not VIDEO_ID_RE.match(video_id):
+            return
+        plays = self._plays.pop(video_id, 0) + 1
+        if plays < self.fetch_after:
+            self._plays[video_id] = plays
+            if len(self._plays) > MAX_TRACKED_PLAYS:
+                self._plays.popitem(last=False)
+            return
+        self._fetching.add(video_id)
+        asyncio.ensure_future(self._fetch(video_id, title))
+
+    async def _fetch(self, video_id: str, title: Optional[str]):
+        if self._semaphore is None:
+            # Created lazily so it binds to the server's event loop
+            self._semaphore = asyncio.Semaphore(self.max_fetches)
+        part_path = self.root / f"{video_id}.part"
+        try:
+            async with self._semaphore:
+                stream = await self.relay.open(video_id)
+                if stream.status_code != 200:
+                    await stream.response.aclose()
+                    raise UpstreamError(f"Upstream answered {stream.status_code}")
+                body = stream.body(strict=True)
+                size = 0
+                async with aiofiles.open(part_path, "wb") as f:
+                    async for chunk in body:
+                        size += len(chunk)
+                        if size > self.max_bytes:
+                            await body.aclose()
+                            raise UpstreamError(f"Track is larger than the whole cache ({self.max_bytes} bytes)")
+                        await f.write(chunk)
+                # Never publish a truncated track, however the body ended
+                expected = stream.headers.get("content-length")
+                if expected is not None and expected.isdigit() and int(expected) != size:
+                    raise UpstreamError(f"Upstream sent {size} of {expected} bytes")
+
+            media_type = stream.media_type or "application/octet-stream"
+            filename = video_id + EXTENSIONS.get(media_type.split(";")[0].strip(), ".bin")
+            os.replace(part_path, self.root / filename)
+            self.entries[video_id] = {
+                "filename": filename,
+                "media_type": media_type,
+                "title": title,
+                "size": size,
+                "hits": 0,
+                "last_access": time.time(),
+            }
+            self._bytes += size
+            self.fetched += 1
+            self._evict(keep=video_id)
+            self.save()
+            logger.info(f"Cached audio for {video_id} ({size} bytes)")
+        except Exception as e:
+            self.fetch_failures += 1
+            logger.warning(f"Could not cache audio for {video_id}: {e}")
+            part_path.unlink(missing_ok=True)
+        finally:
+            self._fetching.discard(video_id)
+
+    def _victim(self, keep: str) -> Optional[str]:
+        candidates = [video_id for video_id in self.entries if video_id != keep]
+        if not candidates:
+            return None
+        if self.policy == "lru":
+            return min(candidates, key=lambda video_id: self.entries[video_id]["last_access"])
+        return min(candidates, key=lambda video_id: (
+            self.entries[video_id]["hits"], self.entries[video_id]["last_access"]
+        ))
+
+    def _evict(self, keep: str):
+        while self._bytes > self.max_bytes:
+            victim = self._victim(keep)
+            if victim is None:
+                break
+            self._drop(victim)
+            self.evictions += 1
+            logger.info(f"Evicted {victim} from the audio cache")
+
+    def _drop(self, video_id: str):
+        entry = self.entries.pop(video_id)
+        self._bytes -= entry["size"]
+        self._path(entry).unlink(missing_ok=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tracks": len(self.entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "policy": self.policy,
+            "hits": self.hits,
+            "fetched": self.fetched,
+            "fetching": len(self._fetching),
+            "fetch_failures": self.fetch_failures,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,541 @@
+"""
+SpotifyClone audio metadata - tags and duration without decoding audio
+
+Supports ID3v2/ID3v1 + MPEG frame headers (MP3), FLAC STREAMINFO and Vorbis
+comments, Ogg Vorbis/Opus, MP4 atoms (M4A) and RIFF/WAVE.
+"""
+
+import asyncio
+import logging
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+TAG_FIELDS = ("title", "artist", "album")
+
+# Largest tag block we are willing to read (embedded cover art lives here)
+MAX_TAG_BYTES = 16 * 1024 * 1024
+
+
+class MetadataError(Exception):
+    """Raised when a file is not in the format its extension claims"""
+
+
+def _empty() -> Dict[str, Any]:
+    return {"title": None, "artist": None, "album": None, "duration": None,
+            "sample_rate": None, "channels": None}
+
+
+def _clean(text: str) -> Optional[str]:
+    text = text.replace("\x00", " ").strip()
+    return text or None
+
+
+# ---------------------------------------------------------------- MP3 / ID3
+
+ID3_FRAMES = {
+    "TIT2": "title", "TT2": "title",
+    "TPE1": "artist", "TP1": "artist",
+    "TALB": "album", "TAL": "album",
+}
+
+MPEG_BITRATES = {
+    # (version is MPEG1, layer) -> kbps by index
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+MPEG_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+def _syncsafe(data: bytes) -> int:
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+
+def _decode_id3_text(data: bytes) -> Optional[str]:
+    if not data:
+        return None
+    encoding, body = data[0], data[1:]
+    try:
+        if encoding == 0:
+            text = body.decode("latin-1")
+        elif encoding == 1:
+            text = body.decode("utf-16")
+        elif encoding == 2:
+            text = body.decode("utf-16-be")
+        else:
+            text = body.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+    # Multiple values are NUL-separated; keep the first
+    return _clean(text.split("\x00")[0])
+
+
+def _parse_id3v2(f: BinaryIO, meta: Dict[str, Any]) -> int:
+    """Read an ID3v2 tag at the start of the file; returns where audio starts"""
+    f.seek(0)
+    header = f.read(10)
+    if len(header) < 10 or header[:3] != b"ID3":
+        return 0
+    major, flags = header[3], header[5]
+    size = _syncsafe(header[6:10])
+    audio_start = 10 + size + (10 if flags & 0x10 else 0)
+    tag = f.read(min(size, MAX_TAG_BYTES))
+
+    pos = 0
+    if flags & 0x40 and major >= 3:
+        # Extended header
+        ext_size = _syncsafe(tag[:4]) if major == 4 else struct.unpack(">I", tag[:4])[0] + 4
+        pos = ext_size
+
+    id_len, header_len = (3, 6) if major == 2 else (4, 10)
+    while pos + header_len <= len(tag):
+        frame_id = tag[pos:pos + id_len]
+        if not frame_id.strip(b"\x00"):
+            break  # Padding
+        if major == 2:
+            frame_size = int.from_bytes(tag[pos + 3:pos + 6], "big")
+        elif major == 4:
+            frame_size = _syncsafe(tag[pos + 4:pos + 8])
+        else:
+            frame_size = struct.unpack(">I", tag[pos + 4:pos + 8])[0]
+        body = tag[pos + header_len:pos + header_len + frame_size]
+        pos += header_len + frame_size
+
+        name = frame_id.decode("latin-1", "replace")
+        if name in ID3_FRAMES and meta[ID3_FRAMES[name]] is None:
+            meta[ID3_FRAMES[name]] = _decode_id3_text(body)
+        elif name in ("TLEN", "TLE") and meta["duration"] is None:
+            length = _decode_id3_text(body)
+            if length and length.isdigit() and int(length) > 0:
+                meta["duration"] = int(length) / 1000
+    return audio_start
+
+
+def _parse_id3v1(f: BinaryIO, meta: Dict[str, Any]) -> int:
+    """Fill missing tags from an ID3v1 trailer; returns its size"""
+    f.seek(0, os.SEEK_END)
+    if f.tell() < 128:
+        return 0
+    f.seek(-128, os.SEEK_END)
+    tag = f.read(128)
+    if tag[:3] != b"TAG":
+        return 0
+    for field, (start, end) in zip(TAG_FIELDS, ((3, 33), (33, 63), (63, 93))):
+        if meta[field] is None:
+            meta[field] = _clean(tag[start:end].decode("latin-1"))
+    return 128
+
+
+def _parse_mpeg_header(header: bytes) -> Optional[Dict[str, Any]]:
+    value = struct.unpack(">I", header)[0]
+    if value >> 21 != 0x7FF:
+        return None
+    version_bits = (value >> 19) & 3
+    layer_bits = (value >> 17) & 3
+    bitrate_index = (value >> 12) & 0xF
+    rate_index = (value >> 10) & 3
+    if version_bits == 1 or layer_bits == 0 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    mpeg1 = version_bits == 3
+    layer = 4 - layer_bits
+    bitrate = MPEG_BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = MPEG_SAMPLE_RATES[version_bits][rate_index]
+    padding = (value >> 9) & 1
+    mono = ((value >> 6) & 3) == 3
+    if layer == 1:
+        samples = 384
+        frame_length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 1152 if (mpeg1 or layer == 2) else 576
+        frame_length = samples // 8 * bitrate // sample_rate + padding
+    return {
+        "mpeg1": mpeg1, "layer": layer, "bitrate": bitrate, "sample_rate": sample_rate,
+        "mono": mono, "samples": samples, "frame_length": frame_length,
+    }
+
+
+def read_mp3(f: BinaryIO) -> Dict[str, Any]:
+    meta = _empty()
+    audio_start = _parse_id3v2(f, meta)
+    trailer = _parse_id3v1(f, meta)
+    f.seek(0, os.SEEK_END)
+    file_size = f.tell()
+
+    # Find the first frame whose successor also looks like a frame
+    f.seek(audio_start)
+    window = f.read(64 * 1024)
+    frame = None
+    offset = 0
+    while offset + 4 <= len(window):
+        offset = window.find(b"\xff", offset)
+        if offset < 0 or offset + 4 > len(window):
+            break
+        frame = _parse_mpeg_header(window[offset:offset + 4])
+        if frame:
+            following = offset + frame["frame_length"]
+            if following + 4 > len(window) or _parse_mpeg_header(window[following:following + 4]):
+                break
+        frame = None
+        offset += 1
+    if frame is None:
+        return meta
+
+    meta["sample_rate"] = frame["sample_rate"]
+    meta["channels"] = 1 if frame["mono"] else 2
+    if meta["duration"] is not None:
+        return meta
+
+    # VBR files carry the frame count in a Xing/Info or VBRI header
+    if frame["mpeg1"]:
+        side_info = 17 if frame["mono"] else 32
+    else:
+        side_info = 9 if frame["mono"] else 17
+    xing_at = offset + 4 + side_info
+    frames = None
+    if window[xing_at:xing_at + 4] in (b"Xing", b"Info"):
+        flags = struct.unpack(">I", window[xing_at + 4:xing_at + 8])[0]
+        if flags & 1:
+            frames = struct.unpack(">I", window[xing_at + 8:xing_at + 12])[0]
+    elif window[offset + 36:offset + 40] == b"VBRI":
+        frames = struct.unpack(">I", window[offset + 50:offset + 54])[0]
+
+    if frames:
+        meta["duration"] = frames * frame["samples"] / frame["sample_rate"]
+    else:
+        audio_bytes = file_size - (audio_start + offset) - trailer
+        meta["duration"] = audio_bytes * 8 / frame["bitrate"]
+    return meta
+
+
+# ---------------------------------------------------------- Vorbis comments
+
+VORBIS_FIELDS = {"TITLE": "title", "ARTIST": "artist", "ALBUM": "album"}
+
+
+def _parse_vorbis_comments(data: bytes, meta: Dict[str, Any]):
+    """Little-endian vendor string + list of KEY=value pairs"""
+    try:
+        pos = 4 + struct.unpack("<I", data[:4])[0]
+        count = struct.unpack("<I", data[pos:pos + 4])[0]
+        pos += 4
+        for _ in range(count):
+            length = struct.unpack("<I", data[pos:pos + 4])[0]
+            comment = data[pos + 4:pos + 4 + length].decode("utf-8", "replace")
+            pos += 4 + length
+            key, _, value = comment.partition("=")
+            field = VORBIS_FIELDS.get(key.upper())
+            if field and meta[field] is None:
+                meta[field] = _clean(value)
+    except struct.error:
+        pass  # Truncated block; keep what we have
+
+
+def read_flac(f: BinaryIO) -> Dict[str, Any]:
+    meta = _empty()
+    f.seek(0)
+    start = 0
+    if f.read(3) == b"ID3":
+        # Some taggers prepend ID3v2 to FLAC
+        start = _parse_id3v2(f, meta)
+    f.seek(start)
+    if f.read(4) != b"fLaC":
+        raise MetadataError("Missing fLaC marker")
+
+    while True:
+        header = f.read(4)
+        if len(header) < 4:
+            break
+        last, block_type = header[0] & 0x80, header[0] & 0x7F
+        length = int.from_bytes(header[1:4], "big")
+        if block_type == 0:
+            info = f.read(length)
+            packed = int.from_bytes(info[10:18], "big")
+            sample_rate = packed >> 44
+            total_samples = packed & 0xFFFFFFFFF
+            meta["sample_rate"] = sample_rate
+            meta["channels"] = ((packed >> 41) & 7) + 1
+            if sample_rate and total_samples:
+                meta["duration"] = total_samples / sample_rate
+        elif block_type == 4 and length <= MAX_TAG_BYTES:
+            _parse_vorbis_comments(f.read(length), meta)
+        else:
+            f.seek(length, os.SEEK_CUR)
+        if last:
+            break
+    return meta
+
+
+# --------------------------------------------------------------------- Ogg
+
+def _ogg_packets(f: BinaryIO, count: int):
+    """Yield the first ``count`` packets of an Ogg stream"""
+    f.seek(0)
+    packet = b""
+    found = 0
+    while found < count:
+        header = f.read(27)
+        if len(header) < 27 or header[:4] != b"OggS":
+            return
+        segments = f.read(header[26])
+        for length in segments:
+            packet += f.read(length)
+            if len(packet) > MAX_TAG_BYTES:
+                return
+            if length < 255:
+                yield packet
+                packet = b""
+                found += 1
+                if found == count:
+                    return
+
+
+def _ogg_last_granule(f: BinaryIO) -> Optional[int]:
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    chunk = min(size, 64 * 1024)
+    f.seek(size - chunk)
+    tail = f.read(chunk)
+    at = tail.rfind(b"OggS")
+    while at >= 0:
+        if at + 14 <= len(tail):
+            return struct.unpack("<q", tail[at + 6:at + 14])[0]
+        at = tail.rfind(b"OggS", 0, at)
+    return None
+
+
+def read_ogg(f: BinaryIO) -> Dict[str, Any]:
+    meta = _empty()
+    packets = list(_ogg_packets(f, 2))
+    if not packets:
+        raise MetadataError("Missing OggS page")
+
+    head = packets[0]
+    pre_skip = 0
+    if head.startswith(b"\x01vorbis"):
+        meta["channels"] = head[11]
+        meta["sample_rate"] = struct.unpack("<I", head[12:16])[0]
+        granule_rate = meta["sample_rate"]
+        if len(packets) > 1 and packets[1].startswith(b"\x03vorbis"):
+            _parse_vorbis_comments(packets[1][7:], meta)
+    elif head.startswith(b"OpusHead"):
+        meta["channels"] = head[9]
+        pre_skip = struct.unpack("<H", head[10:12])[0]
+        meta["sample_rate"] = struct.unpack("<I", head[12:16])[0] or 48000
+        granule_rate = 48000  # Opus granules always count 48kHz samples
+        if len(packets) > 1 and packets[1].startswith(b"OpusTags"):
+            _parse_vorbis_comments(packets[1][8:], meta)
+    else:
+        return meta
+
+    granule = _ogg_last_granule(f)
+    if granule and granule > pre_skip and granule_rate:
+        meta["duration"] = (granule - pre_skip) / granule_rate
+    return meta
+
+
+# --------------------------------------------------------------------- MP4
+
+MP4_FIELDS = {b"\xa9nam": "title", b"\xa9ART": "artist", b"\xa9alb": "album"}
+MP4_CONTAINERS = {b"moov", b"udta", b"ilst", b"trak", b"mdia", b"minf", b"stbl"}
+
+
+def _mp4_atoms(data: bytes, start: int = 0, end: Optional[int] = None):
+    """Yield (type, payload_start, payload_end) for atoms in ``data``"""
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack(">I4s", data[pos:pos + 8])
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", data[pos + 8:pos + 16])[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            return
+        yield kind, pos + header, min(pos + size, end)
+        pos += size
+
+
+def _walk_mp4(data: bytes, start: int, end: int, meta: Dict[str, Any]):
+    for kind, body, body_end in _mp4_atoms(data, start, end):
+        if kind == b"mvhd":
+            version = data[body]
+            if version == 1:
+                timescale, duration = struct.unpack(">IQ", data[body + 20:body + 32])
+            else:
+                timescale, duration = struct.unpack(">II", data[body + 12:body + 20])
+            if timescale:
+                meta["duration"] = duration / timescale
+        elif kind == b"mp4a" and meta["sample_rate"] is None:
+            # AudioSampleEntry: channel count at +16, 16.16 sample rate at +24
+            meta["channels"] = struct.unpack(">H", data[body + 16:body + 18])[0]
+            meta["sample_rate"] = struct.unpack(">I", data[body + 24:body + 28])[0] >> 16
+        elif kind == b"stsd":
+            # Full box header + entry count precede the sample entries
+            _walk_mp4(data, body + 8, body_end, meta)
+        elif kind == b"meta":
+            # Full box: version/flags precede the children
+            _walk_mp4(data, body + 4, body_end, meta)
+        elif kind in MP4_FIELDS:
+            for child, value, value_end in _mp4_atoms(data, body, body_end):
+                if child == b"data" and meta[MP4_FIELDS[kind]] is None:
+                    # Type indicator and locale precede the value
+                    meta[MP4_FIELDS[kind]] = _clean(data[value + 8:value_end].decode("utf-8", "replace"))
+        elif kind in MP4_CONTAINERS:
+            _walk_mp4(data, body, body_end, meta)
+
+
+def read_mp4(f: BinaryIO) -> Dict[str, Any]:
+    meta = _empty()
+    f.seek(0, os.SEEK_END)
+    file_size = f.tell()
+    pos = 0
+    # Walk top-level atoms by seeking so mdat is never read
+    while pos + 8 <= file_size:
+        f.seek(pos)
+        header = f.read(16)
+        size, kind = struct.unpack(">I4s", header[:8])
+        header_len = 8
+        if size == 1:
+            size = struct.unpack(">Q", header[8:16])[0]
+            header_len = 16
+        elif size == 0:
+            size = file_size - pos
+        if size < header_len:
+            break
+        if kind == b"moov":
+            if size > MAX_TAG_BYTES:
+                break
+            f.seek(pos + header_len)
+            moov = f.read(size - header_len)
+            _walk_mp4(moov, 0, len(moov), meta)
+            break
+        pos += size
+    return meta
+
+
+# --------------------------------------------------------------------- WAV
+
+RIFF_INFO_FIELDS = {b"INAM": "title", b"IART": "artist", b"IPRD": "album"}
+
+
+def read_wav(f: BinaryIO) -> Dict[str, Any]:
+    meta = _empty()
+    f.seek(0)
+    header = f.read(12)
+    if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+        raise MetadataError("Missing RIFF/WAVE header")
+
+    byte_rate = None
+    data_size = None
+    while True:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            break
+        chunk_id, size = struct.unpack("<4sI", chunk)
+        padded = size + (size & 1)
+        if chunk_id == b"fmt ":
+            fmt = f.read(padded)
+            meta["channels"], meta["sample_rate"], byte_rate = struct.unpack("<HII", fmt[2:12])
+        elif chunk_id == b"data":
+            data_size = size
+            f.seek(padded, os.SEEK_CUR)
+        elif chunk_id == b"LIST" and size <= MAX_TAG_BYTES:
+            body = f.read(padded)
+            if body[:4] == b"INFO":
+                pos = 4
+                while pos + 8 <= len(body):
+                    sub_id, sub_size = struct.unpack("<4sI", body[pos:pos + 8])
+                    field = RIFF_INFO_FIELDS.get(sub_id)
+                    if field and meta[field] is None:
+                        meta[field] = _clean(body[pos + 8:pos + 8 + sub_size].decode("latin-1"))
+                    pos += 8 + sub_size + (sub_size & 1)
+        else:
+            f.seek(padded, os.SEEK_CUR)
+
+    if byte_rate and data_size is not None:
+        meta["duration"] = data_size / byte_rate
+    return meta
+
+
+READERS = {
+    ".mp3": read_mp3,
+    ".flac": read_flac,
+    ".ogg": read_ogg,
+    ".m4a": read_mp4,
+    ".wav": read_wav,
+}
+
+
+def read_metadata(path: Path) -> Dict[str, Any]:
+    """Tags and stream info for an audio file (blocking)"""
+    reader = READERS.get(Path(path).suffix.lower())
+    if reader is None:
+        raise MetadataError(f"Unsupported file type: {Path(path).suffix}")
+    with open(path, "rb") as f:
+        try:
+            meta = reader(f)
+        except (struct.error, IndexError) as e:
+            raise MetadataError(f"Malformed {Path(path).suffix} file: {e}") from e
+    if meta["duration"] is not None:
+        meta["duration"] = round(meta["duration"], 3)
+    return meta
+
+
+class MetadataPipeline:
+    """Reads metadata for uploaded files on a background thread pool.
+
+    ``on_result(filename, metadata)`` is called on the event loop once a
+    file has been parsed; files that cannot be parsed get empty metadata so
+    they are not retried on every rescan.
+    """
+
+    def __init__(self, files_dir: Path, on_result: Callable[[str, Dict[str, Any]], None],
+                 max_workers: int = 2):
+        self.files_dir = Path(files_dir)
+        self.on_result = on_result
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="metadata")
+        self._pending: Set[str] = set()
+        self.processed = 0
+        self.failed = 0
+
+    def submit(self, filename: str):
+        """Queue a file for parsing; duplicates of queued files are ignored"""
+        if filename in self._pending:
+            return
+        self._pending.add(filename)
+        asyncio.ensure_future(self._process(filename))
+
+    async def _process(self, filename: str):
+        loop = asyncio.get_running_loop()
+        try:
+            meta = await loop.run_in_executor(self._executor, read_metadata, self.files_dir / filename)
+            self.processed += 1
+        except FileNotFoundError:
+            return  # Deleted before we got to it
+        except (MetadataError, OSError) as e:
+            logger.warning(f"Could not read metadata for {filename}: {e}")
+            meta = _empty()
+            self.failed += 1
+        finally:
+            self._pending.discard(filename)
+        self.on_result(filename, meta)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": len(self._pending),
+            "processed": self.processed,
+            "failed": self.failed,
+        }
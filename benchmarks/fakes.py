@@ -0,0 +1,154 @@
+"""
+SpotifyClone benchmark fakes - stand-ins for youtubesearchpython and yt_dlp
+
+``install`` puts fake ``youtubesearchpython`` and ``yt_dlp`` modules into
+``sys.modules`` before the app is imported, so main.py and python313.py
+run unchanged against them. Latency and failures are drawn from
+configurable distributions; search results come from the app's own
+FakeSearchBackend and extracted stream URLs point at a
+GoogleVideoStandIn.
+"""
+
+import math
+import random
+import sys
+import threading
+import time
+import types
+from typing import Any, Callable, Dict, List, Optional
+
+from search_backend import FakeSearchBackend
+
+
+def parse_distribution(spec: str) -> Callable[[], float]:
+    """Latency sampler (seconds) from a spec string.
+
+    ``const:0.2``, ``uniform:0.1,0.5``, ``lognormal:0.3,0.6`` (median and
+    sigma of the underlying normal) or ``exp:0.2`` (mean).
+    """
+    kind, _, params = spec.partition(":")
+    values = [float(value) for value in params.split(",") if value]
+    if kind == "const" and len(values) == 1:
+        return lambda: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "lognormal" and len(values) == 2:
+        mu = math.log(values[0]) if values[0] > 0 else 0.0
+        return lambda: random.lognormvariate(mu, values[1]) if values[0] > 0 else 0.0
+    if kind == "exp" and len(values) == 1:
+        return lambda: random.expovariate(1 / values[0]) if values[0] > 0 else 0.0
+    raise ValueError(f"Bad latency distribution {spec!r}; use const:S, uniform:A,B, lognormal:MEDIAN,SIGMA or exp:MEAN")
+
+
+class FakeStats:
+    """Calls that reached the fakes, i.e. the YouTube traffic the app would have made"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.searches = 0
+        self.extractions = 0
+        self.failures = 0
+
+    def count(self, name: str, failed: bool = False):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+            if failed:
+                self.failures += 1
+
+
+stats = FakeStats()
+
+
+def make_search_module(latency: Callable[[], float], failure_rate: float) -> types.ModuleType:
+    backend = FakeSearchBackend(failure_rate=failure_rate)
+
+    class VideosSearch:
+        """Blocking like the real client: the delay happens in ``result``"""
+
+        def __init__(self, query: str, limit: int = 20, language: str = "en", region: str = "US", **kwargs):
+            self.query = query
+            self.limit = limit
+
+        def result(self) -> Dict[str, Any]:
+            time.sleep(latency())
+            try:
+                results = backend.result(self.query, self.limit)
+            except RuntimeError:
+                stats.count("searches", failed=True)
+                raise
+            stats.count("searches")
+            return results
+
+    module = types.ModuleType("youtubesearchpython")
+    module.VideosSearch = VideosSearch
+    return module
+
+
+# Typical YouTube audio formats; muxed 18 is the last resort
+FAKE_FORMATS = [
+    ("249", "webm", "opus", "none", 50),
+    ("250", "webm", "opus", "none", 70),
+    ("140", "m4a", "mp4a.40.2", "none", 129),
+    ("251", "webm", "opus", "none", 160),
+    ("18", "mp4", "mp4a.40.2", "avc1.42001E", 96),
+]
+
+
+def make_ytdlp_module(standin_url: str, latency: Callable[[], float], failure_rate: float,
+                      build_cost: float = 0.0, url_ttl: float = 21600) -> types.ModuleType:
+    class DownloadError(Exception):
+        pass
+
+    class YoutubeDL:
+        def __init__(self, params: Optional[Dict[str, Any]] = None):
+            self.params = params or {}
+            if build_cost:
+                time.sleep(build_cost)
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc_info):
+            self.close()
+
+        def close(self):
+            pass
+
+        def extract_info(self, url: str, download: bool = False) -> Dict[str, Any]:
+            time.sleep(latency())
+            video_id = url.rsplit("v=", 1)[-1]
+            failed = random.random() < failure_rate
+            stats.count("extractions", failed)
+            if failed:
+                raise DownloadError(f"ERROR: [youtube] {video_id}: HTTP Error 403: Forbidden")
+            expire = int(time.time() + url_ttl)
+            formats: List[Dict[str, Any]] = [
+                {
+                    "format_id": format_id,
+                    "ext": ext,
+                    "acodec": acodec,
+                    "vcodec": vcodec,
+                    "abr": abr,
+                    "url": f"{standin_url}/videoplayback?id={video_id}&itag={format_id}&expire={expire}",
+                }
+                for format_id, ext, acodec, vcodec, abr in FAKE_FORMATS
+            ]
+            return {"id": video_id, "title": f"Fake Track {video_id}", "duration_string": "3:30", "formats": formats}
+
+    module = types.ModuleType("yt_dlp")
+    module.YoutubeDL = YoutubeDL
+    module.utils = types.ModuleType("yt_dlp.utils")
+    module.utils.DownloadError = DownloadError
+    module.version = types.ModuleType("yt_dlp.version")
+    module.version.__version__ = "fake"
+    return module
+
+
+def install(standin_url: str, search_latency: str = "const:0", search_failure_rate: float = 0.0,
+            extract_latency: str = "const:0", extract_failure_rate: float = 0.0, build_cost: float = 0.0):
+    """Register the fakes in ``sys.modules``; must run before the app is imported"""
+    ytdlp = make_ytdlp_module(standin_url, parse_distribution(extract_latency), extract_failure_rate, build_cost)
+    sys.modules["youtubesearchpython"] = make_search_module(parse_distribution(search_latency), search_failure_rate)
+    sys.modules["yt_dlp"] = ytdlp
+    sys.modules["yt_dlp.utils"] = ytdlp.utils
+    sys.modules["yt_dlp.version"] = ytdlp.version
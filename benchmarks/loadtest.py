@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+"""
+SpotifyClone benchmark - offline load test of main.py and python313.py
+
+Each app is started in its own process and scratch directory with fake
+youtubesearchpython and yt_dlp modules (see fakes.py), whose stream URLs
+point at a local googlevideo stand-in. A fixed number of concurrent
+clients then drive a weighted mix of /search, /play (plus a ranged fetch
+of the returned stream URL), /library, /upload and ranged /songs traffic.
+The stand-in (standins.py) runs in a third process.
+Throughput, p50/p95/p99 latency per operation and the server's RSS are
+printed and written to a JSON file, so runs on different commits can be
+compared with --compare.
+
+    python benchmarks/loadtest.py --app both --duration 30 --concurrency 32
+    python benchmarks/loadtest.py --app main --extract-latency lognormal:1.5,0.5 \\
+        --output after.json --compare before.json
+"""
+
+import argparse
+import asyncio
+import atexit
+import importlib
+import json
+import os
+import platform
+import random
+import shutil
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+APPS = ("main", "python313")
+OPERATIONS = ("search", "play", "library", "upload", "songs")
+DEFAULT_MIX = "search=25,play=40,library=15,upload=5,songs=15"
+QUERIES = [f"{genre} {kind}" for genre in ("rock", "jazz", "lofi", "pop", "metal", "indie", "house", "soul")
+           for kind in ("hits", "classics", "live", "mix", "covers", "playlist")]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_bytes(pid: int) -> Optional[int]:
+    """Resident set size of a process, from /proc or psutil when available"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss
+    except Exception:
+        return None
+
+
+def zipf_weights(n: int, exponent: float) -> List[float]:
+    """Cumulative popularity weights, so a few items take most requests"""
+    total, cumulative = 0.0, []
+    for rank in range(1, n + 1):
+        total += 1 / rank ** exponent
+        cumulative.append(total)
+    return cumulative
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, int(round(pct / 100 * len(values))) - 1))]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_per_s": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+    }
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation {name!r} in mix; use {', '.join(OPERATIONS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+# Server side: runs in the child process
+
+def serve(args: argparse.Namespace):
+    """Install the fakes, import the app and serve it (the child process)"""
+    import fakes
+    fakes.install(
+        args.standin_url,
+        search_latency=args.search_latency,
+        search_failure_rate=args.search_failure_rate,
+        extract_latency=args.extract_latency,
+        extract_failure_rate=args.extract_failure_rate,
+        build_cost=args.build_cost,
+    )
+
+    # Tell the parent how much upstream traffic the app generated
+    atexit.register(lambda: Path("fakes.json").write_text(json.dumps({
+        "searches": fakes.stats.searches,
+        "extractions": fakes.stats.extractions,
+        "failures": fakes.stats.failures,
+    })))
+
+    import uvicorn
+    module = importlib.import_module(args.app)
+    uvicorn.run(module.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+# Load side
+
+class LoadTest:
+    """Closed-loop clients issuing a weighted mix of operations"""
+
+    def __init__(self, client: Any, base_url: str, args: argparse.Namespace):
+        self.client = client
+        self.base_url = base_url
+        self.args = args
+        mix = parse_mix(args.mix)
+        self.operations: List[str] = list(mix)
+        self.weights = [mix[name] for name in self.operations]
+        self.video_ids = [f"v{i:010d}" for i in range(args.videos)]
+        self.video_weights = zipf_weights(args.videos, args.zipf)
+        self.query_weights = zipf_weights(len(QUERIES), args.zipf)
+        self.song_files: List[str] = []
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.recording = False
+
+    def record(self, name: str, latency: float, ok: bool):
+        if not self.recording:
+            return
+        self.latencies.setdefault(name, []).append(latency)
+        if not ok:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    async def timed(self, name: str, request: Callable[[], Any], check: Callable[[Any], bool]) -> Any:
+        start = time.perf_counter()
+        try:
+            response = await request()
+            ok = check(response)
+        except Exception:
+            response, ok = None, False
+        self.record(name, time.perf_counter() - start, ok)
+        return response
+
+    async def search(self):
+        query = random.choices(QUERIES, cum_weights=self.query_weights)[0]
+        await self.timed("search", lambda: self.client.get("/search", params={"q": query}),
+                         lambda r: r.status_code == 200)
+
+    async def play(self):
+        video_id = random.choices(self.video_ids, cum_weights=self.video_weights)[0]
+        response = await self.timed("play", lambda: self.client.get(f"/play/{video_id}"),
+                                    lambda r: r.status_code == 200 and "stream_url" in r.json())
+        if response is None or self.args.stream_bytes <= 0:
+            return
+        try:
+            stream_url = response.json().get("stream_url")
+        except ValueError:
+            return
+        if stream_url:
+            # What the player does next: fetch the start of the audio
+            headers = {"Range": f"bytes=0-{self.args.stream_bytes - 1}"}
+            stream_url = stream_url if stream_url.startswith("http") else self.base_url + stream_url
+            await self.timed("stream", lambda: self.client.get(stream_url, headers=headers),
+                             lambda r: r.status_code in (200, 206))
+
+    async def library(self):
+        await self.timed("library", lambda: self.client.get("/library"), lambda r: r.status_code == 200)
+
+    async def upload(self, record_as: str = "upload") -> Optional[str]:
+        body = os.urandom(self.args.upload_size)
+        response = await self.timed(
+            record_as,
+            lambda: self.client.post("/upload", files={"file": ("bench.mp3", body, "audio/mpeg")}),
+            lambda r: r.status_code == 200
+        )
+        if response is not None and response.status_code == 200:
+            return response.json()["filename"]
+        return None
+
+    async def songs(self):
+        if not self.song_files:
+            return
+        filename = random.choice(self.song_files)
+        start = random.randrange(0, max(1, self.args.upload_size - self.args.range_bytes))
+        headers = {"Range": f"bytes={start}-{start + self.args.range_bytes - 1}"}
+        await self.timed("songs", lambda: self.client.get(f"/songs/{filename}", headers=headers),
+                         lambda r: r.status_code in (200, 206))
+
+    async def prepare(self):
+        """Upload the files that ranged /songs requests read"""
+        for _ in range(self.args.songs):
+            filename = await self.upload(record_as="setup")
+            if filename:
+                self.song_files.append(filename)
+
+    async def worker(self, stop_at: float):
+        handlers = {name: getattr(self, name) for name in self.operations}
+        while time.perf_counter() < stop_at:
+            await handlers[random.choices(self.operations, weights=self.weights)[0]]()
+
+
+async def sample_rss(pid: int, samples: List[int], stop: asyncio.Event):
+    while not stop.is_set():
+        rss = rss_bytes(pid)
+        if rss is not None:
+            samples.append(rss)
+        try:
+            await asyncio.wait_for(stop.wait(), 0.25)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def drive(base_url: str, pid: int, args: argparse.Namespace) -> Dict[str, Any]:
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        deadline = time.monotonic() + args.startup_timeout
+        while True:
+            try:
+                if (await client.get("/health")).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError("Server did not become healthy in time")
+            await asyncio.sleep(0.1)
+        startup_rss = rss_bytes(pid)
+
+        test = LoadTest(client, base_url, args)
+        await test.prepare()
+
+        rss_samples: List[int] = []
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample_rss(pid, rss_samples, stop))
+
+        warmup_end = time.perf_counter() + args.warmup
+        stop_at = warmup_end + args.duration
+        workers = [asyncio.create_task(test.worker(stop_at)) for _ in range(args.concurrency)]
+        await asyncio.sleep(max(0.0, warmup_end - time.perf_counter()))
+        test.recording = True
+        started = time.perf_counter()
+        await asyncio.gather(*workers)
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await sampler
+
+        health = None
+        try:
+            health = (await client.get("/health")).json()
+        except (httpx.HTTPError, ValueError):
+            pass
+
+    all_latencies = [latency for name, values in test.latencies.items() for latency in values]
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "total": summarize(all_latencies, sum(test.errors.values()), elapsed),
+        "operations": {
+            name: summarize(values, test.errors.get(name, 0), elapsed)
+            for name, values in sorted(test.latencies.items())
+        },
+        "rss_mb": {
+            "startup": round(startup_rss / 2 ** 20, 1) if startup_rss else None,
+            "peak": round(max(rss_samples) / 2 ** 20, 1) if rss_samples else None,
+            "end": round(rss_samples[-1] / 2 ** 20, 1) if rss_samples else None,
+        },
+        "health": health,
+    }
+
+
+def run_app(app: str, standin_url: str, args: argparse.Namespace) -> Dict[str, Any]:
+    workdir = Path(tempfile.mkdtemp(prefix=f"loadtest-{app}-"))
+    (workdir / "static").mkdir()
+    port = free_port()
+    command = [
+        sys.executable, str(Path(__file__).resolve()), "serve",
+        "--app", app, "--port", str(port), "--standin-url", standin_url,
+        "--search-latency", args.search_latency, "--search-failure-rate", str(args.search_failure_rate),
+        "--extract-latency", args.extract_latency, "--extract-failure-rate", str(args.extract_failure_rate),
+        "--build-cost", str(args.build_cost),
+    ]
+    # Every simulated client shares one IP, so per-client rate limits would measure only themselves
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join([str(ROOT), str(ROOT / "benchmarks")]),
+           "RATE_LIMIT_ENABLED": "false"}
+    log_path = workdir / "server.log"
+    with open(log_path, "wb") as log:
+        server = subprocess.Popen(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            result = asyncio.run(drive(f"http://127.0.0.1:{port}", server.pid, args))
+        except Exception:
+            print(log_path.read_text(errors="replace")[-3000:], file=sys.stderr)
+            raise
+        finally:
+            server.send_signal(signal.SIGINT)
+            try:
+                server.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                server.kill()
+                server.wait()
+
+    fakes_path = workdir / "fakes.json"
+    result["upstream"] = json.loads(fakes_path.read_text()) if fakes_path.exists() else None
+    if args.keep:
+        result["workdir"] = str(workdir)
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None):
+    for app, result in results["apps"].items():
+        total = result["total"]
+        rss = result["rss_mb"]
+        print(f"\n{app}: {total['throughput_per_s']}/s over {result['elapsed_s']}s, "
+              f"{total['errors']} errors, RSS {rss['startup']} -> peak {rss['peak']} MB, "
+              f"upstream {result['upstream']}")
+        before = (baseline or {}).get("apps", {}).get(app, {}).get("operations", {})
+        for name, op in result["operations"].items():
+            line = (f"  {name:8s} {op['requests']:7d} req {op['throughput_per_s']:8.1f}/s  "
+                    f"p50 {op['p50_ms']:8.2f}  p95 {op['p95_ms']:8.2f}  p99 {op['p99_ms']:8.2f} ms  "
+                    f"errors {op['errors']}")
+            if name in before:
+                old = before[name]
+                line += "  | vs baseline p50 {:+.1f}% p99 {:+.1f}%".format(
+                    (op["p50_ms"] / old["p50_ms"] - 1) * 100 if old["p50_ms"] else 0.0,
+                    (op["p99_ms"] / old["p99_ms"] - 1) * 100 if old["p99_ms"] else 0.0,
+                )
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test with stubbed YouTube backends")
+    parser.add_argument("mode", nargs="?", default="run", choices=("run", "serve"),
+                        help="'serve' is used internally to start the app under test")
+    parser.add_argument("--app", default="both", help="main, python313 or both")
+    parser.add_argument("--duration", type=float, default=20.0, help="Measured seconds per app")
+    parser.add_argument("--warmup", type=float, default=3.0, help="Unmeasured seconds before that")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Operation weights")
+    parser.add_argument("--videos", type=int, default=200, help="Distinct video ids played")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Popularity skew of videos and queries")
+    parser.add_argument("--songs", type=int, default=5, help="Files uploaded up front for /songs")
+    parser.add_argument("--upload-size", type=int, default=512 * 1024)
+    parser.add_argument("--range-bytes", type=int, default=64 * 1024, help="Size of ranged /songs reads")
+    parser.add_argument("--stream-bytes", type=int, default=64 * 1024,
+                        help="Bytes fetched from each played stream URL (0 to skip)")
+    parser.add_argument("--search-latency", default="lognormal:0.4,0.4")
+    parser.add_argument("--search-failure-rate", type=float, default=0.01)
+    parser.add_argument("--extract-latency", default="lognormal:1.2,0.5")
+    parser.add_argument("--extract-failure-rate", type=float, default=0.02)
+    parser.add_argument("--build-cost", type=float, default=0.05, help="Fake YoutubeDL construction cost (s)")
+    parser.add_argument("--standin-latency", type=float, default=0.02, help="googlevideo stand-in delay (s)")
+    parser.add_argument("--standin-size", type=int, default=4 * 1024 * 1024)
+    parser.add_argument("--timeout", type=float, default=60.0, help="Client request timeout (s)")
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="loadtest-results.json")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directories (logs, cache)")
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--standin-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode == "serve":
+        serve(args)
+        return
+
+    parse_mix(args.mix)
+    apps = APPS if args.app == "both" else (args.app,)
+    random.seed(args.seed)
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": {key: value for key, value in vars(args).items() if key not in ("mode", "port", "standin_url")},
+        },
+        "apps": {},
+    }
+
+    # The stand-in gets its own process so it does not compete with the clients for the GIL
+    standin_port = free_port()
+    standin = subprocess.Popen(
+        [sys.executable, str(ROOT / "standins.py"), "--port", str(standin_port),
+         "--size", str(args.standin_size), "--latency", str(args.standin_latency)],
+        stdout=subprocess.DEVNULL
+    )
+    try:
+        for app in apps:
+            print(f"Load testing {app} ({args.concurrency} clients, {args.duration:.0f}s)...")
+            results["apps"][app] = run_app(app, f"http://127.0.0.1:{standin_port}", args)
+    finally:
+        standin.send_signal(signal.SIGINT)
+        standin.wait()
+
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    print_results(results, baseline)
+    Path(args.output).write_text(json.dumps(results, indent=2))
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
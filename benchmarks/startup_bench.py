@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+SpotifyClone benchmark - startup-to-first-byte and warm-up time
+
+Each run starts the app in a fresh process and scratch directory and
+times, from spawning the process:
+
+  first_byte  the first byte of a GET /library response (the server is
+              accepting requests)
+  warm        /health reporting the warm-up finished (yt-dlp and the
+              search client imported, YoutubeDL pool built)
+
+The real yt_dlp and youtubesearchpython are used when installed, since
+their import cost is what is measured. Results are written to a JSON
+file, so runs on different commits can be compared with --compare.
+
+    python benchmarks/startup_bench.py --app both --runs 5
+    python benchmarks/startup_bench.py --output after.json --compare before.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from loadtest import APPS, free_port, git_commit  # noqa: E402
+
+POLL_INTERVAL = 0.005
+
+
+def get(port: int, path: str, timeout: float) -> bytes:
+    """One HTTP/1.0 request over a raw socket; raises OSError until the server listens"""
+    with socket.create_connection(("127.0.0.1", port), timeout=timeout) as sock:
+        sock.sendall(f"GET {path} HTTP/1.0\r\nHost: 127.0.0.1\r\n\r\n".encode())
+        chunks = [sock.recv(1)]
+        if not chunks[0]:
+            raise ConnectionResetError("Closed before responding")
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                return b"".join(chunks)
+            chunks.append(chunk)
+
+
+def wait_for(deadline: float, probe) -> Optional[float]:
+    """perf_counter time at which ``probe()`` first succeeds, or None at the deadline"""
+    while time.perf_counter() < deadline:
+        try:
+            if probe():
+                return time.perf_counter()
+        except OSError:
+            pass
+        time.sleep(POLL_INTERVAL)
+    return None
+
+
+def is_warm(port: int) -> bool:
+    response = get(port, "/health", timeout=5)
+    warmup = json.loads(response.partition(b"\r\n\r\n")[2]).get("warmup")
+    # Builds that import everything eagerly report no warm-up: warm once they answer
+    return warmup is None or warmup.get("state") == "warm"
+
+
+def run_once(app: str, timeout: float, keep: bool) -> Dict[str, Any]:
+    workdir = Path(tempfile.mkdtemp(prefix=f"startup-{app}-"))
+    (workdir / "static").mkdir()
+    port = free_port()
+    command = [sys.executable, "-m", "uvicorn", f"{app}:app", "--host", "127.0.0.1",
+               "--port", str(port), "--log-level", "warning"]
+    env = {**os.environ, "PYTHONPATH": str(ROOT)}
+    log_path = workdir / "server.log"
+    with open(log_path, "wb") as log:
+        start = time.perf_counter()
+        server = subprocess.Popen(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            deadline = start + timeout
+            first_byte = wait_for(deadline, lambda: get(port, "/library", timeout=timeout))
+            warm = wait_for(deadline, lambda: is_warm(port)) if first_byte else None
+        finally:
+            server.send_signal(signal.SIGINT)
+            try:
+                server.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                server.kill()
+                server.wait()
+
+    if first_byte is None:
+        print(log_path.read_text(errors="replace")[-3000:], file=sys.stderr)
+        raise RuntimeError(f"{app} did not answer within {timeout:.0f}s")
+    if not keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "first_byte_s": round(first_byte - start, 3),
+        "warm_s": round(warm - start, 3) if warm else None,
+    }
+
+
+def summarize(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    summary: Dict[str, Any] = {"runs": runs}
+    for key in ("first_byte_s", "warm_s"):
+        values = sorted(run[key] for run in runs if run[key] is not None)
+        summary[key] = {
+            "median": round(statistics.median(values), 3) if values else None,
+            "min": values[0] if values else None,
+            "max": values[-1] if values else None,
+        }
+    return summary
+
+
+def installed(name: str) -> Optional[str]:
+    try:
+        return subprocess.run(
+            [sys.executable, "-c", f"import importlib.metadata as m; print(m.version({name!r}))"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except subprocess.CalledProcessError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure startup-to-first-byte and warm-up time")
+    parser.add_argument("--app", default="both", help="main, python313 or both")
+    parser.add_argument("--runs", type=int, default=5, help="Cold starts per app")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-run limit (s)")
+    parser.add_argument("--output", default="startup-results.json")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directories (logs)")
+    args = parser.parse_args()
+
+    apps = APPS if args.app == "both" else (args.app,)
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "yt-dlp": installed("yt-dlp"),
+            "youtube-search-python": installed("youtube-search-python"),
+            "args": vars(args),
+        },
+        "apps": {},
+    }
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+
+    for app in apps:
+        print(f"Starting {app} {args.runs} times...")
+        runs = [run_once(app, args.timeout, args.keep) for _ in range(args.runs)]
+        result = results["apps"][app] = summarize(runs)
+        before = (baseline or {}).get("apps", {}).get(app, {})
+        for key in ("first_byte_s", "warm_s"):
+            median = result[key]["median"]
+            line = f"  {key:13s} median {median}s  (min {result[key]['min']}, max {result[key]['max']})"
+            old = (before.get(key) or {}).get("median")
+            if median is not None and old:
+                line += f"  | vs baseline {(median / old - 1) * 100:+.1f}%"
+            print(line)
+
+    Path(args.output).write_text(json.dumps(results, indent=2))
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
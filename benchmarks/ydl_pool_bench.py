@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+SpotifyClone benchmark - YoutubeDL construction per call vs. the instance pool
+
+The extractor is stubbed: extract_info returns canned formats after an
+optional simulated network delay, so only the YoutubeDL overhead differs
+between the two runs. With yt-dlp installed the real class is constructed
+(registry loading included); without it a stand-in with a fixed build
+cost is used.
+
+    python benchmarks/ydl_pool_bench.py --calls 200 --threads 4
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ydl_pool import YoutubeDLPool  # noqa: E402
+
+OPTIONS = {"format": "bestaudio/best", "quiet": True, "no_warnings": True, "noplaylist": True}
+
+FAKE_INFO = {
+    "title": "Benchmark Track",
+    "duration_string": "3:30",
+    "formats": [
+        {"format_id": "140", "ext": "m4a", "acodec": "mp4a.40.2", "vcodec": "none",
+         "url": "https://example.invalid/videoplayback?itag=140&expire=0"},
+        {"format_id": "251", "ext": "webm", "acodec": "opus", "vcodec": "none",
+         "url": "https://example.invalid/videoplayback?itag=251&expire=0"},
+    ],
+}
+
+
+def make_stub_class(network_delay: float, build_cost: float):
+    try:
+        import yt_dlp
+        base = yt_dlp.YoutubeDL
+        source = f"yt_dlp {yt_dlp.version.__version__}"
+    except ImportError:
+        class base:  # noqa: N801 - stands in for yt_dlp.YoutubeDL
+            def __init__(self, params):
+                self.params = params
+                time.sleep(build_cost)
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc_info):
+                self.close()
+
+            def close(self):
+                pass
+
+        source = f"stand-in ({build_cost * 1000:.0f}ms build cost)"
+
+    class StubYoutubeDL(base):
+        def extract_info(self, url, download=False):
+            if network_delay:
+                time.sleep(network_delay)
+            return FAKE_INFO
+
+    return StubYoutubeDL, source
+
+
+def run(extract, calls: int, threads: int):
+    latencies = []
+
+    def timed(i):
+        start = time.perf_counter()
+        extract(f"https://www.youtube.com/watch?v=bench{i:05d}")
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(timed, range(calls)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "calls": calls,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_s": round(calls / elapsed, 1),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the YoutubeDL pool against per-call construction")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--max-uses", type=int, default=100)
+    parser.add_argument("--network-delay", type=float, default=0.0, help="Simulated extract_info latency (s)")
+    parser.add_argument("--build-cost", type=float, default=0.05,
+                        help="Construction cost of the stand-in when yt-dlp is not installed (s)")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    stub, source = make_stub_class(args.network_delay, args.build_cost)
+
+    def per_call(url):
+        with stub(dict(OPTIONS)) as ydl:
+            return ydl.extract_info(url, download=False)
+
+    pool = YoutubeDLPool(lambda: stub(dict(OPTIONS)), size=args.threads, max_uses=args.max_uses)
+    warm_start = time.perf_counter()
+    pool.warm()
+    warm_s = time.perf_counter() - warm_start
+
+    def pooled(url):
+        with pool.checkout() as ydl:
+            return ydl.extract_info(url, download=False)
+
+    results = {
+        "extractor": source,
+        "threads": args.threads,
+        "per_call": run(per_call, args.calls, args.threads),
+        "pooled": run(pooled, args.calls, args.threads),
+        "pool_warm_s": round(warm_s, 3),
+        "pool": pool.stats(),
+    }
+    pool.close()
+
+    print(f"Extractor: {source}, {args.calls} calls on {args.threads} threads")
+    for name in ("per_call", "pooled"):
+        r = results[name]
+        print(f"  {name:9s} mean {r['mean_ms']:8.2f}ms  p50 {r['p50_ms']:8.2f}ms  "
+              f"p95 {r['p95_ms']:8.2f}ms  {r['throughput_per_s']:8.1f}/s")
+    print(f"  pool warm-up {results['pool_warm_s']}s, {results['pool']}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+SpotifyClone content-addressed upload storage with reference counting
+"""
+
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS refs (
+    filename TEXT PRIMARY KEY,
+    digest   TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS refs_digest ON refs (digest);
+"""
+
+
+class BlobStore:
+    """Stores each distinct upload once, keyed by its SHA-256.
+
+    Blobs live under ``root`` (``<root>/<aa>/<sha256>``). Every user-visible
+    file in ``files_dir`` is a hard link to its blob, so serving and listing
+    uploads work on plain paths. The filename -> digest references are kept
+    in SQLite (``<root>/refs.db``); each upload or delete updates them and
+    the files in one transaction, and a blob is deleted when its last name
+    goes.
+    """
+
+    def __init__(self, files_dir: Path, root: Optional[Path] = None):
+        self.files_dir = Path(files_dir)
+        self.root = Path(root) if root else self.files_dir / ".blobs"
+        self.db_path = self.root / "refs.db"
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.deduplicated = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.root.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """A write transaction, serialised with every other process using the store"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def blob_path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest
+
+    def digest_of(self, filename: str) -> Optional[str]:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT digest FROM refs WHERE filename = ?", (filename,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def load(self, cleanup: bool = True, older_than: Optional[float] = None):
+        """Open the reference store and, with ``cleanup``, drop references
+        whose files are gone and blobs nothing refers to.
+
+        With several worker processes only one should clean up.
+        ``older_than`` (a timestamp) spares blobs written since, which may
+        belong to an upload another process is still publishing.
+        """
+        missing, orphans = [], 0
+        with self._transaction() as conn:
+            if cleanup:
+                refs = conn.execute("SELECT filename, digest FROM refs").fetchall()
+                missing = [(name,) for name, _ in refs if not (self.files_dir / name).exists()]
+                conn.executemany("DELETE FROM refs WHERE filename = ?", missing)
+                gone = {name for name, in missing}
+                digests = {digest for name, digest in refs if name not in gone}
+
+                # Blobs nobody points to any more (e.g. a crash while publishing an upload)
+                for blob in self.root.glob("??/*"):
+                    if blob.name in digests:
+                        continue
+                    if older_than is not None and blob.stat().st_mtime >= older_than:
+                        continue
+                    blob.unlink()
+                    orphans += 1
+
+        if missing or orphans:
+            logger.info(f"Blob store cleanup: {len(missing)} missing files, {orphans} orphaned blobs")
+        stats = self.stats()
+        logger.info(f"Blob store: {stats['blobs']} blobs, {stats['files']} files")
+
+    def _materialize(self, digest: str, filename: str):
+        target = self.files_dir / filename
+        try:
+            os.link(self.blob_path(digest), target)
+        except OSError:
+            # Filesystems without hard links get a private copy instead
+            shutil.copyfile(self.blob_path(digest), target)
+
+    def link(self, digest: str, filename: str, temp_path: Path):
+        """Publish a received upload under a user-visible filename.
+
+        ``temp_path`` holds the upload's bytes. It becomes the blob for
+        ``digest`` unless that is stored already, in which case it is
+        dropped. Both happen in the same transaction as the new reference,
+        so a concurrent delete of the last reference cannot remove the blob
+        in between.
+        """
+        with self._transaction() as conn:
+            path = self.blob_path(digest)
+            if path.exists():
+                temp_path.unlink()
+                if conn.execute("SELECT 1 FROM refs WHERE digest = ? LIMIT 1", (digest,)).fetchone():
+                    self.deduplicated += 1
+            else:
+                path.parent.mkdir(exist_ok=True)
+                os.replace(temp_path, path)
+            self._materialize(digest, filename)
+            conn.execute("INSERT OR REPLACE INTO refs (filename, digest) VALUES (?, ?)", (filename, digest))
+
+    def unlink(self, filename: str) -> bool:
+        """Remove a visible file; the blob goes with its last reference.
+
+        Returns False for files the store does not know about.
+        """
+        with self._transaction() as conn:
+            row = conn.execute("SELECT digest FROM refs WHERE filename = ?", (filename,)).fetchone()
+            if row is None:
+                return False
+            digest = row[0]
+            conn.execute("DELETE FROM refs WHERE filename = ?", (filename,))
+            (self.files_dir / filename).unlink(missing_ok=True)
+            if not conn.execute("SELECT 1 FROM refs WHERE digest = ? LIMIT 1", (digest,)).fetchone():
+                self.blob_path(digest).unlink(missing_ok=True)
+                logger.info(f"Removed last reference to blob {digest[:12]}")
+            return True
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            files, blobs = self._connect().execute(
+                "SELECT COUNT(*), COUNT(DISTINCT digest) FROM refs"
+            ).fetchone()
+        return {
+            "blobs": blobs,
+            "files": files,
+            "deduplicated_uploads": self.deduplicated,
+        }
@@ -0,0 +1,259 @@
+"""
+SpotifyClone in-memory caches
+"""
+
+import asyncio
+import heapq
+import logging
+import sys
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger(__name__)
+
+
+def expiry_from_url(url: str) -> Optional[float]:
+    """Read the ``expire=`` unix timestamp embedded in a googlevideo URL"""
+    parsed = urlparse(url)
+    values = parse_qs(parsed.query).get("expire")
+    if not values:
+        # Manifest URLs carry it as a path segment: .../expire/1700000000/...
+        parts = parsed.path.split("/")
+        if "expire" in parts and parts.index("expire") + 1 < len(parts):
+            values = [parts[parts.index("expire") + 1]]
+    try:
+        return float(values[0]) if values else None
+    except ValueError:
+        return None
+
+
+def normalize_query(query: str) -> str:
+    """Cache key for a search query: NFKC-normalized, case-folded, single-spaced"""
+    return " ".join(unicodedata.normalize("NFKC", query).casefold().split())
+
+
+def estimate_size(value: Any) -> int:
+    """Rough memory footprint of a cached value in bytes"""
+    if hasattr(value, "dict"):
+        value = value.dict()
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            estimate_size(k) + estimate_size(v) for k, v in value.items()
+        )
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class _Entry:
+    __slots__ = ("value", "expires_at", "size")
+
+    def __init__(self, value: Any, expires_at: float, size: int):
+        self.value = value
+        self.expires_at = expires_at
+        self.size = size
+
+
+class StreamCache:
+    """Bounded LRU cache whose entries expire at their own deadline.
+
+    Entries are evicted least-recently-used first once either ``max_entries``
+    or ``max_bytes`` is exceeded. Expiry deadlines live in a min-heap, so
+    dropping expired entries only touches the entries that actually expired.
+    """
+
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 16 * 1024 * 1024,
+                 default_ttl: float = 3600, safety_margin: float = 300):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.safety_margin = safety_margin
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._expiry_heap: List[Tuple[float, str]] = []
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def ttl_for_url(self, url: str, now: Optional[float] = None) -> float:
+        """Seconds a URL can be served, taken from its ``expire=`` parameter"""
+        now = now if now is not None else time.time()
+        expires = expiry_from_url(url)
+        if expires is None:
+            return self.default_ttl
+        return max(0.0, expires - self.safety_margin - now)
+
+    def get(self, key: str, count: bool = True) -> Optional[Any]:
+        """Return a live value and mark it recently used"""
+        with self._lock:
+            self._expire(time.time())
+            entry = self._entries.get(key)
+            if entry is None:
+                if count:
+                    self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if count:
+                self.hits += 1
+            return entry.value
+
+    def expires_at(self, key: str) -> Optional[float]:
+        entry = self._entries.get(key)
+        return entry.expires_at if entry else None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None, size: Optional[int] = None):
+        """Store a value for ``ttl`` seconds (``default_ttl`` if omitted)"""
+        now = time.time()
+        ttl = self.default_ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        size = size if size is not None else estimate_size(value)
+        expires_at = now + ttl
+
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = _Entry(value, expires_at, size)
+            self._bytes += size
+            heapq.heappush(self._expiry_heap, (expires_at, key))
+
+            self._expire(now)
+            while self._entries and (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                oldest, _ = next(iter(self._entries.items()))
+                self._remove(oldest)
+                self.evictions += 1
+
+            # Replaced and evicted keys leave stale heap records behind
+            if len(self._expiry_heap) > 2 * len(self._entries) + 64:
+                self._expiry_heap = [(e.expires_at, k) for k, e in self._entries.items()]
+                heapq.heapify(self._expiry_heap)
+
+    def pop(self, key: str) -> Optional[Any]:
+        """Drop a key, e.g. when its URL turned out to be dead"""
+        with self._lock:
+            entry = self._remove(key)
+            return entry.value if entry else None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._expiry_heap.clear()
+            self._bytes = 0
+
+    def _remove(self, key: str) -> Optional[_Entry]:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+        return entry
+
+    def _expire(self, now: float):
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            expires_at, key = heapq.heappop(heap)
+            entry = self._entries.get(key)
+            # Skip heap records left behind by replaced or evicted entries
+            if entry is not None and entry.expires_at == expires_at:
+                self._remove(key)
+                self.expirations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class SearchCache:
+    """LRU cache of search responses with stale-while-revalidate.
+
+    An entry is fresh for ``ttl`` seconds. After that it is still served for
+    up to ``stale_ttl`` more seconds while a single background task reloads
+    it; older entries are treated as misses.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 600, stale_ttl: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.refresh_failures = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def set(self, key: str, value: Any):
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value for ``key``, loading it on a miss"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, stored_at = entry
+            age = time.monotonic() - stored_at
+            if age < self.ttl:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return value
+            if age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                self._entries.move_to_end(key)
+                if key not in self._refreshing:
+                    task = asyncio.ensure_future(self._refresh(key, loader))
+                    self._refreshing[key] = task
+                return value
+            del self._entries[key]
+
+        self.misses += 1
+        value = await loader()
+        self.set(key, value)
+        return value
+
+    async def _refresh(self, key: str, loader: Callable[[], Awaitable[Any]]):
+        try:
+            self.set(key, await loader())
+        except Exception as e:
+            # Keep serving the stale value; the next stale hit retries
+            self.refresh_failures += 1
+            logger.warning(f"Background refresh failed for {key!r}: {e}")
+        finally:
+            self._refreshing.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "refreshing": len(self._refreshing),
+            "refresh_failures": self.refresh_failures,
+        }
@@ -0,0 +1,174 @@
+"""
+SpotifyClone extraction executor - runs blocking yt-dlp work off the event loop
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ExtractionQueueFull(Exception):
+    """Raised when the extraction queue has no free slots"""
+
+
+class ExtractionTimeout(Exception):
+    """Raised when an extraction job exceeds its deadline"""
+
+
+class ExtractionPool:
+    """Bounded thread pool for blocking extraction jobs.
+
+    At most ``max_workers`` jobs run at once and at most ``max_queue`` more
+    may wait for a worker. Jobs that are still queued when their caller
+    times out or is cancelled are skipped instead of being run.
+    ``on_wait`` is called on the worker thread with each job's queue wait.
+    """
+
+    def __init__(self, max_workers: int = 4, max_queue: int = 32, timeout: float = 30.0,
+                 on_wait: Optional[Callable[[float], None]] = None):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.on_wait = on_wait
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="extract"
+        )
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._started = 0
+        self._completed = 0
+        self._failed = 0
+        self._timed_out = 0
+        self._rejected = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _run_job(self, func: Callable[..., Any], args: tuple, submitted_at: float) -> Any:
+        """Run a job on a worker thread, recording how long it waited"""
+        wait = time.monotonic() - submitted_at
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            self._started += 1
+            self._total_wait += wait
+            self._max_wait = max(self._max_wait, wait)
+        if self.on_wait is not None:
+            self.on_wait(wait)
+
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def _release_if_unstarted(self, future: Future):
+        """Free the queue slot of a job that was cancelled before it ran"""
+        if future.cancel() or future.cancelled():
+            with self._lock:
+                self._queued -= 1
+
+    async def run(self, func: Callable[..., Any], *args: Any, timeout: Optional[float] = None) -> Any:
+        """Run ``func(*args)`` on the pool and await its result"""
+        with self._lock:
+            if self._queued + self._running >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise ExtractionQueueFull(
+                    f"Extraction queue full ({self._queued} waiting, {self._running} running)"
+                )
+            self._queued += 1
+
+        future = self._executor.submit(self._run_job, func, args, time.monotonic())
+
+        try:
+            result = await asyncio.wait_for(
+                asyncio.wrap_future(future),
+                timeout=timeout if timeout is not None else self.timeout
+            )
+        except asyncio.TimeoutError:
+            self._release_if_unstarted(future)
+            with self._lock:
+                self._timed_out += 1
+            raise ExtractionTimeout(f"Extraction timed out after {timeout or self.timeout}s")
+        except asyncio.CancelledError:
+            # The caller went away; the job is dropped if it has not started yet
+            self._release_if_unstarted(future)
+            raise
+        except Exception:
+            with self._lock:
+                self._failed += 1
+            raise
+
+        with self._lock:
+            self._completed += 1
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of queue depth and wait time"""
+        with self._lock:
+            started = self._started
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queued": self._queued,
+                "running": self._running,
+                "completed": self._completed,
+                "failed": self._failed,
+                "timed_out": self._timed_out,
+                "rejected": self._rejected,
+                "avg_wait_ms": round(self._total_wait / started * 1000, 2) if started else 0.0,
+                "max_wait_ms": round(self._max_wait * 1000, 2),
+            }
+
+    def shutdown(self):
+        """Stop accepting work and cancel jobs that have not started"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one in-flight task.
+
+    The first caller for a key starts the work; callers arriving while it
+    runs await the same task and receive its result or exception. A caller
+    being cancelled does not cancel the shared task.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Await ``func()`` for ``key``, joining a call already in flight"""
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            task.add_done_callback(lambda t: self._finish(key, t))
+            self._calls[key] = task
+            self.started += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception as retrieved in case every waiter went away
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._calls),
+            "started": self.started,
+            "coalesced": self.coalesced,
+        }
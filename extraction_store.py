@@ -0,0 +1,260 @@
+"""
+SpotifyClone persistent extraction store - SQLite (WAL) cache of yt-dlp results
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS extractions (
+    video_id   TEXT PRIMARY KEY,
+    payload    TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS extractions_expires_at ON extractions (expires_at);
+CREATE TABLE IF NOT EXISTS leases (
+    video_id   TEXT PRIMARY KEY,
+    owner      TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+class ExtractionStore:
+    """Extraction results persisted under CACHE_DIR so restarts start warm.
+
+    All SQLite work happens on one dedicated thread, which owns the
+    connection. Reads go straight to the database; writes are buffered and
+    flushed in batches shortly after they are queued (write-behind), and
+    queued writes are visible to reads before they reach disk.
+
+    Several processes can share one store. ``lease`` and ``release`` use a
+    lease table in it so that only one process extracts a given video at a
+    time while the others wait for its result.
+    """
+
+    def __init__(self, path: Path, flush_delay: float = 0.5):
+        self.path = Path(path)
+        self.flush_delay = flush_delay
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="extraction-store")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pending: Dict[str, Tuple[str, float]] = {}
+        self._flushing: Dict[str, Tuple[str, float]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self.reads = 0
+        self.read_hits = 0
+        self.writes = 0
+        self.compactions = 0
+        self.leases_acquired = 0
+        self.lease_waits_served = 0
+        self.lease_timeouts = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+            # Must precede table creation to take effect on a new database
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    async def _call(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _read(self, video_id: str, now: float) -> Optional[str]:
+        row = self._connect().execute(
+            "SELECT payload FROM extractions WHERE video_id = ? AND expires_at > ?",
+            (video_id, now)
+        ).fetchone()
+        return row[0] if row else None
+
+    async def get(self, video_id: str) -> Optional[Dict[str, Any]]:
+        """Return a stored payload that has not expired yet"""
+        now = time.time()
+        self.reads += 1
+        pending = self._pending.get(video_id) or self._flushing.get(video_id)
+        if pending is not None:
+            payload, expires_at = pending
+            raw = payload if expires_at > now else None
+        else:
+            try:
+                raw = await self._call(self._read, video_id, now)
+            except sqlite3.Error as e:
+                logger.warning(f"Extraction store read failed for {video_id}: {e}")
+                return None
+        if raw is None:
+            return None
+        self.read_hits += 1
+        return json.loads(raw)
+
+    def put(self, video_id: str, payload: Dict[str, Any], expires_at: float):
+        """Queue a payload for writing; returns immediately"""
+        self._pending[video_id] = (json.dumps(payload), expires_at)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._flush_later())
+
+    def _delete(self, video_id: str):
+        self._connect().execute("DELETE FROM extractions WHERE video_id = ?", (video_id,))
+
+    async def delete(self, video_id: str):
+        """Forget a payload, e.g. when its URL turned out to be dead"""
+        self._pending.pop(video_id, None)
+        self._flushing.pop(video_id, None)
+        try:
+            # Queued behind any running flush on the store's single thread
+            await self._call(self._delete, video_id)
+        except sqlite3.Error as e:
+            logger.warning(f"Extraction store delete failed for {video_id}: {e}")
+
+    def _write(self, rows: List[Tuple[str, str, float, float]]):
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT OR REPLACE INTO extractions (video_id, payload, expires_at, updated_at) "
+                "VALUES (?, ?, ?, ?)",
+                rows
+            )
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_delay)
+        await self.flush()
+
+    async def flush(self):
+        """Write every queued payload in one transaction"""
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        self._flushing.update(batch)
+        now = time.time()
+        rows = [(video_id, payload, expires_at, now) for video_id, (payload, expires_at) in batch.items()]
+        try:
+            await self._call(self._write, rows)
+            self.writes += len(rows)
+        except sqlite3.Error as e:
+            logger.error(f"Extraction store write failed: {e}")
+        finally:
+            for video_id in batch:
+                self._flushing.pop(video_id, None)
+
+    def _acquire(self, video_id: str, owner: str, expires_at: float, now: float) -> bool:
+        # One statement, so it is atomic across processes without a transaction
+        cursor = self._connect().execute(
+            "INSERT INTO leases (video_id, owner, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (video_id) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+            "WHERE leases.expires_at <= ? OR leases.owner = excluded.owner",
+            (video_id, owner, expires_at, now)
+        )
+        return cursor.rowcount == 1
+
+    async def lease(self, video_id: str, owner: str, ttl: float, wait_timeout: float,
+                    poll_interval: float = 0.1) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """Claim the extraction of ``video_id`` or wait for whoever holds it.
+
+        Returns ``(None, True)`` once the lease is ours, ``(payload, False)``
+        when the holder stored a result while we waited, and ``(None, False)``
+        if neither happened within ``wait_timeout`` or the store failed; the
+        caller then extracts without a lease. A holder that dies loses the
+        lease after ``ttl`` seconds.
+        """
+        deadline = time.monotonic() + wait_timeout
+        try:
+            while True:
+                now = time.time()
+                if await self._call(self._acquire, video_id, owner, now + ttl, now):
+                    self.leases_acquired += 1
+                    return None, True
+                await asyncio.sleep(poll_interval)
+                payload = await self.get(video_id)
+                if payload is not None:
+                    self.lease_waits_served += 1
+                    return payload, False
+                if time.monotonic() >= deadline:
+                    self.lease_timeouts += 1
+                    logger.warning(f"Gave up waiting for another worker to extract {video_id}")
+                    return None, False
+        except sqlite3.Error as e:
+            logger.warning(f"Extraction lease failed for {video_id}: {e}")
+            return None, False
+
+    def _release(self, video_id: str, owner: str):
+        self._connect().execute("DELETE FROM leases WHERE video_id = ? AND owner = ?", (video_id, owner))
+
+    async def release(self, video_id: str, owner: str):
+        """Give up a lease once its result (if any) is on disk"""
+        await self.flush()
+        try:
+            # Runs after every write already queued on the store's single thread
+            await self._call(self._release, video_id, owner)
+        except sqlite3.Error as e:
+            logger.warning(f"Extraction lease release failed for {video_id}: {e}")
+
+    def _compact(self, now: float) -> int:
+        conn = self._connect()
+        conn.execute("DELETE FROM leases WHERE expires_at <= ?", (now,))
+        deleted = conn.execute("DELETE FROM extractions WHERE expires_at <= ?", (now,)).rowcount
+        if deleted:
+            conn.execute("PRAGMA incremental_vacuum")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return deleted
+
+    async def compact(self) -> int:
+        """Drop expired rows and fold the WAL back into the database file"""
+        deleted = await self._call(self._compact, time.time())
+        self.compactions += 1
+        if deleted:
+            logger.info(f"Extraction store compacted, removed {deleted} expired entries")
+        return deleted
+
+    async def run_compaction(self, interval: float):
+        """Background loop compacting the store every ``interval`` seconds"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.compact()
+            except sqlite3.Error as e:
+                logger.warning(f"Extraction store compaction failed: {e}")
+
+    def _count(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM extractions").fetchone()[0]
+
+    async def count(self) -> int:
+        return await self._call(self._count)
+
+    async def close(self):
+        await self.flush()
+
+        def _close():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+        await self._call(_close)
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": str(self.path),
+            "reads": self.reads,
+            "read_hits": self.read_hits,
+            "writes": self.writes,
+            "pending_writes": len(self._pending),
+            "compactions": self.compactions,
+            "leases_acquired": self.leases_acquired,
+            "lease_waits_served": self.lease_waits_served,
+            "lease_timeouts": self.lease_timeouts,
+        }
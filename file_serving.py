@@ -0,0 +1,243 @@
+"""
+SpotifyClone file serving - HTTP Range/206, validators and zero-copy sends
+"""
+
+import os
+import stat as stat_module
+import uuid
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, List, Mapping, Optional, Tuple
+
+import aiofiles
+from starlette.responses import Response
+
+AUDIO_MEDIA_TYPES = {
+    ".mp3": "audio/mpeg",
+    ".wav": "audio/wav",
+    ".m4a": "audio/mp4",
+    ".flac": "audio/flac",
+    ".ogg": "audio/ogg",
+    ".webm": "audio/webm",
+    ".opus": "audio/ogg",
+}
+
+CHUNK_SIZE = 64 * 1024
+# More ranges than this in one request are answered with the whole file
+MAX_RANGES = 16
+
+
+def media_type_for(path: Path) -> str:
+    return AUDIO_MEDIA_TYPES.get(Path(path).suffix.lower(), "application/octet-stream")
+
+
+def make_etag(stat: os.stat_result) -> str:
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Whether an ``If-None-Match`` header names ``etag`` (weak comparison: W/"x" matches "x")"""
+    tags = [tag.strip()[2:] if tag.strip().startswith("W/") else tag.strip()
+            for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+def parse_range(header: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """Parse a ``Range`` header into inclusive ``(start, end)`` pairs.
+
+    Returns None when the header should be ignored (bad syntax or too many
+    ranges) and an empty list when no range can be satisfied.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+
+    ranges = []
+    for part in spec.split(","):
+        start_text, dash, end_text = part.strip().partition("-")
+        if not dash:
+            return None
+        try:
+            if start_text:
+                start = int(start_text)
+                end = int(end_text) if end_text else size - 1
+                if end_text and end < start:
+                    return None
+            else:
+                # Suffix range: the last N bytes
+                length = int(end_text)
+                if length == 0:
+                    continue
+                start, end = max(size - length, 0), size - 1
+        except ValueError:
+            return None
+        if start < size:
+            ranges.append((start, min(end, size - 1)))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+
+    # Merge overlapping or adjacent ranges
+    ranges.sort()
+    merged: List[Tuple[int, int]] = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class RangeFileResponse(Response):
+    """File response honouring Range, If-Range and conditional GET headers.
+
+    Single ranges get a 206 with ``Content-Range``; several get a
+    ``multipart/byteranges`` body. When the server offers the ASGI
+    ``http.response.zerocopysend`` extension the bytes are handed to it
+    (sendfile); otherwise the file is streamed in chunks.
+    """
+
+    def __init__(self, path: Path, request_headers: Mapping[str, str], method: str = "GET",
+                 headers: Optional[Dict[str, str]] = None, media_type: Optional[str] = None):
+        self.path = Path(path)
+        self.request_headers = request_headers
+        self.method = method
+        self.extra_headers = headers or {}
+        self.media_type = media_type or media_type_for(self.path)
+        self.background = None
+
+    def _not_modified(self, etag: str, mtime: float) -> bool:
+        if_none_match = self.request_headers.get("if-none-match")
+        if if_none_match is not None:
+            return etag_matches(if_none_match, etag)
+        if_modified_since = self.request_headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def _range_allowed(self, etag: str, last_modified: str) -> bool:
+        """If-Range: only honour Range while the client's copy is current"""
+        if_range = self.request_headers.get("if-range")
+        if if_range is None:
+            return True
+        if_range = if_range.strip()
+        if if_range.startswith('"'):
+            return if_range == etag
+        return if_range == last_modified
+
+    async def __call__(self, scope, receive, send):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            await Response("File not found", status_code=404)(scope, receive, send)
+            return
+        if not stat_module.S_ISREG(stat.st_mode):
+            await Response("File not found", status_code=404)(scope, receive, send)
+            return
+
+        size = stat.st_size
+        etag = make_etag(stat)
+        last_modified = formatdate(stat.st_mtime, usegmt=True)
+        headers = {
+            "accept-ranges": "bytes",
+            "etag": etag,
+            "last-modified": last_modified,
+            **{key.lower(): value for key, value in self.extra_headers.items()},
+        }
+
+        if self._not_modified(etag, stat.st_mtime):
+            await self._start(send, 304, headers)
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        ranges = None
+        range_header = self.request_headers.get("range")
+        if range_header and self._range_allowed(etag, last_modified):
+            ranges = parse_range(range_header, size)
+
+        if ranges == []:
+            headers["content-range"] = f"bytes */{size}"
+            headers["content-length"] = "0"
+            await self._start(send, 416, headers)
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        send_body = self.method != "HEAD"
+        if not ranges:
+            headers["content-type"] = self.media_type
+            headers["content-length"] = str(size)
+            await self._start(send, 200, headers)
+            await self._send_parts(scope, send, [(b"", 0, size)], send_body)
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            headers["content-type"] = self.media_type
+            headers["content-range"] = f"bytes {start}-{end}/{size}"
+            headers["content-length"] = str(end - start + 1)
+            await self._start(send, 206, headers)
+            await self._send_parts(scope, send, [(b"", start, end - start + 1)], send_body)
+        else:
+            boundary = uuid.uuid4().hex
+            parts = []
+            for start, end in ranges:
+                preamble = (
+                    f"--{boundary}\r\n"
+                    f"Content-Type: {self.media_type}\r\n"
+                    f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+                ).encode()
+                parts.append((preamble, start, end - start + 1))
+            epilogue = f"\r\n--{boundary}--\r\n".encode()
+            # Every part after the first is preceded by the CRLF ending the previous one
+            parts = [(b"\r\n" + pre if i else pre, start, length) for i, (pre, start, length) in enumerate(parts)]
+            total = sum(len(pre) + length for pre, _, length in parts) + len(epilogue)
+            headers["content-type"] = f"multipart/byteranges; boundary={boundary}"
+            headers["content-length"] = str(total)
+            await self._start(send, 206, headers)
+            await self._send_parts(scope, send, parts, send_body, epilogue)
+
+    async def _start(self, send, status: int, headers: Dict[str, str]):
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(key.encode("latin-1"), value.encode("latin-1")) for key, value in headers.items()],
+        })
+
+    async def _send_parts(self, scope, send, parts: List[Tuple[bytes, int, int]],
+                          send_body: bool, epilogue: bytes = b""):
+        if not send_body:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as f:
+                for index, (preamble, offset, length) in enumerate(parts):
+                    if preamble:
+                        await send({"type": "http.response.body", "body": preamble, "more_body": True})
+                    # The server sendfile()s straight from the page cache
+                    await send({
+                        "type": "http.response.zerocopysend",
+                        "file": f,
+                        "offset": offset,
+                        "count": length,
+                        "more_body": index < len(parts) - 1 or bool(epilogue),
+                    })
+        else:
+            async with aiofiles.open(self.path, "rb") as f:
+                for preamble, offset, length in parts:
+                    if preamble:
+                        await send({"type": "http.response.body", "body": preamble, "more_body": True})
+                    await f.seek(offset)
+                    remaining = length
+                    while remaining > 0:
+                        chunk = await f.read(min(CHUNK_SIZE, remaining))
+                        if not chunk:
+                            break
+                        remaining -= len(chunk)
+                        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": epilogue, "more_body": False})
+            return
+
+        if epilogue:
+            await send({"type": "http.response.body", "body": epilogue})
@@ -0,0 +1,169 @@
+"""
+SpotifyClone format ladder - ranked audio variants of one extraction and client-hint selection
+"""
+
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+QUALITIES = ("high", "medium", "low")
+DEFAULT_QUALITY = "high"
+# Bitrate the "medium" tier aims for (kbps)
+MEDIUM_TARGET_ABR = 128
+# Served when the client names no audio type we have, as before the ladder
+DEFAULT_MEDIA_TYPE = "audio/mp4"
+ANY_MEDIA_TYPE = "*"
+
+# Audio-only containers whose media type is not simply audio/<ext>
+AUDIO_MEDIA_TYPES = {
+    "m4a": "audio/mp4",
+    "mp4": "audio/mp4",
+    "mp3": "audio/mpeg",
+}
+# Accept header spellings of the same container
+MEDIA_TYPE_ALIASES = {
+    "audio/m4a": "audio/mp4",
+    "audio/x-m4a": "audio/mp4",
+    "audio/aac": "audio/mp4",
+    "audio/mp3": "audio/mpeg",
+}
+# Tie-break between variants of equal bitrate, matching the old ext priority
+CONTAINER_PRIORITY = ("m4a", "mp3", "webm", "mp4")
+
+VARIANT_FIELDS = ("format_id", "container", "codec", "abr", "filesize", "media_type", "audio_only")
+
+
+def _bitrate(fmt: Dict[str, Any]) -> float:
+    return fmt.get("abr") or fmt.get("tbr") or 0.0
+
+
+def build_ladder(formats: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Every yt-dlp format carrying audio, best first.
+
+    Audio-only variants come before muxed ones; within each group higher
+    bitrates rank first and equal bitrates follow ``CONTAINER_PRIORITY``.
+    """
+    ladder = []
+    for fmt in formats:
+        if not fmt.get("url") or fmt.get("acodec") == "none":
+            continue
+        ext = fmt.get("ext") or "unknown"
+        audio_only = fmt.get("vcodec") == "none"
+        ladder.append({
+            "format_id": fmt.get("format_id"),
+            "container": ext,
+            "codec": fmt.get("acodec"),
+            "abr": _bitrate(fmt) or None,
+            "filesize": fmt.get("filesize") or fmt.get("filesize_approx"),
+            "media_type": AUDIO_MEDIA_TYPES.get(ext, "audio/" + ext) if audio_only else "video/" + ext,
+            "audio_only": audio_only,
+            "url": fmt["url"],
+        })
+
+    def rank(variant):
+        container = variant["container"]
+        priority = CONTAINER_PRIORITY.index(container) if container in CONTAINER_PRIORITY else len(CONTAINER_PRIORITY)
+        return (not variant["audio_only"], -(variant["abr"] or 0), priority)
+
+    ladder.sort(key=rank)
+    return ladder
+
+
+def _order(ladder: List[Dict[str, Any]], members: List[int], quality: str) -> List[int]:
+    audio = [i for i in members if ladder[i]["audio_only"]]
+    muxed = [i for i in members if not ladder[i]["audio_only"]]
+    if quality == "low":
+        key = lambda i: ladder[i]["abr"] or 0  # noqa: E731
+    elif quality == "medium":
+        key = lambda i: abs((ladder[i]["abr"] or 0) - MEDIUM_TARGET_ABR)  # noqa: E731
+    else:
+        return audio + muxed
+    # sorted() is stable, so ties keep their ladder (container) order
+    return sorted(audio, key=key) + sorted(muxed, key=key)
+
+
+def build_index(ladder: List[Dict[str, Any]]) -> Dict[str, List[int]]:
+    """Precompute the pick for every (quality, media type) a client can ask for.
+
+    Each entry is a list of ladder positions: the preferred variant first,
+    then the rest of that media type, then everything else in ladder order
+    as fallbacks. Keys look like ``"low:audio/webm"``; ``"*"`` stands for
+    any media type.
+    """
+    index = {}
+    media_types = list(dict.fromkeys(variant["media_type"] for variant in ladder)) + [ANY_MEDIA_TYPE]
+    for media_type in media_types:
+        members = [
+            i for i, variant in enumerate(ladder)
+            if media_type == ANY_MEDIA_TYPE or variant["media_type"] == media_type
+        ]
+        for quality in QUALITIES:
+            preferred = _order(ladder, members, quality)
+            chosen = set(preferred)
+            index[index_key(quality, media_type)] = preferred + [
+                i for i in range(len(ladder)) if i not in chosen
+            ]
+    return index
+
+
+def index_key(quality: str, media_type: str) -> str:
+    return f"{quality}:{media_type}"
+
+
+def parse_accept(header: Optional[str]) -> List[str]:
+    """Audio media types from an Accept header, most preferred first"""
+    if not header:
+        return []
+    weighted = []
+    for position, part in enumerate(header.split(",")):
+        media_type, *params = [piece.strip() for piece in part.split(";")]
+        media_type = media_type.lower()
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q <= 0:
+            continue
+        if media_type == "audio/*":
+            media_type = ANY_MEDIA_TYPE
+        elif media_type.startswith("audio/"):
+            media_type = MEDIA_TYPE_ALIASES.get(media_type, media_type)
+        else:
+            continue
+        weighted.append((-q, position, media_type))
+    return list(dict.fromkeys(media_type for _, _, media_type in sorted(weighted)))
+
+
+def client_hints(headers: Mapping[str, str], quality: Optional[str] = None,
+                 data_saver: bool = False) -> Tuple[str, List[str]]:
+    """Quality tier and acceptable media types for a request.
+
+    An explicit ``quality`` wins; otherwise a data-saver flag (the query
+    parameter or a ``Save-Data: on`` header) asks for the low tier.
+    """
+    if quality is None:
+        saving = data_saver or headers.get("save-data", "").strip().lower() == "on"
+        quality = "low" if saving else DEFAULT_QUALITY
+    if quality not in QUALITIES:
+        raise ValueError(f"Unknown quality {quality!r}, expected one of: {', '.join(QUALITIES)}")
+    media_types = parse_accept(headers.get("accept")) or [DEFAULT_MEDIA_TYPE]
+    return quality, media_types
+
+
+def select_chain(index: Dict[str, List[int]], quality: str, media_types: List[str]) -> List[int]:
+    """Ladder positions for these hints, best first; empty if the ladder is empty.
+
+    One dict lookup per acceptable media type, independent of ladder size.
+    """
+    for media_type in media_types + [DEFAULT_MEDIA_TYPE, ANY_MEDIA_TYPE]:
+        chain = index.get(index_key(quality, media_type))
+        if chain:
+            return chain
+    return []
+
+
+def describe(variant: Dict[str, Any]) -> Dict[str, Any]:
+    """A variant without its URL, for responses and logs"""
+    return {field: variant.get(field) for field in VARIANT_FIELDS}
@@ -48,6 +48,10 @@ def install_dependencies():
         
         # Additional utilities
         "requests==2.32.3",
+        "httpx==0.27.2",
+        # requirements.txt pins numpy 1.26.2, which has no wheels for Python 3.13;
+        # 2.1 is the first release line that does
+        "numpy==2.1.3",
     ]
     
     print("\n📚 Installing Python packages...")
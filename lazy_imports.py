@@ -0,0 +1,139 @@
+"""
+SpotifyClone lazy imports - heavy optional dependencies loaded off the startup path
+"""
+
+import asyncio
+import importlib
+import importlib.util
+import logging
+import sys
+import threading
+import time
+from types import ModuleType
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def is_installed(name: str) -> bool:
+    """Whether a module can be imported, without executing it"""
+    if name in sys.modules:
+        return True
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+class LazyModule:
+    """An optional module imported on a background thread instead of at import time.
+
+    yt-dlp loads hundreds of extractor modules and youtube-search-python
+    pulls in an HTTP stack, so importing them eagerly delays every cold
+    start and ``--reload`` restart before the first request is served.
+    ``installed`` is known at once (the module is located, not run);
+    ``start`` begins the import on an executor thread; ``wait`` lets a
+    route await readiness without blocking the event loop; ``load`` is
+    the blocking form for code already on a worker thread, and returns
+    at once when the module is warm.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.installed = is_installed(name)
+        self._module: Optional[ModuleType] = None
+        self._error: Optional[BaseException] = None
+        self._lock = threading.Lock()
+        self._future: Optional[asyncio.Future] = None
+        self.load_seconds: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        """``missing``, ``cold``, ``loading``, ``warm`` or ``failed``"""
+        if not self.installed:
+            return "missing"
+        if self._module is not None:
+            return "warm"
+        if self._error is not None:
+            return "failed"
+        return "loading" if self._lock.locked() else "cold"
+
+    def load(self) -> ModuleType:
+        """Import the module on this thread, or wait for the import already running"""
+        if self._module is not None:
+            return self._module
+        with self._lock:
+            if self._module is None:
+                if self._error is not None:
+                    raise ImportError(f"{self.name} failed to import: {self._error}") from self._error
+                start = time.perf_counter()
+                try:
+                    module = importlib.import_module(self.name)
+                except Exception as e:
+                    self._error = e
+                    logger.error(f"Importing {self.name} failed: {e}")
+                    raise
+                self.load_seconds = time.perf_counter() - start
+                self._module = module
+                logger.info(f"Imported {self.name} in {self.load_seconds:.2f}s")
+        return self._module
+
+    def start(self) -> asyncio.Future:
+        """Begin importing in the background (call from the event loop)"""
+        if self._future is None:
+            self._future = asyncio.get_running_loop().run_in_executor(None, self.load)
+        return self._future
+
+    async def wait(self) -> ModuleType:
+        """The module, once imported; starts the import if nothing has yet"""
+        if self._module is not None:
+            return self._module
+        # Shielded, so a cancelled request does not cancel the shared import
+        return await asyncio.shield(self.start())
+
+
+class Warmup:
+    """Readiness of the lazily imported modules plus whatever the app builds from them"""
+
+    def __init__(self, modules: Iterable[LazyModule]):
+        self.modules = list(modules)
+        self.started_at = time.perf_counter()
+        self.ready_seconds: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, then: Optional[Callable[[], Awaitable[Any]]] = None) -> asyncio.Task:
+        """Import every installed module, then await ``then()`` (e.g. pool warm-up)"""
+        self._task = asyncio.create_task(self._run(then))
+        return self._task
+
+    async def _run(self, then: Optional[Callable[[], Awaitable[Any]]]):
+        imports = [module.wait() for module in self.modules if module.installed]
+        for result in await asyncio.gather(*imports, return_exceptions=True):
+            if isinstance(result, Exception):
+                logger.warning(f"Warm-up continues without a module: {result}")
+        if then is not None:
+            try:
+                await then()
+            except Exception as e:
+                logger.error(f"Warm-up step failed: {e}")
+        self.ready_seconds = time.perf_counter() - self.started_at
+        logger.info(f"Warm-up finished {self.ready_seconds:.2f}s after startup")
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_seconds is not None
+
+    def cancel(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": "warm" if self.ready else "cold",
+            "modules": {module.name: module.state for module in self.modules},
+            "import_s": {
+                module.name: round(module.load_seconds, 3)
+                for module in self.modules if module.load_seconds is not None
+            },
+            "ready_after_s": round(self.ready_seconds, 3) if self.ready else None,
+        }
@@ -0,0 +1,289 @@
+"""
+SpotifyClone library index - in-memory, disk-backed index of uploaded songs
+"""
+
+import asyncio
+import base64
+import bisect
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SORT_FIELDS = ("modified", "name", "size")
+SONG_FIELDS = (
+    "id", "filename", "original_name", "size", "modified", "url", "source",
+    "title", "artist", "album", "duration", "sample_rate", "channels",
+    "loudness", "replaygain_gain", "replaygain_peak"
+)
+
+
+class InvalidCursor(ValueError):
+    """Raised for a pagination cursor that cannot be decoded"""
+
+
+def _sort_key(field: str, entry: Dict[str, Any]) -> Any:
+    if field == "name":
+        return (entry.get("original_name") or entry["filename"]).casefold()
+    return entry[field]
+
+
+def encode_cursor(key: Any, filename: str) -> str:
+    raw = json.dumps([key, filename], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        key, filename = json.loads(raw)
+        return key, filename
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+
+
+def scan_directory(files_dir: Path, extensions: Iterable[str]) -> Dict[str, Tuple[int, float]]:
+    """Size and mtime of every audio file in ``files_dir`` (blocking)"""
+    found = {}
+    extensions = set(extensions)
+    with os.scandir(files_dir) as it:
+        for item in it:
+            if item.is_file() and Path(item.name).suffix.lower() in extensions:
+                stat = item.stat()
+                found[item.name] = (stat.st_size, stat.st_mtime)
+    return found
+
+
+class LibraryIndex:
+    """Index of uploaded songs kept in memory and saved as JSON.
+
+    For every sort field there is a list of ``(key, filename)`` tuples kept
+    in order, so a page is a bisect plus a slice. Uploads and deletes update
+    the index directly; ``reconcile`` brings it back in line with the
+    directory after files changed behind its back.
+
+    Worker processes sharing ``index_path`` leave writing it to one of
+    them; the others are ``read_only`` and pick up its entries (with the
+    tags and analysis it gathered) on each ``reconcile``.
+    """
+
+    def __init__(self, files_dir: Path, index_path: Path, extensions: Iterable[str],
+                 on_reconciled: Optional[Callable[["LibraryIndex"], None]] = None,
+                 read_only: bool = False):
+        self.files_dir = Path(files_dir)
+        self.index_path = Path(index_path)
+        self.extensions = set(extensions)
+        self.on_reconciled = on_reconciled
+        self.read_only = read_only
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._sorted: Dict[str, List[Tuple[Any, str]]] = {field: [] for field in SORT_FIELDS}
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, filename: str) -> bool:
+        return filename in self.entries
+
+    def _insert(self, entry: Dict[str, Any]):
+        self.entries[entry["filename"]] = entry
+        for field, keys in self._sorted.items():
+            bisect.insort(keys, (_sort_key(field, entry), entry["filename"]))
+
+    def _delete(self, filename: str) -> Optional[Dict[str, Any]]:
+        entry = self.entries.pop(filename, None)
+        if entry is not None:
+            for field, keys in self._sorted.items():
+                item = (_sort_key(field, entry), filename)
+                i = bisect.bisect_left(keys, item)
+                if i < len(keys) and keys[i] == item:
+                    del keys[i]
+        return entry
+
+    def _make_entry(self, filename: str, size: int, modified: float, **fields: Any) -> Dict[str, Any]:
+        entry = {
+            'id': filename,
+            'filename': filename,
+            'original_name': Path(filename).stem,
+            'size': size,
+            'modified': modified,
+            'url': f'/songs/{filename}',
+            'source': 'local'
+        }
+        entry.update(fields)
+        return entry
+
+    def add(self, filename: str, **fields: Any) -> Dict[str, Any]:
+        """Index a file that was just written to ``files_dir``"""
+        stat = (self.files_dir / filename).stat()
+        self._delete(filename)
+        entry = self._make_entry(filename, stat.st_size, stat.st_mtime, **fields)
+        self._insert(entry)
+        self._dirty = True
+        return entry
+
+    def remove(self, filename: str) -> bool:
+        removed = self._delete(filename) is not None
+        self._dirty = self._dirty or removed
+        return removed
+
+    def update(self, filename: str, **fields: Any) -> Optional[Dict[str, Any]]:
+        """Merge extra fields (e.g. tags) into an entry"""
+        entry = self._delete(filename)
+        if entry is None:
+            return None
+        entry.update(fields)
+        self._insert(entry)
+        self._dirty = True
+        return entry
+
+    def get(self, filename: str) -> Optional[Dict[str, Any]]:
+        return self.entries.get(filename)
+
+    def missing_field(self, field: str) -> List[str]:
+        """Filenames whose entries have not been given ``field`` yet"""
+        return [filename for filename, entry in self.entries.items() if field not in entry]
+
+    def page(self, sort: str = "modified", order: str = "desc", limit: int = 100,
+             cursor: Optional[str] = None, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """One page of songs plus the cursor for the next one"""
+        keys = self._sorted[sort]
+        descending = order == "desc"
+
+        if cursor is None:
+            start = len(keys) - 1 if descending else 0
+        else:
+            position = decode_cursor(cursor)
+            try:
+                if descending:
+                    start = bisect.bisect_left(keys, tuple(position)) - 1
+                else:
+                    start = bisect.bisect_right(keys, tuple(position))
+            except TypeError:
+                # A cursor issued for a different sort field
+                raise InvalidCursor(f"Cursor does not match sort {sort!r}")
+
+        if descending:
+            stop = max(start - limit, -1)
+            window = [keys[i] for i in range(start, stop, -1)]
+        else:
+            window = keys[start:start + limit]
+
+        songs = [self.entries[filename] for _, filename in window]
+        if fields:
+            songs = [{field: song.get(field) for field in fields} for song in songs]
+
+        has_more = (stop >= 0) if descending else (start + limit < len(keys))
+        next_cursor = encode_cursor(*window[-1]) if window and has_more else None
+        return {
+            'songs': songs,
+            'total': len(self.entries),
+            'next_cursor': next_cursor
+        }
+
+    def _read(self) -> Optional[List[Dict[str, Any]]]:
+        if not self.index_path.exists():
+            return None
+        try:
+            return json.loads(self.index_path.read_text()).get("songs", [])
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read library index, rebuilding: {e}")
+            return None
+
+    def load(self):
+        """Read the saved index, if any"""
+        for entry in self._read() or []:
+            self._insert(entry)
+
+    def merge_saved(self, saved: List[Dict[str, Any]]):
+        """Take the saved entries over ours; entries for files not saved yet are kept"""
+        for entry in saved:
+            if entry != self.entries.get(entry["filename"]):
+                self._delete(entry["filename"])
+                self._insert(entry)
+
+    def _write(self, data: str):
+        # Per process, so worker processes saving at once never share a temp file
+        temp_path = self.index_path.with_suffix(f".{os.getpid()}.tmp")
+        temp_path.write_text(data)
+        os.replace(temp_path, self.index_path)
+
+    def save(self):
+        """Write the index atomically if it changed (blocking)"""
+        if self._dirty and not self.read_only:
+            self._dirty = False
+            self._write(json.dumps({"songs": list(self.entries.values())}))
+
+    async def flush(self):
+        """Snapshot the index on the event loop and write it on a thread"""
+        if self._dirty and not self.read_only:
+            self._dirty = False
+            data = json.dumps({"songs": list(self.entries.values())})
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._write, data)
+
+    def apply_scan(self, found: Dict[str, Tuple[int, float]]) -> Tuple[int, int, int]:
+        """Reconcile the index with a directory scan; returns (added, changed, removed)"""
+        added = changed = 0
+        for filename, (size, modified) in found.items():
+            entry = self.entries.get(filename)
+            if entry is None:
+                # Deleted since the scan ran
+                if not (self.files_dir / filename).exists():
+                    continue
+                self._insert(self._make_entry(filename, size, modified))
+                added += 1
+            elif entry['size'] != size or entry['modified'] != modified:
+                # The file was replaced; tags gathered for the old one are stale
+                self._delete(filename)
+                self._insert(self._make_entry(
+                    filename, size, modified,
+                    original_name=entry.get('original_name', Path(filename).stem)
+                ))
+                changed += 1
+
+        # Files uploaded since the scan ran are not in it but still exist
+        missing = [
+            filename for filename in self.entries
+            if filename not in found and not (self.files_dir / filename).exists()
+        ]
+        for filename in missing:
+            self._delete(filename)
+
+        if added or changed or missing:
+            self._dirty = True
+        return added, changed, len(missing)
+
+    async def reconcile(self) -> Tuple[int, int, int]:
+        """Rescan ``files_dir`` off the event loop and apply the differences"""
+        loop = asyncio.get_running_loop()
+        if self.read_only:
+            saved = await loop.run_in_executor(None, self._read)
+            if saved is not None:
+                self.merge_saved(saved)
+        found = await loop.run_in_executor(None, scan_directory, self.files_dir, self.extensions)
+        result = self.apply_scan(found)
+        if any(result):
+            logger.info(f"Library reconciled: {result[0]} added, {result[1]} changed, {result[2]} removed")
+        await self.flush()
+        if self.on_reconciled:
+            self.on_reconciled(self)
+        return result
+
+    async def run_maintenance(self, save_interval: float, rescan_interval: float):
+        """Background loop saving changes and periodically rescanning"""
+        since_rescan = 0.0
+        while True:
+            await asyncio.sleep(save_interval)
+            since_rescan += save_interval
+            try:
+                if since_rescan >= rescan_interval:
+                    since_rescan = 0.0
+                    await self.reconcile()
+                else:
+                    await self.flush()
+            except OSError as e:
+                logger.warning(f"Library maintenance failed: {e}")
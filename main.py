@@ -1,37 +1,55 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Query
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 import os
 import shutil
+import socket
 import asyncio
-from typing import List, Optional
+from typing import Dict, List, Optional
 import json
 import uuid
 from pathlib import Path
-import aiofiles
 from pydantic import BaseModel
 import logging
 from urllib.parse import quote, unquote
-import requests
-from datetime import datetime, timedelta
-
-# YouTube search imports
-try:
-    from youtubesearchpython import VideosSearch
-    YOUTUBE_SEARCH_AVAILABLE = True
-except ImportError:
-    YOUTUBE_SEARCH_AVAILABLE = False
+import time
+
+from caching import SearchCache, StreamCache, normalize_query
+from extraction import ExtractionPool, ExtractionQueueFull, ExtractionTimeout, SingleFlight
+from extraction_store import ExtractionStore
+from blob_store import BlobStore
+from audio_metadata import MetadataPipeline
+from audio_analysis import AnalysisError, AnalysisPipeline, read_peaks
+from library_index import SONG_FIELDS, SORT_FIELDS, InvalidCursor, LibraryIndex
+from uploads import UploadSizeLimitMiddleware, UploadTooLarge, receive_upload, remove_stale_uploads
+from file_serving import RangeFileResponse
+from format_ladder import build_index, build_ladder, client_hints, describe, select_chain
+from audio_cache import AudioCache
+from stream_relay import HTTPX_AVAILABLE, StreamRelay, UpstreamError
+from url_validator import CircuitBreaker, UrlValidator
+from ydl_pool import YoutubeDLPool
+from profiling import PROFILER_MODES, ProfilerMiddleware, RequestProfiler
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsRegistry, RequestMetricsMiddleware
+from search_backend import ClientDisconnected, SearchTimeout, cancel_on_disconnect, create_search_backend
+from worker_lock import LeaderLock
+from rate_limit import RateLimiter, RateLimitMiddleware, parse_limit
+from lazy_imports import LazyModule, Warmup
+
+# YouTube search and yt-dlp (for stream URLs) are imported in the background
+# after startup; only whether they are installed is checked here
+youtube_search = LazyModule("youtubesearchpython")
+YOUTUBE_SEARCH_AVAILABLE = youtube_search.installed
+if not YOUTUBE_SEARCH_AVAILABLE:
     print("Warning: youtube-search-python not available. Install with: pip install youtube-search-python")
 
-# yt-dlp for getting stream URLs
-try:
-    import yt_dlp
-    YT_DLP_AVAILABLE = True
-except ImportError:
-    YT_DLP_AVAILABLE = False
+ytdlp = LazyModule("yt_dlp")
+YT_DLP_AVAILABLE = ytdlp.installed
+if not YT_DLP_AVAILABLE:
     print("Warning: yt-dlp not available. Install with: pip install yt-dlp")
 
+warmup = Warmup([youtube_search, ytdlp])
+
 # Create FastAPI app
 app = FastAPI(
     title="SpotifyClone API",
@@ -55,6 +73,55 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Per-client token buckets for the expensive routes, checked before any work
+# is scheduled. Limits are "REQUESTS/SECONDS" (a burst of REQUESTS, refilled
+# evenly over SECONDS) or "off". Clients are keyed by IP, or with
+# RATE_LIMIT_KEY=api_key by their X-API-Key header when it is one of the
+# comma-separated RATE_LIMIT_API_KEYS (IP otherwise). Behind reverse proxies
+# set RATE_LIMIT_TRUSTED_PROXIES to their number, so the client IP is read
+# from that many X-Forwarded-For hops from the right.
+# Buckets live in each worker process. Added before the metrics middleware,
+# so throttled requests are still counted.
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+RATE_LIMIT_KEY = os.getenv("RATE_LIMIT_KEY", "ip")
+RATE_LIMIT_API_KEYS = [key.strip() for key in os.getenv("RATE_LIMIT_API_KEYS", "").split(",") if key.strip()]
+RATE_LIMIT_TRUSTED_PROXIES = int(os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "0"))
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "100000"))
+rate_limiter = RateLimiter(
+    {
+        "/play": parse_limit(os.getenv("RATE_LIMIT_PLAY", "30/60")),
+        "/search": parse_limit(os.getenv("RATE_LIMIT_SEARCH", "60/60")),
+        "/upload": parse_limit(os.getenv("RATE_LIMIT_UPLOAD", "10/60")),
+        "/debug": parse_limit(os.getenv("RATE_LIMIT_DEBUG", "5/60")),
+    },
+    key=RATE_LIMIT_KEY,
+    api_keys=RATE_LIMIT_API_KEYS,
+    trusted_proxies=RATE_LIMIT_TRUSTED_PROXIES,
+    max_clients=RATE_LIMIT_MAX_CLIENTS
+) if RATE_LIMIT_ENABLED else None
+if rate_limiter:
+    app.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
+
+# Prometheus metrics, served at /metrics. Hot paths update per-thread cells
+# without locks; cache, queue and library figures are read at scrape time.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+metrics = MetricsRegistry(prefix="spotifyclone_")
+request_latency = metrics.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status")
+)
+extraction_stage_latency = metrics.histogram(
+    "extraction_stage_seconds", "Time spent in each stage of a stream extraction", ("stage",)
+)
+queue_wait_latency = extraction_stage_latency.labels("queue_wait")
+ytdlp_latency = extraction_stage_latency.labels("ytdlp")
+format_selection_latency = extraction_stage_latency.labels("format_selection")
+verification_latency = extraction_stage_latency.labels("verification")
+search_latency = metrics.histogram("search_duration_seconds", "Search backend latency, including waiting for a slot")
+upload_bytes = metrics.counter("upload_bytes_total", "Bytes of audio accepted by /upload")
+upload_latency = metrics.histogram("upload_duration_seconds", "Time to receive and store an upload")
+if METRICS_ENABLED:
+    app.add_middleware(RequestMetricsMiddleware, histogram=request_latency)
+
 # Create directories
 UPLOAD_DIR = Path("uploads")
 STATIC_DIR = Path("static")
@@ -63,13 +130,241 @@ UPLOAD_DIR.mkdir(exist_ok=True)
 STATIC_DIR.mkdir(exist_ok=True)
 CACHE_DIR.mkdir(exist_ok=True)
 
+# Number of server processes; set by `python main.py --workers N` for production.
+# Worker processes share CACHE_DIR, so components that keep per-process indexes
+# of it are disabled below when there is more than one.
+WORKERS = int(os.getenv("WORKERS", "1"))
+
+# The worker holding this lock (taken at startup) cleans up after crashes, queues
+# tag reading and analysis, and writes the library index; the others read it
+leader = LeaderLock(CACHE_DIR / "leader.lock")
+# Files newer than this may be another worker's upload in progress
+STARTED_AT = time.time()
+
 # Allowed file extensions
 ALLOWED_EXTENSIONS = {".mp3", ".wav", ".m4a", ".flac", ".ogg"}
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
 
-# Cache for stream URLs to avoid repeated yt-dlp calls
-stream_cache = {}
-CACHE_DURATION = timedelta(hours=1)  # Cache URLs for 1 hour
+# Uploads are stored once per distinct content and hard-linked into UPLOAD_DIR
+blob_store = BlobStore(UPLOAD_DIR)
+
+# Index behind /library, saved to CACHE_DIR and rescanned periodically
+LIBRARY_INDEX_PATH = CACHE_DIR / "library.json"
+LIBRARY_SAVE_INTERVAL = float(os.getenv("LIBRARY_SAVE_INTERVAL", "5"))
+# With several workers, rescans are how one sees the others' uploads and deletes
+LIBRARY_RESCAN_INTERVAL = float(os.getenv("LIBRARY_RESCAN_INTERVAL", "300" if WORKERS == 1 else "15"))
+
+def queue_missing_metadata(index: LibraryIndex):
+    """Read tags and analyse files that have not been processed yet (e.g. found by a rescan)"""
+    if not leader.held:
+        return
+    for filename in index.missing_field('duration'):
+        metadata_pipeline.submit(filename)
+    for filename in index.missing_field('replaygain_gain'):
+        analysis_pipeline.submit(filename)
+
+library_index = LibraryIndex(
+    UPLOAD_DIR, LIBRARY_INDEX_PATH, ALLOWED_EXTENSIONS,
+    on_reconciled=queue_missing_metadata
+)
+
+# Tags and duration are read after upload on a background pool and stored in the index
+METADATA_WORKERS = int(os.getenv("METADATA_WORKERS", "2"))
+metadata_pipeline = MetadataPipeline(
+    UPLOAD_DIR,
+    on_result=lambda filename, meta: library_index.update(filename, **meta),
+    max_workers=METADATA_WORKERS
+)
+
+# Waveform peaks and loudness are computed on a process pool (numpy, WAV for now);
+# peak pyramids are stored in CACHE_DIR and loudness in the index
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "2"))
+analysis_pipeline = AnalysisPipeline(
+    UPLOAD_DIR,
+    CACHE_DIR / "waveforms",
+    on_result=lambda filename, fields: library_index.update(filename, **fields),
+    max_workers=ANALYSIS_WORKERS
+)
+
+# Reject oversized uploads before the multipart body is buffered
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    paths=["/upload"],
+    max_size=MAX_FILE_SIZE
+)
+
+# Slow-request profiler, off by default. "slow" samples the stacks of requests
+# still running after PROFILER_THRESHOLD seconds and keeps those profiles;
+# "sample" profiles a PROFILER_SAMPLE_RATE fraction of all requests. Every
+# PROFILER_INTERVAL seconds while sampling, all threads' stacks are walked,
+# which slows the process down; faster requests pay only the bookkeeping.
+# The newest PROFILER_MAX_PROFILES gzipped profiles are kept in CACHE_DIR/profiles.
+PROFILER_MODE = os.getenv("PROFILER_MODE", "off")
+PROFILER_THRESHOLD = float(os.getenv("PROFILER_THRESHOLD", "2"))
+PROFILER_SAMPLE_RATE = float(os.getenv("PROFILER_SAMPLE_RATE", "0.01"))
+PROFILER_INTERVAL = float(os.getenv("PROFILER_INTERVAL", "0.005"))
+PROFILER_MAX_PROFILES = int(os.getenv("PROFILER_MAX_PROFILES", "50"))
+if PROFILER_MODE not in PROFILER_MODES:
+    raise ValueError(f"PROFILER_MODE must be one of: {', '.join(PROFILER_MODES)}")
+request_profiler = RequestProfiler(
+    CACHE_DIR / "profiles",
+    mode=PROFILER_MODE,
+    threshold=PROFILER_THRESHOLD,
+    sample_rate=PROFILER_SAMPLE_RATE,
+    interval=PROFILER_INTERVAL,
+    max_profiles=PROFILER_MAX_PROFILES,
+    exclude=["/debug/profiles", "/metrics", "/static"]
+) if PROFILER_MODE != "off" and WORKERS == 1 else None
+if PROFILER_MODE != "off" and WORKERS > 1:
+    logger.warning("The request profiler keeps a per-process ring index; disabled with WORKERS > 1")
+if request_profiler:
+    app.add_middleware(ProfilerMiddleware, profiler=request_profiler)
+
+# Search backend: "youtube" (youtube-search-python on its own threads) or
+# "fake" (generated results for local testing)
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "youtube")
+SEARCH_CONCURRENCY = int(os.getenv("SEARCH_CONCURRENCY", "8"))
+SEARCH_TIMEOUT = float(os.getenv("SEARCH_TIMEOUT", "10"))
+search_backend = create_search_backend(
+    SEARCH_BACKEND,
+    client=(lambda *args, **kwargs: youtube_search.load().VideosSearch(*args, **kwargs))
+    if YOUTUBE_SEARCH_AVAILABLE else None,
+    max_concurrency=SEARCH_CONCURRENCY,
+    timeout=SEARCH_TIMEOUT
+)
+
+# Search results cache: fresh for SEARCH_CACHE_TTL, then served stale while
+# one background refresh runs, for up to SEARCH_CACHE_STALE_TTL more
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "600"))
+SEARCH_CACHE_STALE_TTL = float(os.getenv("SEARCH_CACHE_STALE_TTL", "3600"))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "1000"))
+search_cache = SearchCache(
+    max_entries=SEARCH_CACHE_MAX_ENTRIES,
+    ttl=SEARCH_CACHE_TTL,
+    stale_ttl=SEARCH_CACHE_STALE_TTL
+)
+
+# Extraction pool: yt-dlp calls block, so they run on worker threads
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "4"))
+EXTRACTION_QUEUE_SIZE = int(os.getenv("EXTRACTION_QUEUE_SIZE", "32"))
+EXTRACTION_TIMEOUT = float(os.getenv("EXTRACTION_TIMEOUT", "30"))
+extraction_pool = ExtractionPool(
+    max_workers=EXTRACTION_WORKERS,
+    max_queue=EXTRACTION_QUEUE_SIZE,
+    timeout=EXTRACTION_TIMEOUT,
+    on_wait=queue_wait_latency.observe
+)
+# Pre-built YoutubeDL instances, one per extraction thread, rebuilt after
+# YDL_POOL_MAX_USES extractions or any error
+YDL_POOL_SIZE = int(os.getenv("YDL_POOL_SIZE", str(EXTRACTION_WORKERS)))
+YDL_POOL_MAX_USES = int(os.getenv("YDL_POOL_MAX_USES", "100"))
+ydl_pool = YoutubeDLPool(
+    lambda: ytdlp.load().YoutubeDL(get_yt_dlp_options()),
+    size=YDL_POOL_SIZE,
+    max_uses=YDL_POOL_MAX_USES
+)
+
+# Extraction results persisted across restarts
+EXTRACTION_STORE_PATH = Path(os.getenv("EXTRACTION_STORE_PATH", str(CACHE_DIR / "extractions.db")))
+EXTRACTION_STORE_COMPACT_INTERVAL = float(os.getenv("EXTRACTION_STORE_COMPACT_INTERVAL", "900"))
+extraction_store = ExtractionStore(EXTRACTION_STORE_PATH)
+
+# Worker processes take a lease in the shared store before extracting, so
+# each video is extracted by one process at a time and the rest wait for its
+# result. EXTRACTION_LEASE_TTL bounds how long a crashed holder blocks others.
+EXTRACTION_LEASES = os.getenv("EXTRACTION_LEASES", str(WORKERS > 1)).lower() in ("1", "true", "yes")
+EXTRACTION_LEASE_TTL = float(os.getenv("EXTRACTION_LEASE_TTL", str(EXTRACTION_TIMEOUT + 15)))
+EXTRACTION_LEASE_POLL = float(os.getenv("EXTRACTION_LEASE_POLL", "0.1"))
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# Extractions currently running, keyed by video_id
+inflight_extractions = SingleFlight()
+
+# Stream URLs are checked with a HEAD request before they are cached:
+# "first" checks fresh extractions, "always" also stored ones, "off" never.
+# STREAM_VERIFY_SAMPLE_RATE is the fraction of those that are checked.
+STREAM_VERIFY_MODE = os.getenv("STREAM_VERIFY_MODE", "first")
+STREAM_VERIFY_SAMPLE_RATE = float(os.getenv("STREAM_VERIFY_SAMPLE_RATE", "1.0"))
+STREAM_VERIFY_TIMEOUT = float(os.getenv("STREAM_VERIFY_TIMEOUT", "3"))
+STREAM_VERIFY_SLOW_THRESHOLD = float(os.getenv("STREAM_VERIFY_SLOW_THRESHOLD", "1.5"))
+STREAM_FALLBACKS = int(os.getenv("STREAM_FALLBACKS", "3"))
+url_validator = UrlValidator(
+    mode=STREAM_VERIFY_MODE,
+    sample_rate=STREAM_VERIFY_SAMPLE_RATE,
+    timeout=STREAM_VERIFY_TIMEOUT,
+    slow_threshold=STREAM_VERIFY_SLOW_THRESHOLD,
+    # Stop checking for 30s after 5 slow or failed checks in a row
+    breaker=CircuitBreaker(threshold=5, cooldown=30)
+) if HTTPX_AVAILABLE else None
+
+# POST /play/batch: at most PLAY_BATCH_MAX_IDS per request, each batch keeps
+# at most PLAY_BATCH_CONCURRENCY extractions queued so it cannot flood the pool
+PLAY_BATCH_MAX_IDS = int(os.getenv("PLAY_BATCH_MAX_IDS", "50"))
+PLAY_BATCH_CONCURRENCY = int(os.getenv("PLAY_BATCH_CONCURRENCY", str(EXTRACTION_WORKERS)))
+PLAY_BATCH_DEADLINE = float(os.getenv("PLAY_BATCH_DEADLINE", "20"))
+
+# Cache for stream URLs to avoid repeated yt-dlp calls. Entries live until
+# the googlevideo URL's own expire= time minus a safety margin.
+STREAM_CACHE_MAX_ENTRIES = int(os.getenv("STREAM_CACHE_MAX_ENTRIES", "2000"))
+STREAM_CACHE_MAX_BYTES = int(os.getenv("STREAM_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+STREAM_CACHE_SAFETY_MARGIN = float(os.getenv("STREAM_CACHE_SAFETY_MARGIN", "600"))
+stream_cache = StreamCache(
+    max_entries=STREAM_CACHE_MAX_ENTRIES,
+    max_bytes=STREAM_CACHE_MAX_BYTES,
+    default_ttl=3600,  # For URLs without an expire= parameter
+    safety_margin=STREAM_CACHE_SAFETY_MARGIN
+)
+
+# Relay behind /stream: upstream connections are pooled and kept alive, and
+# each stream buffers at most STREAM_RELAY_BUFFER_CHUNKS chunks
+STREAM_RELAY_MAX_CONNECTIONS = int(os.getenv("STREAM_RELAY_MAX_CONNECTIONS", "64"))
+STREAM_RELAY_MAX_KEEPALIVE = int(os.getenv("STREAM_RELAY_MAX_KEEPALIVE", "16"))
+STREAM_RELAY_BUFFER_CHUNKS = int(os.getenv("STREAM_RELAY_BUFFER_CHUNKS", "8"))
+STREAM_RELAY_CHUNK_SIZE = int(os.getenv("STREAM_RELAY_CHUNK_SIZE", str(64 * 1024)))
+stream_relay = StreamRelay(
+    resolve=lambda video_id: current_stream_url(video_id),
+    invalidate=lambda video_id: forget_stream_url(video_id),
+    max_connections=STREAM_RELAY_MAX_CONNECTIONS,
+    max_keepalive=STREAM_RELAY_MAX_KEEPALIVE,
+    buffer_chunks=STREAM_RELAY_BUFFER_CHUNKS,
+    chunk_size=STREAM_RELAY_CHUNK_SIZE
+)
+
+# Opt-in disk cache of hot tracks: after AUDIO_CACHE_FETCH_AFTER plays a
+# track's audio is fetched once and replays are served from CACHE_DIR
+AUDIO_CACHE_ENABLED = os.getenv("AUDIO_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+AUDIO_CACHE_MAX_BYTES = int(os.getenv("AUDIO_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+AUDIO_CACHE_FETCH_AFTER = int(os.getenv("AUDIO_CACHE_FETCH_AFTER", "3"))
+AUDIO_CACHE_POLICY = os.getenv("AUDIO_CACHE_POLICY", "lfu")
+audio_cache = AudioCache(
+    CACHE_DIR / "audio",
+    stream_relay,
+    max_bytes=AUDIO_CACHE_MAX_BYTES,
+    fetch_after=AUDIO_CACHE_FETCH_AFTER,
+    policy=AUDIO_CACHE_POLICY
+) if AUDIO_CACHE_ENABLED and HTTPX_AVAILABLE and WORKERS == 1 else None
+if AUDIO_CACHE_ENABLED and WORKERS > 1:
+    logger.warning("The audio cache keeps a per-process index; disabled with WORKERS > 1")
+
+# Gauges and counters the components already keep, read when /metrics is scraped
+metrics.counter_callback("stream_cache_hits_total", "Stream cache hits", lambda: stream_cache.stats()["hits"])
+metrics.counter_callback("stream_cache_misses_total", "Stream cache misses", lambda: stream_cache.stats()["misses"])
+metrics.counter_callback("stream_cache_evictions_total", "Stream cache entries evicted for space",
+                         lambda: stream_cache.stats()["evictions"])
+metrics.gauge_callback("stream_cache_entries", "Entries in the stream cache", lambda: stream_cache.stats()["entries"])
+metrics.gauge_callback("extractions_in_flight", "Videos currently being resolved", lambda: len(inflight_extractions))
+metrics.gauge_callback(
+    "extraction_pool_jobs", "Extraction jobs on the pool by state",
+    lambda: {(state,): extraction_pool.stats()[state] for state in ("queued", "running")},
+    ("state",)
+)
+metrics.gauge_callback("library_songs", "Songs in the library index", lambda: len(library_index))
+if rate_limiter:
+    metrics.counter_callback(
+        "rate_limited_total", "Requests answered 429 by the rate limiter, by route group",
+        lambda: {(group,): buckets.throttled for group, buckets in rate_limiter.groups.items()},
+        ("group",)
+    )
 
 # Data models
 class SearchResult(BaseModel):
@@ -89,6 +384,19 @@ class PlayResponse(BaseModel):
     title: str
     duration: Optional[str] = None
     error: Optional[str] = None
+    variant: Optional[dict] = None
+
+class BatchPlayRequest(BaseModel):
+    ids: List[str]
+    deadline: Optional[float] = None
+    quality: Optional[str] = None
+    data_saver: bool = False
+
+class ExtractionResult(BaseModel):
+    play: PlayResponse
+    ladder: List[dict] = []
+    index: Dict[str, List[int]] = {}
+    expires_at: float
 
 class UploadResponse(BaseModel):
     filename: str
@@ -101,6 +409,18 @@ class HealthResponse(BaseModel):
     message: str
     youtube_available: bool
     ytdlp_available: bool
+    extraction: Optional[dict] = None
+    stream_cache: Optional[dict] = None
+    extraction_store: Optional[dict] = None
+    search_cache: Optional[dict] = None
+    search_backend: Optional[dict] = None
+    stream_relay: Optional[dict] = None
+    audio_cache: Optional[dict] = None
+    analysis: Optional[dict] = None
+    url_validator: Optional[dict] = None
+    profiler: Optional[dict] = None
+    warmup: Optional[dict] = None
+    rate_limit: Optional[dict] = None
 
 class ErrorResponse(BaseModel):
     error: str
@@ -127,9 +447,29 @@ async def health_check():
         status="healthy",
         message="API is operational",
         youtube_available=YOUTUBE_SEARCH_AVAILABLE,
-        ytdlp_available=YT_DLP_AVAILABLE
+        ytdlp_available=YT_DLP_AVAILABLE,
+        extraction={**extraction_pool.stats(), **inflight_extractions.stats(), 'ydl_pool': ydl_pool.stats()},
+        stream_cache=stream_cache.stats(),
+        extraction_store=extraction_store.stats(),
+        search_cache=search_cache.stats(),
+        search_backend=search_backend.stats() if search_backend else None,
+        stream_relay=stream_relay.stats(),
+        audio_cache=audio_cache.stats() if audio_cache else None,
+        analysis=analysis_pipeline.stats(),
+        url_validator=url_validator.stats() if url_validator else None,
+        profiler=request_profiler.stats() if request_profiler else None,
+        warmup=warmup.stats(),
+        rate_limit=rate_limiter.stats() if rate_limiter else None
     )
 
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus scrape endpoint"""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    # Set as a header: media_type would get a second charset appended
+    return Response(metrics.render(), headers={"Content-Type": METRICS_CONTENT_TYPE})
+
 # Enhanced error handler
 def create_error_response(error_msg: str, detail: str, suggestions: List[str] = None) -> ErrorResponse:
     """Create a standardized error response with helpful suggestions"""
@@ -143,9 +483,9 @@ def create_error_response(error_msg: str, detail: str, suggestions: List[str] =
     )
 
 # Serve uploaded songs
-@app.get("/songs/{filename}")
-async def serve_song(filename: str):
-    """Serve uploaded audio files with proper headers"""
+@app.api_route("/songs/{filename}", methods=["GET", "HEAD"])
+async def serve_song(filename: str, request: Request):
+    """Serve uploaded audio files with Range support for seeking"""
     file_path = UPLOAD_DIR / filename
     
     if not file_path.exists():
@@ -155,16 +495,48 @@ async def serve_song(filename: str):
     if file_path.suffix.lower() not in ALLOWED_EXTENSIONS:
         raise HTTPException(status_code=400, detail="File type not supported")
     
-    return FileResponse(
-        path=file_path,
-        media_type="audio/mpeg",
+    return RangeFileResponse(
+        file_path,
+        request.headers,
+        method=request.method,
         headers={
-            "Accept-Ranges": "bytes",
             "Cache-Control": "public, max-age=3600",
             "Access-Control-Allow-Origin": "*"
         }
     )
 
+@app.get("/songs/{filename}/waveform")
+async def get_waveform(
+    filename: str,
+    zoom: int = Query(0, ge=0, description="0 is the whole-track overview; each step doubles the resolution")
+):
+    """Waveform peaks (interleaved min/max, scaled to ±32767) and loudness of an uploaded song"""
+    song = library_index.get(filename)
+    if song is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    if not analysis_pipeline.supports(filename):
+        raise HTTPException(status_code=404, detail="Waveforms are not available for this file type")
+    
+    loop = asyncio.get_running_loop()
+    try:
+        waveform = await loop.run_in_executor(None, read_peaks, analysis_pipeline.peaks_path(filename), zoom)
+    except (FileNotFoundError, AnalysisError):
+        if 'replaygain_gain' in song:
+            raise HTTPException(status_code=404, detail="Waveform could not be computed for this file")
+        # Not analysed yet; make sure it is on its way (other workers leave it to the leader)
+        if leader.held:
+            analysis_pipeline.submit(filename)
+        return JSONResponse(status_code=202, content={'filename': filename, 'status': 'pending'})
+    
+    return {
+        'filename': filename,
+        **waveform,
+        'loudness': song.get('loudness'),
+        'replaygain_gain': song.get('replaygain_gain'),
+        'replaygain_peak': song.get('replaygain_peak')
+    }
+
 @app.post("/upload", response_model=UploadResponse)
 async def upload_audio(file: UploadFile = File(...)):
     """Upload audio file to server with enhanced validation"""
@@ -177,43 +549,96 @@ async def upload_audio(file: UploadFile = File(...)):
             detail=f"File type {file_ext} not supported. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
         )
     
-    # Check file size
-    content = await file.read()
-    file_size = len(content)
-    
-    if file_size > MAX_FILE_SIZE:
+    # Stream to a temp file in fixed-size chunks, hashing and enforcing the size limit as we go
+    upload_start = time.perf_counter()
+    try:
+        upload = await receive_upload(file, blob_store.root, MAX_FILE_SIZE)
+    except UploadTooLarge:
         raise HTTPException(
             status_code=400,
             detail=f"File too large. Maximum size: {MAX_FILE_SIZE // (1024*1024)}MB"
         )
+    except Exception as e:
+        logger.error(f"Upload failed: {str(e)}")
+        raise HTTPException(status_code=500, detail="Upload failed")
     
     # Generate unique filename
     unique_filename = f"{uuid.uuid4()}{file_ext}"
-    file_path = UPLOAD_DIR / unique_filename
     
     try:
-        # Save file
-        async with aiofiles.open(file_path, 'wb') as f:
-            await f.write(content)
+        # Store the blob (or drop the copy of a duplicate) and publish it under the new name
+        blob_store.link(upload.sha256, unique_filename, upload.temp_path)
+        library_index.add(unique_filename, original_name=file.filename)
+        # On other workers the leader's next rescan picks the file up
+        if leader.held:
+            metadata_pipeline.submit(unique_filename)
+            analysis_pipeline.submit(unique_filename)
+        upload_bytes.inc(upload.size)
+        upload_latency.observe(time.perf_counter() - upload_start)
         
-        logger.info(f"File uploaded successfully: {unique_filename}")
+        logger.info(f"File uploaded successfully: {unique_filename} (blob {upload.sha256[:12]})")
         
         return UploadResponse(
             filename=unique_filename,
             original_name=file.filename,
-            size=file_size,
+            size=upload.size,
             message="File uploaded successfully"
         )
     
     except Exception as e:
+        upload.discard()
         logger.error(f"Upload failed: {str(e)}")
         raise HTTPException(status_code=500, detail="Upload failed")
 
+async def fetch_search_results(q: str) -> SearchResponse:
+    """Run a YouTube search and keep only playable results"""
+    logger.info(f"Searching for: {q}")
+    
+    # A search during warm-up waits for the import, outside the search deadline
+    if YOUTUBE_SEARCH_AVAILABLE and SEARCH_BACKEND == "youtube":
+        await youtube_search.wait()
+    
+    # Search YouTube with additional parameters
+    with search_latency.time():
+        results = await search_backend.search(q, limit=20, region='US', language='en')
+    
+    if not results or 'result' not in results:
+        logger.warning(f"No results found for query: {q}")
+        return SearchResponse(results=[], total=0)
+    
+    search_results = []
+    
+    for video in results['result']:
+        try:
+            # Skip shorts and very short videos
+            duration = video.get('duration', '0:00')
+            if 'Shorts' in video.get('title', '') or duration in ['0:00', None]:
+                continue
+            
+            search_result = SearchResult(
+                id=video['id'],
+                title=video['title'],
+                channel=video['channel']['name'],
+                duration=duration,
+                thumbnail=video['thumbnails'][0]['url'] if video.get('thumbnails') else '',
+                url=video['link']
+            )
+            search_results.append(search_result)
+        except KeyError as e:
+            logger.warning(f"Skipping video due to missing field: {e}")
+            continue
+    
+    logger.info(f"Found {len(search_results)} valid results")
+    return SearchResponse(
+        results=search_results,
+        total=len(search_results)
+    )
+
 @app.get("/search", response_model=SearchResponse)
-async def search_youtube(q: str = Query(..., description="Search query")):
+async def search_youtube(request: Request, q: str = Query(..., description="Search query")):
     """Search YouTube for videos with enhanced error handling"""
     
-    if not YOUTUBE_SEARCH_AVAILABLE:
+    if search_backend is None:
         raise HTTPException(
             status_code=503,
             detail="YouTube search not available. Please install youtube-search-python"
@@ -223,44 +648,18 @@ async def search_youtube(q: str = Query(..., description="Search query")):
         raise HTTPException(status_code=400, detail="Search query cannot be empty")
     
     try:
-        logger.info(f"Searching for: {q}")
-        
-        # Search YouTube with additional parameters
-        videos_search = VideosSearch(q, limit=20, region='US', language='en')
-        results = videos_search.result()
-        
-        if not results or 'result' not in results:
-            logger.warning(f"No results found for query: {q}")
-            return SearchResponse(results=[], total=0)
-        
-        search_results = []
-        
-        for video in results['result']:
-            try:
-                # Skip shorts and very short videos
-                duration = video.get('duration', '0:00')
-                if 'Shorts' in video.get('title', '') or duration in ['0:00', None]:
-                    continue
-                
-                search_result = SearchResult(
-                    id=video['id'],
-                    title=video['title'],
-                    channel=video['channel']['name'],
-                    duration=duration,
-                    thumbnail=video['thumbnails'][0]['url'] if video.get('thumbnails') else '',
-                    url=video['link']
-                )
-                search_results.append(search_result)
-            except KeyError as e:
-                logger.warning(f"Skipping video due to missing field: {e}")
-                continue
-        
-        logger.info(f"Found {len(search_results)} valid results")
-        return SearchResponse(
-            results=search_results,
-            total=len(search_results)
+        # Filtered responses are cached per normalized query
+        return await cancel_on_disconnect(
+            request,
+            search_cache.get_or_load(normalize_query(q), lambda: fetch_search_results(q))
         )
     
+    except SearchTimeout as e:
+        logger.warning(str(e))
+        raise HTTPException(status_code=504, detail="Search timed out, please try again")
+    except ClientDisconnected:
+        logger.info(f"Client disconnected during search: {q}")
+        raise HTTPException(status_code=499, detail="Client closed request")
     except Exception as e:
         logger.error(f"Search failed: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
@@ -287,190 +686,433 @@ def get_yt_dlp_options():
         }
     }
 
-@app.get("/play/{video_id}")
-async def get_stream_url(video_id: str):
-    """Get streamable URL for a YouTube video with caching and fallbacks"""
-    
-    if not YT_DLP_AVAILABLE:
+class ExtractionError(Exception):
+    """Extraction failure carrying a user-facing error response"""
+
+    def __init__(self, error: str, detail: str, suggestions: List[str] = None):
+        super().__init__(detail)
+        self.error = error
+        self.detail = detail
+        self.suggestions = suggestions or []
+
+    def to_response(self) -> ErrorResponse:
+        return create_error_response(self.error, self.detail, self.suggestions)
+
+def extraction_error_response(video_id: str, e: Exception) -> ErrorResponse:
+    """Map a failed stream resolution to the error shown to the client"""
+    if isinstance(e, ExtractionError):
+        return e.to_response()
+    if isinstance(e, ExtractionQueueFull):
+        logger.warning(f"Extraction queue full, rejecting {video_id}")
         return create_error_response(
-            "Service Unavailable",
-            "yt-dlp not available. Please install yt-dlp",
-            ["Install yt-dlp: pip install yt-dlp", "Try uploading local files instead"]
+            "Server Busy",
+            "Too many songs are loading right now",
+            ["Try again in a few moments"]
         )
+    if isinstance(e, ExtractionTimeout):
+        logger.error(f"Extraction timed out for {video_id}")
+        return create_error_response(
+            "Extraction Timeout",
+            f"Loading this video took longer than {EXTRACTION_TIMEOUT:.0f}s",
+            ["Try again in a few moments", "Try a different video"]
+        )
+    logger.error(f"Unexpected error getting stream URL for {video_id}: {str(e)}")
+    return create_error_response(
+        "Internal Error",
+        f"An unexpected error occurred: {str(e)[:100]}",
+        [
+            "Try again in a few moments",
+            "Check your internet connection",
+            "Try a different video"
+        ]
+    )
+
+def extract_stream(video_id: str) -> ExtractionResult:
+    """Run yt-dlp for a video and pick an audio stream (blocking, runs on the extraction pool)"""
+    logger.info(f"Extracting stream URL for video: {video_id}")
+    yt_dlp = ytdlp.load()
     
-    # Check cache first
-    cache_key = f"{video_id}_{datetime.now().strftime('%Y%m%d%H')}"
-    if cache_key in stream_cache:
-        cached_data = stream_cache[cache_key]
-        if datetime.now() - cached_data['timestamp'] < CACHE_DURATION:
-            logger.info(f"Returning cached URL for {video_id}")
-            return PlayResponse(**cached_data['data'])
-    
-    try:
-        logger.info(f"Extracting stream URL for video: {video_id}")
-        
-        ydl_opts = get_yt_dlp_options()
+    with ydl_pool.checkout() as ydl:
+        video_url = f"https://www.youtube.com/watch?v={video_id}"
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            video_url = f"https://www.youtube.com/watch?v={video_id}"
-            
-            try:
-                # Extract info
+        try:
+            # Extract info
+            with ytdlp_latency.time():
                 info = ydl.extract_info(video_url, download=False)
-            except yt_dlp.utils.DownloadError as e:
-                logger.error(f"yt-dlp download error for {video_id}: {str(e)}")
-                error_msg = str(e).lower()
-                
-                if "403" in error_msg or "forbidden" in error_msg:
-                    return create_error_response(
-                        "Access Forbidden",
-                        "This video is currently blocked by YouTube",
-                        [
-                            "Try a different video",
-                            "This is a temporary YouTube restriction",
-                            "The video may be geo-blocked"
-                        ]
-                    )
-                elif "404" in error_msg or "not found" in error_msg:
-                    return create_error_response(
-                        "Video Not Found",
-                        "This video is not available",
-                        [
-                            "The video may have been deleted",
-                            "Check if the video ID is correct",
-                            "Try searching for the song again"
-                        ]
-                    )
-                else:
-                    return create_error_response(
-                        "Extraction Failed",
-                        f"Could not extract video: {str(e)[:100]}",
-                        [
-                            "Try a different video",
-                            "Check your internet connection",
-                            "YouTube may be blocking requests"
-                        ]
-                    )
+        except yt_dlp.utils.DownloadError as e:
+            logger.error(f"yt-dlp download error for {video_id}: {str(e)}")
+            error_msg = str(e).lower()
             
-            if not info:
-                return create_error_response(
-                    "No Video Info",
-                    "Could not retrieve video information",
-                    ["Try a different video", "The video may be private"]
+            if "403" in error_msg or "forbidden" in error_msg:
+                raise ExtractionError(
+                    "Access Forbidden",
+                    "This video is currently blocked by YouTube",
+                    [
+                        "Try a different video",
+                        "This is a temporary YouTube restriction",
+                        "The video may be geo-blocked"
+                    ]
                 )
-            
-            # Get the best audio stream
-            formats = info.get('formats', [])
-            audio_url = None
-            
-            # Priority order for audio formats
-            format_priorities = ['m4a', 'mp3', 'webm', 'mp4']
-            
-            # First try to find audio-only streams
-            for priority in format_priorities:
-                for fmt in formats:
-                    if (fmt.get('acodec') != 'none' and 
-                        fmt.get('vcodec') == 'none' and 
-                        fmt.get('ext') == priority):
-                        audio_url = fmt.get('url')
-                        logger.info(f"Found {priority} audio-only stream")
-                        break
-                if audio_url:
-                    break
-            
-            # If no audio-only format found, try any format with audio
-            if not audio_url:
-                for fmt in formats:
-                    if fmt.get('acodec') != 'none':
-                        audio_url = fmt.get('url')
-                        logger.info(f"Using mixed format: {fmt.get('ext', 'unknown')}")
-                        break
-            
-            if not audio_url:
-                return create_error_response(
-                    "No Audio Stream",
-                    "No playable audio stream found for this video",
+            elif "404" in error_msg or "not found" in error_msg:
+                raise ExtractionError(
+                    "Video Not Found",
+                    "This video is not available",
+                    [
+                        "The video may have been deleted",
+                        "Check if the video ID is correct",
+                        "Try searching for the song again"
+                    ]
+                )
+            else:
+                raise ExtractionError(
+                    "Extraction Failed",
+                    f"Could not extract video: {str(e)[:100]}",
                     [
-                        "This video may not have audio",
                         "Try a different video",
-                        "The video format may not be supported"
+                        "Check your internet connection",
+                        "YouTube may be blocking requests"
                     ]
                 )
-            
-            # Test if the URL is accessible
-            try:
-                response = requests.head(audio_url, timeout=5, headers={
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                })
-                if response.status_code >= 400:
-                    logger.warning(f"Stream URL returned status {response.status_code}")
-            except requests.RequestException as e:
-                logger.warning(f"Could not verify stream URL: {e}")
-            
-            play_response = PlayResponse(
-                stream_url=audio_url,
+        
+        if not info:
+            raise ExtractionError(
+                "No Video Info",
+                "Could not retrieve video information",
+                ["Try a different video", "The video may be private"]
+            )
+        
+        # Rank every stream with audio once; /play picks from the ladder per client
+        selection_start = time.perf_counter()
+        ladder = build_ladder(info.get('formats', []))
+        
+        if not ladder:
+            raise ExtractionError(
+                "No Audio Stream",
+                "No playable audio stream found for this video",
+                [
+                    "This video may not have audio",
+                    "Try a different video",
+                    "The video format may not be supported"
+                ]
+            )
+        
+        result = ladder_result(
+            PlayResponse(
+                stream_url=ladder[0]['url'],
                 title=info.get('title', 'Unknown Title'),
                 duration=info.get('duration_string', 'Unknown')
-            )
-            
-            # Cache the successful response
-            stream_cache[cache_key] = {
-                'data': play_response.dict(),
-                'timestamp': datetime.now()
-            }
-            
-            # Clean old cache entries
-            current_time = datetime.now()
-            expired_keys = [
-                key for key, value in stream_cache.items()
-                if current_time - value['timestamp'] > CACHE_DURATION
-            ]
-            for expired_key in expired_keys:
-                del stream_cache[expired_key]
-            
-            logger.info(f"Successfully extracted stream URL for {video_id}")
-            return play_response
+            ),
+            ladder
+        )
+        format_selection_latency.observe(time.perf_counter() - selection_start)
+        logger.info(f"Extracted {len(ladder)} audio variants for {video_id}, "
+                    f"default format {result.play.variant['format_id']} ({result.play.variant['container']})")
+        return result
+
+def ladder_result(play: PlayResponse, ladder: List[dict]) -> ExtractionResult:
+    """Index a ladder; its default variant is the stream that gets verified"""
+    index = build_index(ladder)
+    default = ladder[select_chain(index, *client_hints({}))[0]]
+    return ExtractionResult(
+        play=play.copy(update={'stream_url': default['url'], 'variant': describe(default)}),
+        ladder=ladder,
+        index=index,
+        expires_at=time.time() + stream_cache.ttl_for_url(default['url'])
+    )
+
+def select_play(result: ExtractionResult, quality: str, media_types: List[str]) -> PlayResponse:
+    """The variant matching a client's hints, picked from the already extracted ladder"""
+    chain = select_chain(result.index, quality, media_types)
+    if not chain:
+        # Stored before extractions kept a ladder: only one stream is known
+        return result.play
+    variant = result.ladder[chain[0]]
+    return result.play.copy(update={'stream_url': variant['url'], 'variant': describe(variant)})
+
+async def verify_stream(video_id: str, result: ExtractionResult, fresh: bool) -> ExtractionResult:
+    """Check the default variant and drop it for the next one if upstream rejects it"""
+    if url_validator is None or not url_validator.should_verify(fresh):
+        return result
+    
+    if result.ladder:
+        chain = select_chain(result.index, *client_hints({}))[:1 + STREAM_FALLBACKS]
+        urls = [result.ladder[position]['url'] for position in chain]
+    else:
+        urls = [result.play.stream_url]
     
+    with verification_latency.time():
+        for tried, url in enumerate(urls):
+            # True (serves) or None (could not tell) are both good enough to play
+            if await url_validator.check(url) is not False:
+                if tried:
+                    rejected = set(urls[:tried])
+                    result = ladder_result(result.play, [v for v in result.ladder if v['url'] not in rejected])
+                    logger.info(f"Falling back to format {result.play.variant['format_id']} for {video_id}")
+                return result
+    
+    raise ExtractionError(
+        "Stream Unavailable",
+        "YouTube rejected every audio stream for this video",
+        ["Try again in a few moments", "Try a different video"]
+    )
+
+async def verify_stored(video_id: str, stored: Optional[dict]) -> Optional[ExtractionResult]:
+    """A stored result that still verifies; a rejected one is deleted so it gets re-extracted"""
+    if stored is None:
+        return None
+    try:
+        result = await verify_stream(video_id, ExtractionResult(**stored), fresh=False)
+    except ExtractionError:
+        logger.info(f"Stored URLs for {video_id} were rejected, extracting again")
+        await extraction_store.delete(video_id)
+        return None
+    logger.info(f"Returning stored URL for {video_id}")
+    return result
+
+async def resolve_stream(video_id: str) -> ExtractionResult:
+    """Resolve a stream from disk or yt-dlp and cache it (runs once per in-flight video)"""
+    # Read through to the on-disk store before paying for an extraction
+    result = await verify_stored(video_id, await extraction_store.get(video_id))
+    leased = False
+    if result is None and EXTRACTION_LEASES:
+        # Another worker process may already be extracting this video
+        stored, leased = await extraction_store.lease(
+            video_id, WORKER_ID,
+            ttl=EXTRACTION_LEASE_TTL,
+            wait_timeout=EXTRACTION_TIMEOUT,
+            poll_interval=EXTRACTION_LEASE_POLL
+        )
+        result = await verify_stored(video_id, stored)
+    if result is None:
+        try:
+            # Import yt-dlp first if warm-up has not, so it does not eat the extraction timeout
+            await ytdlp.wait()
+            # Extraction blocks for seconds, so it runs on the bounded pool
+            result = await extraction_pool.run(extract_stream, video_id)
+            result = await verify_stream(video_id, result, fresh=True)
+            extraction_store.put(video_id, result.dict(), result.expires_at)
+        finally:
+            if leased:
+                # Writes the result first, so waiting workers find it once the lease is gone
+                await extraction_store.release(video_id, WORKER_ID)
+    
+    # Cache the whole ladder until shortly before its URLs expire
+    stream_cache.set(video_id, result, ttl=result.expires_at - time.time())
+    
+    return result
+
+def cached_audio_play(video_id: str, request: Request) -> Optional[PlayResponse]:
+    """Point hot tracks kept on disk at /stream, with no extraction at all"""
+    cached_audio = audio_cache.get(video_id, count=False) if audio_cache else None
+    if cached_audio is None:
+        return None
+    return PlayResponse(
+        stream_url=str(request.url_for("stream_audio", video_id=video_id)),
+        title=cached_audio["title"] or "Unknown Title"
+    )
+
+def ytdlp_unavailable_response() -> ErrorResponse:
+    return create_error_response(
+        "Service Unavailable",
+        "yt-dlp not available. Please install yt-dlp",
+        ["Install yt-dlp: pip install yt-dlp", "Try uploading local files instead"]
+    )
+
+async def lookup_stream(video_id: str) -> ExtractionResult:
+    """Extraction from the cache or a (shared) extraction; raises on failure"""
+    cached = stream_cache.get(video_id)
+    if cached is not None:
+        logger.info(f"Returning cached URL for {video_id}")
+        return cached
+    # Concurrent requests for the same video share one extraction
+    return await inflight_extractions.do(video_id, lambda: resolve_stream(video_id))
+
+@app.post("/play/batch")
+async def play_batch(batch: BatchPlayRequest, request: Request):
+    """Resolve several videos at once (e.g. to prefetch a queue).
+    
+    Streams one NDJSON line per video as soon as it is resolved:
+    {"id": ..., "play": PlayResponse} or {"id": ..., "error": ErrorResponse}.
+    Videos still unresolved at the deadline get an error line; their
+    extractions keep running and land in the cache for later. Variants are
+    picked as for /play, from ``quality``/``data_saver`` and the headers.
+    """
+    ids = list(dict.fromkeys(batch.ids))
+    if not ids:
+        raise HTTPException(status_code=400, detail="No video IDs given")
+    if len(ids) > PLAY_BATCH_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {PLAY_BATCH_MAX_IDS} video IDs per batch")
+    try:
+        hints = client_hints(request.headers, batch.quality, batch.data_saver)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not YT_DLP_AVAILABLE:
+        return ytdlp_unavailable_response()
+    
+    deadline = min(batch.deadline or PLAY_BATCH_DEADLINE, PLAY_BATCH_DEADLINE)
+    semaphore = asyncio.Semaphore(PLAY_BATCH_CONCURRENCY)
+    
+    async def resolve_entry(video_id: str) -> dict:
+        play = cached_audio_play(video_id, request)
+        if play is None:
+            try:
+                async with semaphore:
+                    play = select_play(await lookup_stream(video_id), *hints)
+            except Exception as e:
+                return {'id': video_id, 'error': extraction_error_response(video_id, e).dict()}
+        return {'id': video_id, 'play': play.dict()}
+    
+    async def results():
+        loop = asyncio.get_running_loop()
+        stop_at = loop.time() + deadline
+        tasks = {asyncio.ensure_future(resolve_entry(video_id)): video_id for video_id in ids}
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(0.0, stop_at - loop.time()), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    break
+                for task in done:
+                    yield json.dumps(task.result()) + "\n"
+            for task in pending:
+                timeout_error = create_error_response(
+                    "Batch Deadline",
+                    f"Not resolved within {deadline:.0f}s",
+                    ["Request this video again shortly"]
+                )
+                yield json.dumps({'id': tasks[task], 'error': timeout_error.dict()}) + "\n"
+        finally:
+            # Only the waiting is cancelled; shared extractions run to completion
+            for task in pending:
+                task.cancel()
+    
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+@app.get("/play/{video_id}")
+async def get_stream_url(
+    video_id: str,
+    request: Request,
+    quality: Optional[str] = Query(None, description="high, medium or low; defaults to high"),
+    data_saver: bool = Query(False, description="Prefer the smallest stream, like a Save-Data: on header")
+):
+    """Get streamable URL for a YouTube video with caching and fallbacks.
+    
+    The variant is chosen from the cached format ladder by ``quality``,
+    ``data_saver``/``Save-Data`` and the audio types in ``Accept``.
+    """
+    try:
+        hints = client_hints(request.headers, quality, data_saver)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    play = cached_audio_play(video_id, request)
+    if play is not None:
+        return play
+    
+    if not YT_DLP_AVAILABLE:
+        return ytdlp_unavailable_response()
+    
+    try:
+        play = select_play(await lookup_stream(video_id), *hints)
     except Exception as e:
-        logger.error(f"Unexpected error getting stream URL for {video_id}: {str(e)}")
-        return create_error_response(
-            "Internal Error",
-            f"An unexpected error occurred: {str(e)[:100]}",
-            [
-                "Try again in a few moments",
-                "Check your internet connection",
-                "Try a different video"
-            ]
+        return extraction_error_response(video_id, e)
+    
+    if audio_cache:
+        audio_cache.record_play(video_id, title=play.title)
+    return play
+
+async def current_stream_url(video_id: str) -> str:
+    """Upstream URL for the relay (the default variant), from the cache or a (shared) extraction"""
+    result = await lookup_stream(video_id)
+    return result.play.stream_url
+
+async def forget_stream_url(video_id: str):
+    """Drop a URL upstream rejected so the next lookup extracts a fresh one"""
+    stream_cache.pop(video_id)
+    await extraction_store.delete(video_id)
+
+@app.get("/stream/{video_id}")
+async def stream_audio(video_id: str, request: Request):
+    """Relay YouTube audio through the server so clients never see expiring URLs"""
+    
+    # Cached tracks go through the same Range-capable path as /songs
+    cached_audio = audio_cache.get(video_id) if audio_cache else None
+    if cached_audio is not None:
+        return RangeFileResponse(
+            cached_audio["path"],
+            request.headers,
+            method=request.method,
+            media_type=cached_audio["media_type"],
+            headers={
+                "Cache-Control": "public, max-age=3600",
+                "Access-Control-Allow-Origin": "*"
+            }
         )
+    
+    if not YT_DLP_AVAILABLE or not HTTPX_AVAILABLE:
+        return JSONResponse(status_code=503, content=create_error_response(
+            "Service Unavailable",
+            "Streaming relay needs yt-dlp and httpx",
+            ["Install them: pip install yt-dlp httpx", "Use /play/{video_id} instead"]
+        ).dict())
+    
+    range_header = request.headers.get("range")
+    try:
+        stream = await stream_relay.open(video_id, range_header)
+    except UpstreamError as e:
+        logger.error(f"Relay failed for {video_id}: {e}")
+        return JSONResponse(status_code=502, content=create_error_response(
+            "Upstream Error",
+            "YouTube did not deliver the audio stream",
+            ["Try again in a few moments", "Try a different video"]
+        ).dict())
+    except Exception as e:
+        return JSONResponse(status_code=502, content=extraction_error_response(video_id, e).dict())
+    
+    # Seeks arrive as further Range requests; only a start from the top is a play
+    if audio_cache and (range_header is None or range_header.replace(" ", "").startswith("bytes=0-")):
+        result = stream_cache.get(video_id, count=False)
+        audio_cache.record_play(video_id, title=result.play.title if result else None)
+    
+    return StreamingResponse(
+        stream.body(),
+        status_code=stream.status_code,
+        headers={
+            **stream.headers,
+            "Cache-Control": "no-store",
+            "Access-Control-Allow-Origin": "*"
+        }
+    )
 
 @app.get("/library")
-async def get_library():
+async def get_library(
+    limit: int = Query(100, ge=1, le=1000, description="Songs per page"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    sort: str = Query("modified", description=f"One of: {', '.join(SORT_FIELDS)}"),
+    order: str = Query("desc", description="asc or desc"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return")
+):
     """Get list of uploaded songs with metadata"""
+    if sort not in SORT_FIELDS:
+        raise HTTPException(status_code=400, detail=f"Unknown sort field. Allowed: {', '.join(SORT_FIELDS)}")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="Order must be asc or desc")
+    
+    projection = None
+    if fields:
+        projection = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = set(projection) - set(SONG_FIELDS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    
     try:
-        songs = []
-        
-        if UPLOAD_DIR.exists():
-            for file_path in UPLOAD_DIR.iterdir():
-                if file_path.is_file() and file_path.suffix.lower() in ALLOWED_EXTENSIONS:
-                    stat = file_path.stat()
-                    songs.append({
-                        'id': file_path.name,
-                        'filename': file_path.name,
-                        'original_name': file_path.stem,
-                        'size': stat.st_size,
-                        'modified': stat.st_mtime,
-                        'url': f'/songs/{file_path.name}',
-                        'source': 'local'
-                    })
-        
-        # Sort by modification time (newest first)
-        songs.sort(key=lambda x: x['modified'], reverse=True)
-        
-        return {
-            'songs': songs,
-            'total': len(songs)
-        }
+        # Served from the index, so a page costs O(page size) with no file I/O
+        return library_index.page(sort=sort, order=order, limit=limit, cursor=cursor, fields=projection)
     
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Failed to get library: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get library")
@@ -484,7 +1126,11 @@ async def delete_song(filename: str):
         raise HTTPException(status_code=404, detail="File not found")
     
     try:
-        file_path.unlink()
+        # Uploads made before the blob store existed are plain files
+        if not blob_store.unlink(filename):
+            file_path.unlink()
+        library_index.remove(filename)
+        analysis_pipeline.remove(filename)
         logger.info(f"File deleted successfully: {filename}")
         return {"message": f"File {filename} deleted successfully"}
     
@@ -492,6 +1138,59 @@ async def delete_song(filename: str):
         logger.error(f"Failed to delete file {filename}: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to delete file")
 
+def debug_extract(video_id: str) -> dict:
+    """Verbose yt-dlp extraction for the debug endpoint (blocking)"""
+    with ydl_pool.checkout() as ydl:
+        video_url = f"https://www.youtube.com/watch?v={video_id}"
+        # The instance is ours until it is returned, so its options can be bent briefly
+        ydl.params['verbose'] = True
+        try:
+            info = ydl.extract_info(video_url, download=False)
+        finally:
+            ydl.params['verbose'] = False
+        
+        debug_info = {
+            'title': info.get('title'),
+            'duration': info.get('duration'),
+            'uploader': info.get('uploader'),
+            'formats_count': len(info.get('formats', [])),
+            'available_formats': []
+        }
+        
+        for fmt in info.get('formats', [])[:5]:  # Show first 5 formats
+            debug_info['available_formats'].append({
+                'format_id': fmt.get('format_id'),
+                'ext': fmt.get('ext'),
+                'acodec': fmt.get('acodec'),
+                'vcodec': fmt.get('vcodec'),
+                'url_available': bool(fmt.get('url'))
+            })
+        
+        return debug_info
+
+@app.get("/debug/profiles")
+async def list_profiles():
+    """Stored request profiles, newest first"""
+    if request_profiler is None:
+        raise HTTPException(status_code=404, detail="Profiling is disabled (set PROFILER_MODE)")
+    return {
+        'profiler': request_profiler.stats(),
+        'profiles': list(reversed(request_profiler.profiles))
+    }
+
+@app.get("/debug/profiles/{name}")
+async def get_profile(name: str, request: Request):
+    """Download one profile (gzipped collapsed stacks, e.g. for speedscope)"""
+    path = request_profiler.path_for(name) if request_profiler else None
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return RangeFileResponse(
+        path,
+        request.headers,
+        media_type="application/gzip",
+        headers={"Content-Disposition": f'attachment; filename="{name}"'}
+    )
+
 @app.get("/debug/{video_id}")
 async def debug_video(video_id: str):
     """Debug endpoint to test video extraction"""
@@ -499,31 +1198,7 @@ async def debug_video(video_id: str):
         return {"error": "yt-dlp not available"}
     
     try:
-        ydl_opts = get_yt_dlp_options()
-        ydl_opts['verbose'] = True
-        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            video_url = f"https://www.youtube.com/watch?v={video_id}"
-            info = ydl.extract_info(video_url, download=False)
-            
-            debug_info = {
-                'title': info.get('title'),
-                'duration': info.get('duration'),
-                'uploader': info.get('uploader'),
-                'formats_count': len(info.get('formats', [])),
-                'available_formats': []
-            }
-            
-            for fmt in info.get('formats', [])[:5]:  # Show first 5 formats
-                debug_info['available_formats'].append({
-                    'format_id': fmt.get('format_id'),
-                    'ext': fmt.get('ext'),
-                    'acodec': fmt.get('acodec'),
-                    'vcodec': fmt.get('vcodec'),
-                    'url_available': bool(fmt.get('url'))
-                })
-            
-            return debug_info
+        return await extraction_pool.run(debug_extract, video_id)
     
     except Exception as e:
         return {"error": str(e)}
@@ -531,11 +1206,12 @@ async def debug_video(video_id: str):
 # Error handlers
 @app.exception_handler(404)
 async def not_found_handler(request, exc):
-    return {"error": "Not found", "detail": "The requested resource was not found"}
+    detail = exc.detail if isinstance(exc, HTTPException) else "The requested resource was not found"
+    return JSONResponse(status_code=404, content={"error": "Not found", "detail": detail})
 
 @app.exception_handler(500)
 async def internal_error_handler(request, exc):
-    return {"error": "Internal server error", "detail": "An unexpected error occurred"}
+    return JSONResponse(status_code=500, content={"error": "Internal server error", "detail": "An unexpected error occurred"})
 
 # Startup event
 @app.on_event("startup")
@@ -558,6 +1234,49 @@ async def startup_event():
     STATIC_DIR.mkdir(exist_ok=True)
     CACHE_DIR.mkdir(exist_ok=True)
     
+    # Only one worker cleans up after a previous crash: orphaned blobs and temp
+    # files from cut-off uploads, sparing anything other workers wrote since
+    is_leader = leader.acquire()
+    library_index.read_only = not is_leader
+    blob_store.load(cleanup=is_leader, older_than=STARTED_AT)
+    if is_leader:
+        stale_uploads = (remove_stale_uploads(UPLOAD_DIR, STARTED_AT)
+                         + remove_stale_uploads(blob_store.root, STARTED_AT))
+        if stale_uploads:
+            logger.info(f"Removed {stale_uploads} incomplete uploads")
+    
+    if audio_cache:
+        audio_cache.load()
+    if request_profiler:
+        request_profiler.load()
+    
+    # Load the library index and catch up with files changed while we were down
+    library_index.load()
+    await library_index.reconcile()
+    app.state.library_maintenance = asyncio.create_task(
+        library_index.run_maintenance(LIBRARY_SAVE_INTERVAL, LIBRARY_RESCAN_INTERVAL)
+    )
+    
+    # Take over if the leader exits
+    async def watch_leader():
+        while not leader.acquire():
+            await asyncio.sleep(LIBRARY_RESCAN_INTERVAL)
+        library_index.read_only = False
+        await library_index.reconcile()
+    app.state.leader_watch = None if is_leader else asyncio.create_task(watch_leader())
+    
+    # Import yt-dlp and the search client, then build the YoutubeDL instances,
+    # in the background: requests are served meanwhile and wait only if they need them
+    async def warm_ydl_pool():
+        if ytdlp.state == "warm":
+            await asyncio.get_running_loop().run_in_executor(None, ydl_pool.warm)
+    warmup.start(warm_ydl_pool)
+    
+    # Keep the extraction store small by dropping expired results
+    app.state.store_compaction = asyncio.create_task(
+        extraction_store.run_compaction(EXTRACTION_STORE_COMPACT_INTERVAL)
+    )
+    
     logger.info("SpotifyClone API started successfully!")
 
 # Shutdown event
@@ -565,15 +1284,58 @@ async def startup_event():
 async def shutdown_event():
     """Cleanup on application shutdown"""
     logger.info("SpotifyClone API shutting down...")
+    warmup.cancel()
+    app.state.store_compaction.cancel()
+    app.state.library_maintenance.cancel()
+    if app.state.leader_watch:
+        app.state.leader_watch.cancel()
+    library_index.save()
+    blob_store.close()
+    leader.release()
+    if audio_cache:
+        audio_cache.save()
+    await extraction_store.close()
+    await stream_relay.close()
+    if url_validator:
+        await url_validator.close()
+    extraction_pool.shutdown()
+    ydl_pool.close()
+    metadata_pipeline.shutdown()
+    analysis_pipeline.shutdown()
+    if search_backend:
+        search_backend.close()
 
 if __name__ == "__main__":
+    import argparse
     import uvicorn
-        
-    # Run the server
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
-        log_level="info"
-    )
\ No newline at end of file
+    
+    parser = argparse.ArgumentParser(description="Run the SpotifyClone API")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--workers", default=os.getenv("WORKERS", "1"),
+        help="Server processes, or 'auto' for one per CPU core. More than one is "
+             "production mode (no auto-reload, shared extraction cache)"
+    )
+    args = parser.parse_args()
+    workers = (os.cpu_count() or 1) if args.workers == "auto" else int(args.workers)
+    
+    if workers > 1:
+        # Workers import this module afresh and read their mode from the environment
+        os.environ["WORKERS"] = str(workers)
+        uvicorn.run(
+            "main:app",
+            host=args.host,
+            port=args.port,
+            workers=workers,
+            log_level="info"
+        )
+    else:
+        # Development: one process that restarts on code changes
+        uvicorn.run(
+            "main:app",
+            host=args.host,
+            port=args.port,
+            reload=True,
+            log_level="info"
+        )
\ No newline at end of file
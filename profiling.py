@@ -0,0 +1,252 @@
+"""
+SpotifyClone request profiler - sampled stack profiles of slow requests, kept in a ring directory
+"""
+
+import asyncio
+import gzip
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILER_MODES = ("off", "slow", "sample")
+# Frames kept per stack, innermost dropped first
+MAX_STACK_DEPTH = 128
+PROFILE_NAME_RE = re.compile(r"^[A-Za-z0-9_.-]+\.folded\.gz$")
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Background thread that samples the stacks of every thread while sessions are active.
+
+    Sampling all threads (not just the event loop) is what shows yt-dlp,
+    search and analysis work running on executor threads. A session
+    collects collapsed stacks (``thread;outer;...;inner``) with their sample
+    counts; concurrent sessions see the same samples, so a profile of one
+    request also shows whatever else the process was doing meanwhile.
+
+    Each sample walks every thread's stack while holding the GIL, so it
+    slows the whole process down for as long as any session is active. A
+    session started with ``delay`` only becomes active that many seconds
+    later; until then, and when there are no sessions, the thread sleeps.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        # [monotonic time the session becomes active, stacks]
+        self._sessions: List[List[Any]] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.samples = 0
+
+    def start_session(self, delay: float = 0.0) -> Counter:
+        session = Counter()
+        with self._lock:
+            self._sessions.append([time.monotonic() + delay, session])
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+        return session
+
+    def end_session(self, session: Counter):
+        with self._lock:
+            self._sessions = [entry for entry in self._sessions if entry[1] is not session]
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            with self._lock:
+                starts = [start for start, _ in self._sessions]
+            now = time.monotonic()
+            if not starts or min(starts) > now:
+                # Idle until a request starts a session or one becomes active
+                self._wake.wait(min(starts) - now if starts else None)
+                self._wake.clear()
+                continue
+
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                labels = []
+                while frame is not None and len(labels) < MAX_STACK_DEPTH:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(thread_id, str(thread_id)))
+                stacks.append(";".join(reversed(labels)))
+            with self._lock:
+                # Under the lock, so an ended session is never written to again
+                for start, session in self._sessions:
+                    if start <= now:
+                        session.update(stacks)
+            self.samples += 1
+            time.sleep(self.interval)
+
+
+class RequestProfiler:
+    """Decides which requests to profile and keeps the newest profiles on disk.
+
+    ``slow`` starts sampling a request once it has run for ``threshold``
+    seconds, so requests that finish sooner cost no sampling, and keeps the
+    profile if it took at least that long; the profile shows where the
+    request spent its time past the threshold. ``sample`` samples a random
+    ``sample_rate`` fraction of requests from the start and keeps them
+    whatever their latency. Profiles
+    are gzipped collapsed stacks (readable by speedscope or flamegraph.pl)
+    in ``root``; only the newest ``max_profiles`` are kept.
+    """
+
+    def __init__(self, root: Path, mode: str = "slow", threshold: float = 2.0,
+                 sample_rate: float = 0.01, interval: float = 0.005, max_profiles: int = 50,
+                 exclude: Iterable[str] = ()):
+        if mode not in PROFILER_MODES or mode == "off":
+            raise ValueError(f"Unknown profiler mode {mode!r}")
+        self.root = Path(root)
+        self.index_path = self.root / "index.json"
+        self.mode = mode
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.max_profiles = max_profiles
+        self.exclude = tuple(exclude)
+        self.sampler = StackSampler(interval)
+        self.profiles: List[Dict[str, Any]] = []
+        self._sequence = 0
+        self._write_lock = threading.Lock()
+        self.profiled = 0
+        self.kept = 0
+
+    def load(self):
+        """Read the index and drop profiles it does not list"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        if self.index_path.exists():
+            try:
+                self.profiles = json.loads(self.index_path.read_text())
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not read profile index, starting empty: {e}")
+                self.profiles = []
+        self.profiles = [entry for entry in self.profiles if (self.root / entry["name"]).exists()]
+        known = {entry["name"] for entry in self.profiles} | {self.index_path.name}
+        for path in self.root.iterdir():
+            if path.is_file() and path.name not in known:
+                path.unlink()
+        self._save_index()
+
+    def _save_index(self):
+        temp_path = self.index_path.with_suffix(".tmp")
+        temp_path.write_text(json.dumps(self.profiles))
+        os.replace(temp_path, self.index_path)
+
+    def wants(self, path: str) -> bool:
+        if path.startswith(self.exclude):
+            return False
+        return self.mode == "slow" or random.random() < self.sample_rate
+
+    def sample_after(self) -> float:
+        """Seconds into a request before its stacks are sampled"""
+        return self.threshold if self.mode == "slow" else 0.0
+
+    def keep(self, duration: float) -> bool:
+        return self.mode == "sample" or duration >= self.threshold
+
+    def write(self, stacks: Counter, meta: Dict[str, Any]):
+        """Compress a profile into the ring (blocking, runs on an executor thread)"""
+        try:
+            self._write(stacks, meta)
+        except OSError as e:
+            logger.error(f"Could not write profile of {meta['path']}: {e}")
+
+    def _write(self, stacks: Counter, meta: Dict[str, Any]):
+        with self._write_lock:
+            self._sequence += 1
+            slug = re.sub(r"[^A-Za-z0-9]+", "_", meta["path"]).strip("_")[:48] or "root"
+            name = f"{int(meta['started_at'] * 1000)}-{self._sequence}-{meta['method']}-{slug}.folded.gz"
+            body = "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+            with gzip.open(self.root / name, "wt", compresslevel=6) as f:
+                f.write(body)
+
+            self.profiles.append({**meta, "name": name, "stacks": sum(stacks.values())})
+            while len(self.profiles) > self.max_profiles:
+                oldest = self.profiles.pop(0)
+                (self.root / oldest["name"]).unlink(missing_ok=True)
+            self._save_index()
+            self.kept += 1
+        logger.info(f"Profiled {meta['method']} {meta['path']} ({meta['duration_ms']}ms) -> {name}")
+
+    def path_for(self, name: str) -> Optional[Path]:
+        """Path of a listed profile, or None (names are never joined unchecked)"""
+        if not PROFILE_NAME_RE.match(name) or not any(entry["name"] == name for entry in self.profiles):
+            return None
+        return self.root / name
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "threshold_s": self.threshold,
+            "sample_rate": self.sample_rate,
+            "profiled": self.profiled,
+            "kept": self.kept,
+            "stored": len(self.profiles),
+            "samples": self.sampler.samples,
+        }
+
+
+class ProfilerMiddleware:
+    """Runs the stack sampler for the requests the profiler picks.
+
+    The middleware is only installed when profiling is enabled, so with
+    the profiler off requests pay nothing. Responses are timed until their
+    last chunk, and writing a profile happens off the event loop.
+    """
+
+    def __init__(self, app: Callable, profiler: RequestProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable):
+        if scope["type"] != "http" or not self.profiler.wants(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message: dict):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        self.profiler.profiled += 1
+        started_at = time.time()
+        start = time.perf_counter()
+        session = self.profiler.sampler.start_session(self.profiler.sample_after())
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.profiler.sampler.end_session(session)
+            duration = time.perf_counter() - start
+            if self.profiler.keep(duration) and session:
+                meta = {
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "query": scope.get("query_string", b"").decode("latin-1"),
+                    "status": status,
+                    "started_at": started_at,
+                    "duration_ms": round(duration * 1000, 1),
+                }
+                asyncio.get_running_loop().run_in_executor(None, self.profiler.write, session, meta)
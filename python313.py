@@ -9,8 +9,8 @@ import warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
 try:
-    from fastapi import FastAPI, File, UploadFile, HTTPException, Query
-    from fastapi.responses import FileResponse
+    from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Request
+    from fastapi.responses import FileResponse, Response
     from fastapi.staticfiles import StaticFiles
     from fastapi.middleware.cors import CORSMiddleware
 except ImportError as e:
@@ -18,27 +18,34 @@ except ImportError as e:
     print("Please run: python install.py")
     sys.exit(1)
 
+import asyncio
 import os
 import uuid
 from pathlib import Path
 import logging
 from typing import List, Optional
 
-# Try to import optional dependencies
-try:
-    from youtubesearchpython import VideosSearch
-    YOUTUBE_SEARCH_AVAILABLE = True
-except ImportError:
-    YOUTUBE_SEARCH_AVAILABLE = False
+from lazy_imports import LazyModule, Warmup
+
+# Optional dependencies: located now, imported in the background after startup
+youtube_search = LazyModule("youtubesearchpython")
+YOUTUBE_SEARCH_AVAILABLE = youtube_search.installed
+if not YOUTUBE_SEARCH_AVAILABLE:
     print("⚠️  YouTube search not available. Install: pip install youtube-search-python")
 
-try:
-    import yt_dlp
-    YT_DLP_AVAILABLE = True
-except ImportError:
-    YT_DLP_AVAILABLE = False
+ytdlp = LazyModule("yt_dlp")
+YT_DLP_AVAILABLE = ytdlp.installed
+if not YT_DLP_AVAILABLE:
     print("⚠️  yt-dlp not available. Install: pip install yt-dlp")
 
+warmup = Warmup([youtube_search, ytdlp])
+
+from search_backend import ClientDisconnected, SearchTimeout, cancel_on_disconnect, create_search_backend
+from ydl_pool import YoutubeDLPool
+from trending import TrendingService
+from file_serving import etag_matches
+from rate_limit import RateLimiter, RateLimitMiddleware, parse_limit
+
 try:
     import aiofiles
     AIOFILES_AVAILABLE = True
@@ -76,6 +83,8 @@ try:
     class HealthResponse(BaseModel):
         status: str
         message: str
+        warmup: Optional[dict] = None
+        trending: Optional[dict] = None
         
 except ImportError as e:
     print(f"❌ Pydantic import error: {e}")
@@ -98,6 +107,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-client token buckets for the expensive routes ("REQUESTS/SECONDS" or
+# "off"), checked before the request reaches the app
+if os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes"):
+    app.add_middleware(
+        RateLimitMiddleware,
+        limiter=RateLimiter(
+            {
+                "/play": parse_limit(os.getenv("RATE_LIMIT_PLAY", "30/60")),
+                "/search": parse_limit(os.getenv("RATE_LIMIT_SEARCH", "60/60")),
+                "/upload": parse_limit(os.getenv("RATE_LIMIT_UPLOAD", "10/60")),
+            },
+            key=os.getenv("RATE_LIMIT_KEY", "ip"),
+            api_keys=[key.strip() for key in os.getenv("RATE_LIMIT_API_KEYS", "").split(",") if key.strip()],
+            trusted_proxies=int(os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "0")),
+            max_clients=int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "100000"))
+        )
+    )
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -105,12 +132,67 @@ logger = logging.getLogger(__name__)
 # Configuration
 UPLOAD_DIR = Path("uploads")
 STATIC_DIR = Path("static")
+CACHE_DIR = Path("cache")
 UPLOAD_DIR.mkdir(exist_ok=True)
 STATIC_DIR.mkdir(exist_ok=True)
+CACHE_DIR.mkdir(exist_ok=True)
 
 ALLOWED_EXTENSIONS = {".mp3", ".wav", ".m4a", ".flac", ".ogg"}
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
 
+# Search runs on its own threads with a concurrency cap and deadline
+search_backend = create_search_backend(
+    os.getenv("SEARCH_BACKEND", "youtube"),
+    client=(lambda *args, **kwargs: youtube_search.load().VideosSearch(*args, **kwargs))
+    if YOUTUBE_SEARCH_AVAILABLE else None,
+    max_concurrency=int(os.getenv("SEARCH_CONCURRENCY", "8")),
+    timeout=float(os.getenv("SEARCH_TIMEOUT", "10"))
+)
+
+async def search_trending(query: str, limit: int) -> dict:
+    if YOUTUBE_SEARCH_AVAILABLE:
+        await youtube_search.wait()
+    return await search_backend.search(query, limit=limit)
+
+# Trending: every query searched in the background each TRENDING_REFRESH_INTERVAL
+# seconds and merged into one snapshot that /trending serves from memory
+TRENDING_QUERIES = [
+    query.strip()
+    for query in os.getenv("TRENDING_QUERIES", "trending music 2024,popular songs,top hits,viral music").split(",")
+    if query.strip()
+]
+TRENDING_REFRESH_INTERVAL = float(os.getenv("TRENDING_REFRESH_INTERVAL", "1800"))
+TRENDING_RETRY_INTERVAL = float(os.getenv("TRENDING_RETRY_INTERVAL", "60"))
+TRENDING_MAX_RESULTS = int(os.getenv("TRENDING_MAX_RESULTS", "20"))
+# How long a request on a cold start (no saved snapshot) waits for the first refresh
+TRENDING_FIRST_WAIT = float(os.getenv("TRENDING_FIRST_WAIT", "10"))
+trending = TrendingService(
+    search_trending,
+    TRENDING_QUERIES,
+    CACHE_DIR / "trending.json",
+    per_query=10,
+    max_results=TRENDING_MAX_RESULTS,
+    interval=TRENDING_REFRESH_INTERVAL,
+    retry_interval=TRENDING_RETRY_INTERVAL
+) if search_backend else None
+
+# yt-dlp options for stream extraction
+YDL_OPTIONS = {
+    'format': 'bestaudio/best',
+    'quiet': True,
+    'no_warnings': True,
+    'extractaudio': True,
+    'audioformat': 'mp3',
+    'noplaylist': True,
+}
+
+# Pre-built YoutubeDL instances, rebuilt after YDL_POOL_MAX_USES extractions or any error
+ydl_pool = YoutubeDLPool(
+    lambda: ytdlp.load().YoutubeDL(dict(YDL_OPTIONS)),
+    size=int(os.getenv("YDL_POOL_SIZE", "2")),
+    max_uses=int(os.getenv("YDL_POOL_MAX_USES", "100"))
+)
+
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -133,7 +215,9 @@ async def health_check():
     
     return HealthResponse(
         status="healthy",
-        message=f"API operational. Features: {features}"
+        message=f"API operational. Features: {features}",
+        warmup=warmup.stats(),
+        trending=trending.stats() if trending else None
     )
 
 @app.get("/songs/{filename}")
@@ -202,10 +286,10 @@ async def upload_audio(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail="Upload failed")
 
 @app.get("/search", response_model=SearchResponse)
-async def search_youtube(q: str = Query(..., description="Search query")):
+async def search_youtube(request: Request, q: str = Query(..., description="Search query")):
     """Search YouTube for videos"""
     
-    if not YOUTUBE_SEARCH_AVAILABLE:
+    if search_backend is None:
         raise HTTPException(
             status_code=503,
             detail="YouTube search not available. Please install youtube-search-python"
@@ -215,8 +299,10 @@ async def search_youtube(q: str = Query(..., description="Search query")):
         raise HTTPException(status_code=400, detail="Search query cannot be empty")
     
     try:
-        videos_search = VideosSearch(q, limit=20)
-        results = videos_search.result()
+        # Searches during warm-up wait for the import instead of blocking a search thread on it
+        if YOUTUBE_SEARCH_AVAILABLE:
+            await youtube_search.wait()
+        results = await cancel_on_disconnect(request, search_backend.search(q, limit=20))
         
         search_results = []
         
@@ -236,10 +322,47 @@ async def search_youtube(q: str = Query(..., description="Search query")):
             total=len(search_results)
         )
     
+    except SearchTimeout as e:
+        logger.warning(str(e))
+        raise HTTPException(status_code=504, detail="Search timed out, please try again")
+    except ClientDisconnected:
+        raise HTTPException(status_code=499, detail="Client closed request")
     except Exception as e:
         logger.error(f"Search failed: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
 
+def extract_audio(video_id: str) -> PlayResponse:
+    """Extract the best audio stream with a pooled YoutubeDL (blocking)"""
+    with ydl_pool.checkout() as ydl:
+        video_url = f"https://www.youtube.com/watch?v={video_id}"
+        info = ydl.extract_info(video_url, download=False)
+    
+    # Get the best audio stream
+    formats = info.get('formats', [])
+    audio_url = None
+    
+    # Find audio-only format first
+    for fmt in formats:
+        if fmt.get('acodec') != 'none' and fmt.get('vcodec') == 'none':
+            audio_url = fmt.get('url')
+            break
+    
+    # If no audio-only, get best format with audio
+    if not audio_url:
+        for fmt in formats:
+            if fmt.get('acodec') != 'none':
+                audio_url = fmt.get('url')
+                break
+    
+    if not audio_url:
+        raise HTTPException(status_code=404, detail="No playable audio stream found")
+    
+    return PlayResponse(
+        stream_url=audio_url,
+        title=info.get('title', 'Unknown Title'),
+        duration=info.get('duration_string', 'Unknown')
+    )
+
 @app.get("/play/{video_id}", response_model=PlayResponse)
 async def get_stream_url(video_id: str):
     """Get streamable URL for a YouTube video"""
@@ -251,44 +374,11 @@ async def get_stream_url(video_id: str):
         )
     
     try:
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'quiet': True,
-            'no_warnings': True,
-            'extractaudio': True,
-            'audioformat': 'mp3',
-            'noplaylist': True,
-        }
-        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            video_url = f"https://www.youtube.com/watch?v={video_id}"
-            info = ydl.extract_info(video_url, download=False)
-            
-            # Get the best audio stream
-            formats = info.get('formats', [])
-            audio_url = None
-            
-            # Find audio-only format first
-            for fmt in formats:
-                if fmt.get('acodec') != 'none' and fmt.get('vcodec') == 'none':
-                    audio_url = fmt.get('url')
-                    break
-            
-            # If no audio-only, get best format with audio
-            if not audio_url:
-                for fmt in formats:
-                    if fmt.get('acodec') != 'none':
-                        audio_url = fmt.get('url')
-                        break
-            
-            if not audio_url:
-                raise HTTPException(status_code=404, detail="No playable audio stream found")
-            
-            return PlayResponse(
-                stream_url=audio_url,
-                title=info.get('title', 'Unknown Title'),
-                duration=info.get('duration_string', 'Unknown')
-            )
+        # Never import yt-dlp on the event loop
+        await ytdlp.wait()
+        # Checking out may build a YoutubeDL and extraction blocks on the network,
+        # so both run on a worker thread
+        return await asyncio.get_running_loop().run_in_executor(None, extract_audio, video_id)
     
     except Exception as e:
         logger.error(f"Failed to get stream URL for {video_id}: {str(e)}")
@@ -342,10 +432,10 @@ async def delete_song(filename: str):
         raise HTTPException(status_code=500, detail="Failed to delete file")
 
 @app.get("/trending", response_model=SearchResponse)
-async def get_trending():
-    """Get trending music from YouTube"""
+async def get_trending(request: Request):
+    """Trending music, served from the background-refreshed snapshot"""
     
-    if not YOUTUBE_SEARCH_AVAILABLE:
+    if trending is None:
         # Return mock data if YouTube search is not available
         mock_results = [
             SearchResult(
@@ -371,40 +461,17 @@ async def get_trending():
             total=len(mock_results)
         )
     
-    try:
-        import random
-        trending_queries = [
-            "trending music 2024",
-            "popular songs",
-            "top hits",
-            "viral music"
-        ]
-        
-        query = random.choice(trending_queries)
-        videos_search = VideosSearch(query, limit=10)
-        results = videos_search.result()
-        
-        search_results = []
-        
-        for video in results['result']:
-            search_result = SearchResult(
-                id=video['id'],
-                title=video['title'],
-                channel=video['channel']['name'],
-                duration=video.get('duration', 'Unknown'),
-                thumbnail=video['thumbnails'][0]['url'] if video['thumbnails'] else '',
-                url=video['link']
-            )
-            search_results.append(search_result)
-        
-        return SearchResponse(
-            results=search_results,
-            total=len(search_results)
-        )
-    
-    except Exception as e:
-        logger.error(f"Failed to get trending: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Failed to get trending: {str(e)}")
+    snapshot = await trending.wait_for_snapshot(TRENDING_FIRST_WAIT)
+    if snapshot is None:
+        # Cold start with no saved snapshot and the first refresh failed
+        raise HTTPException(status_code=503, detail=f"Trending is not available yet: {trending.last_error}")
+    
+    # Clients revalidate every time; an unchanged snapshot costs a 304
+    headers = {"ETag": snapshot.etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and etag_matches(if_none_match, snapshot.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
 
 # Startup event
 @app.on_event("startup")
@@ -430,10 +497,31 @@ async def startup_event():
     # Create directories
     UPLOAD_DIR.mkdir(exist_ok=True)
     STATIC_DIR.mkdir(exist_ok=True)
+    CACHE_DIR.mkdir(exist_ok=True)
+    
+    # Serve the last trending snapshot at once, refresh it in the background
+    if trending:
+        trending.load()
+        app.state.trending_refresh = asyncio.create_task(trending.run())
+    
+    # Import yt-dlp and the search client, then build the YoutubeDL instances,
+    # in the background so the server accepts requests right away
+    async def warm_ydl_pool():
+        if ytdlp.state == "warm":
+            await asyncio.get_running_loop().run_in_executor(None, ydl_pool.warm)
+    warmup.start(warm_ydl_pool)
     
     logger.info("✅ SpotifyClone API started successfully!")
     logger.info("📝 API Documentation: http://localhost:8000/docs")
 
+# Shutdown event
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background work"""
+    warmup.cancel()
+    if trending:
+        app.state.trending_refresh.cancel()
+
 if __name__ == "__main__":
     try:
         import uvicorn
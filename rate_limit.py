@@ -0,0 +1,208 @@
+"""
+SpotifyClone rate limiting - per-client token buckets checked before a request does any work
+"""
+
+import json
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_KEYS = ("ip", "api_key")
+API_KEY_HEADER = b"x-api-key"
+
+
+def parse_limit(spec: str) -> Optional[Tuple[float, float]]:
+    """``"30/60"`` (a burst of 30 requests, refilled evenly over 60 seconds) as
+    ``(capacity, tokens per second)``; None for ``"off"`` or ``"0"``.
+    """
+    spec = spec.strip().lower()
+    if spec in ("off", "0", ""):
+        return None
+    requests, _, seconds = spec.partition("/")
+    try:
+        capacity, period = float(requests), float(seconds or "1")
+    except ValueError:
+        capacity = period = 0.0
+    if capacity < 1 or period <= 0:
+        raise ValueError(f"Bad rate limit {spec!r}; use REQUESTS/SECONDS (e.g. 30/60) or off")
+    return capacity, capacity / period
+
+
+class TokenBuckets:
+    """One token bucket per client, for one group of routes.
+
+    A bucket holds up to ``capacity`` tokens and refills at ``rate`` per
+    second; each request takes a token. Buckets are refilled lazily when
+    touched and kept in an OrderedDict in least-recently-seen order, so a
+    request costs a dict lookup and a move to the end. A bucket idle long
+    enough to have refilled completely is no different from a new one,
+    so such buckets are dropped from the cold end as requests arrive; at
+    most ``max_buckets`` are kept even under a flood of distinct clients.
+    Only the event loop touches the buckets, so no lock is needed.
+    """
+
+    def __init__(self, capacity: float, rate: float, max_buckets: int = 100000):
+        self.capacity = capacity
+        self.rate = rate
+        self.max_buckets = max_buckets
+        self.refill_time = capacity / rate
+        # key -> [tokens, last update]
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+        self.allowed = 0
+        self.throttled = 0
+        self.evicted = 0
+
+    def _evict(self, now: float):
+        buckets = self._buckets
+        while buckets:
+            oldest = next(iter(buckets.values()))
+            if now - oldest[1] < self.refill_time and len(buckets) < self.max_buckets:
+                break
+            buckets.popitem(last=False)
+            self.evicted += 1
+
+    def take(self, key: str, now: Optional[float] = None) -> float:
+        """Take a token for ``key``: 0 if the request may go ahead, otherwise
+        the seconds until a token will be available.
+        """
+        now = time.monotonic() if now is None else now
+        self._evict(now)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [self.capacity, now]
+        else:
+            bucket[0] = min(self.capacity, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            self._buckets.move_to_end(key)
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            self.allowed += 1
+            return 0.0
+        self.throttled += 1
+        return (1 - bucket[0]) / self.rate
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class RateLimiter:
+    """Token buckets per route group, keyed by client IP or API key.
+
+    ``limits`` maps a path prefix (``/play`` covers ``/play/x`` and
+    ``/play/batch``) to a ``(capacity, rate)`` pair, or None for no limit.
+    With ``key="api_key"`` clients sending one of ``api_keys`` in the
+    ``X-API-Key`` header are limited per key; any other value is ignored
+    and the client is limited per IP, so made-up keys cannot buy fresh
+    buckets. Behind ``trusted_proxies`` reverse proxies the IP is read
+    from ``X-Forwarded-For``, counting that many hops from the right:
+    those entries were appended by our proxies, anything further left
+    comes from the client and could be forged.
+    """
+
+    def __init__(self, limits: Mapping[str, Optional[Tuple[float, float]]], key: str = "ip",
+                 api_keys: Iterable[str] = (), trusted_proxies: int = 0, max_clients: int = 100000):
+        if key not in RATE_LIMIT_KEYS:
+            raise ValueError(f"Unknown rate limit key {key!r}, expected one of: {', '.join(RATE_LIMIT_KEYS)}")
+        if trusted_proxies < 0:
+            raise ValueError("trusted_proxies cannot be negative")
+        self.key = key
+        self.api_keys = {api_key.encode("latin-1") for api_key in api_keys if api_key}
+        if key == "api_key" and not self.api_keys:
+            logger.warning("Rate limiting by API key without any configured keys; every client is limited per IP")
+        self.trusted_proxies = trusted_proxies
+        self.groups: Dict[str, TokenBuckets] = {
+            prefix: TokenBuckets(limit[0], limit[1], max_clients)
+            for prefix, limit in limits.items() if limit is not None
+        }
+
+    def group_for(self, path: str) -> Optional[str]:
+        for prefix in self.groups:
+            if path == prefix or path.startswith(prefix + "/"):
+                return prefix
+        return None
+
+    def client_key(self, scope: dict) -> str:
+        headers = dict(scope["headers"])
+        if self.key == "api_key":
+            api_key = headers.get(API_KEY_HEADER)
+            if api_key in self.api_keys:
+                return "key:" + api_key.decode("latin-1")
+        if self.trusted_proxies:
+            hops = [hop.strip() for hop in headers.get(b"x-forwarded-for", b"").split(b",") if hop.strip()]
+            if len(hops) >= self.trusted_proxies:
+                return "ip:" + hops[-self.trusted_proxies].decode("latin-1")
+        # No proxy, or a request that bypassed it: the peer address is the client
+        client = scope.get("client")
+        return "ip:" + (client[0] if client else "unknown")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "key": self.key,
+            "groups": {
+                prefix: {
+                    "capacity": buckets.capacity,
+                    "per_second": round(buckets.rate, 4),
+                    "clients": len(buckets),
+                    "allowed": buckets.allowed,
+                    "throttled": buckets.throttled,
+                    "evicted": buckets.evicted,
+                }
+                for prefix, buckets in self.groups.items()
+            },
+        }
+
+
+class RateLimitMiddleware:
+    """Answers over-limit requests with 429 before the app sees them.
+
+    Runs ahead of routing, body parsing and the endpoint, so a throttled
+    request never reaches the extraction pool, search threads or the
+    upload spooler. ``Retry-After`` is the time until the client's next
+    token, rounded up to whole seconds.
+    """
+
+    def __init__(self, app: Callable, limiter: RateLimiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def _reject(self, send: Callable, group: str, wait: float):
+        body = json.dumps({
+            "error": "Too Many Requests",
+            "detail": f"Rate limit for {group} exceeded, retry in {wait:.1f}s",
+            "retry_after": round(wait, 3),
+        }).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(wait))).encode()),
+                # Sent outside CORSMiddleware, so the browser needs these to read it
+                (b"access-control-allow-origin", b"*"),
+                (b"access-control-expose-headers", b"Retry-After"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+        group = self.limiter.group_for(scope["path"])
+        if group is None:
+            await self.app(scope, receive, send)
+            return
+
+        key = self.limiter.client_key(scope)
+        wait = self.limiter.groups[group].take(key)
+        if wait > 0:
+            logger.debug(f"Rate limited {key} on {group} for {wait:.1f}s")
+            await self._reject(send, group, wait)
+            return
+        await self.app(scope, receive, send)
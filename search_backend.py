@@ -0,0 +1,184 @@
+"""
+SpotifyClone search backends - non-blocking YouTube search with limits and deadlines
+"""
+
+import asyncio
+import logging
+import random
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SEARCH_BACKENDS = ("youtube", "fake")
+
+
+class SearchTimeout(Exception):
+    """Raised when a search exceeds its deadline"""
+
+
+class ClientDisconnected(Exception):
+    """Raised when the client went away before the work finished"""
+
+
+class SearchBackend:
+    """Base class for search backends.
+
+    ``search`` returns the raw ``VideosSearch.result()`` shape
+    (``{"result": [...]}``). Every call holds a slot of a shared semaphore
+    and is cancelled once ``timeout`` seconds have passed.
+    """
+
+    name = "base"
+
+    def __init__(self, max_concurrency: int = 8, timeout: float = 10.0):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.active = 0
+        self.calls = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.total_latency = 0.0
+
+    async def _search(self, query: str, limit: int, **kwargs: Any) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    async def search(self, query: str, limit: int = 20, timeout: Optional[float] = None,
+                     **kwargs: Any) -> Dict[str, Any]:
+        """Run a search under the concurrency limit and deadline"""
+        if self._semaphore is None:
+            # Created lazily so it binds to the server's event loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        deadline = timeout if timeout is not None else self.timeout
+        start = time.monotonic()
+        try:
+            # The deadline covers both waiting for a slot and the search itself
+            await asyncio.wait_for(self._semaphore.acquire(), deadline)
+            self.active += 1
+            try:
+                remaining = max(0.0, deadline - (time.monotonic() - start))
+                return await asyncio.wait_for(self._search(query, limit, **kwargs), remaining)
+            finally:
+                self.active -= 1
+                self._semaphore.release()
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise SearchTimeout(f"Search for {query!r} timed out after {deadline}s")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.calls += 1
+            self.total_latency += time.monotonic() - start
+
+    def close(self):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "max_concurrency": self.max_concurrency,
+            "active": self.active,
+            "calls": self.calls,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "avg_latency_ms": round(self.total_latency / self.calls * 1000, 2) if self.calls else 0.0,
+        }
+
+
+class VideosSearchBackend(SearchBackend):
+    """Runs the synchronous youtube-search-python client on its own threads"""
+
+    name = "youtube"
+
+    def __init__(self, client: Callable[..., Any], max_concurrency: int = 8, timeout: float = 10.0):
+        super().__init__(max_concurrency=max_concurrency, timeout=timeout)
+        self.client = client
+        # Sized to the semaphore so search never competes with other executors
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="search")
+
+    def _run(self, query: str, limit: int, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        return self.client(query, limit=limit, **kwargs).result()
+
+    async def _search(self, query: str, limit: int, **kwargs: Any) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._run, query, limit, kwargs)
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class FakeSearchBackend(SearchBackend):
+    """Local stand-in returning generated results, for tests and benchmarks.
+
+    ``latency`` is a ``(min, max)`` range in seconds and ``failure_rate`` the
+    fraction of calls that raise.
+    """
+
+    name = "fake"
+
+    def __init__(self, latency: tuple = (0.0, 0.0), failure_rate: float = 0.0,
+                 results: Optional[List[Dict[str, Any]]] = None,
+                 max_concurrency: int = 8, timeout: float = 10.0):
+        super().__init__(max_concurrency=max_concurrency, timeout=timeout)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.results = results
+
+    @staticmethod
+    def make_video(query: str, index: int) -> Dict[str, Any]:
+        video_id = f"fake{zlib.crc32(f'{query}:{index}'.encode()) % 10 ** 7:07d}"
+        return {
+            "id": video_id,
+            "title": f"{query.title()} - Track {index + 1}",
+            "channel": {"name": f"{query.title()} Channel"},
+            "duration": f"{3 + index % 3}:{(index * 7) % 60:02d}",
+            "thumbnails": [{"url": f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg"}],
+            "link": f"https://www.youtube.com/watch?v={video_id}",
+        }
+
+    def result(self, query: str, limit: int) -> Dict[str, Any]:
+        """The results of one search, without the latency; raises for a failed one"""
+        if random.random() < self.failure_rate:
+            raise RuntimeError("Fake search failure")
+        if self.results is not None:
+            return {"result": self.results[:limit]}
+        return {"result": [self.make_video(query, i) for i in range(limit)]}
+
+    async def _search(self, query: str, limit: int, **kwargs: Any) -> Dict[str, Any]:
+        await asyncio.sleep(random.uniform(*self.latency))
+        return self.result(query, limit)
+
+
+def create_search_backend(name: str, client: Optional[Callable[..., Any]] = None,
+                          max_concurrency: int = 8, timeout: float = 10.0) -> Optional[SearchBackend]:
+    """Build the backend selected by name, or None if it cannot run here"""
+    if name not in SEARCH_BACKENDS:
+        raise ValueError(f"Unknown search backend {name!r}, expected one of: {', '.join(SEARCH_BACKENDS)}")
+    if name == "fake":
+        return FakeSearchBackend(max_concurrency=max_concurrency, timeout=timeout)
+    if client is None:
+        return None
+    return VideosSearchBackend(client, max_concurrency=max_concurrency, timeout=timeout)
+
+
+async def cancel_on_disconnect(request: Any, awaitable: Awaitable[Any], poll_interval: float = 0.25) -> Any:
+    """Await ``awaitable`` but cancel it if the HTTP client disconnects first"""
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                raise ClientDisconnected("Client disconnected")
+    finally:
+        if not task.done():
+            task.cancel()
@@ -0,0 +1,144 @@
+"""
+SpotifyClone stand-in servers - local HTTP servers mimicking googlevideo for testing
+"""
+
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Set
+from urllib.parse import parse_qs, urlparse
+
+RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+def make_payload(size: int) -> bytes:
+    """Deterministic bytes, so a relayed range can be checked against the source"""
+    return bytes(i % 251 for i in range(size))
+
+
+class GoogleVideoStandIn:
+    """Threaded HTTP server serving byte ranges the way googlevideo does.
+
+    URLs look like ``/videoplayback?id=<video_id>&expire=<unix time>``.
+    Requests for expired URLs, or for ids in ``forbidden``, get a 403, so
+    URL expiry can be exercised without touching YouTube. ``latency`` delays
+    every response to mimic a remote host.
+    """
+
+    def __init__(self, payload: bytes, host: str = "127.0.0.1", port: int = 0,
+                 latency: float = 0.0, content_type: str = "audio/webm"):
+        self.payload = payload
+        self.latency = latency
+        self.content_type = content_type
+        self.forbidden: Set[str] = set()
+        self.requests = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url_for(self, video_id: str, ttl: float = 21600) -> str:
+        """A signed-looking URL that stops working after ``ttl`` seconds"""
+        return f"{self.base_url}/videoplayback?id={video_id}&expire={int(time.time() + ttl)}"
+
+    def _make_handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _serve(self, send_body: bool):
+                with standin._lock:
+                    standin.requests += 1
+                if standin.latency:
+                    time.sleep(standin.latency)
+
+                query = parse_qs(urlparse(self.path).query)
+                video_id = query.get("id", [""])[0]
+                expire = int(query.get("expire", ["0"])[0] or 0)
+                if video_id in standin.forbidden or expire <= time.time():
+                    with standin._lock:
+                        standin.rejected += 1
+                    self.send_response(403)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                size = len(standin.payload)
+                start, end, status = 0, size - 1, 200
+                match = RANGE_RE.match(self.headers.get("Range", ""))
+                if match and (match.group(1) or match.group(2)):
+                    if match.group(1):
+                        start = int(match.group(1))
+                        end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+                    else:
+                        start = max(size - int(match.group(2)), 0)
+                    if start >= size or end < start:
+                        self.send_response(416)
+                        self.send_header("Content-Range", f"bytes */{size}")
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    status = 206
+
+                self.send_response(status)
+                self.send_header("Content-Type", standin.content_type)
+                self.send_header("Accept-Ranges", "bytes")
+                self.send_header("Content-Length", str(end - start + 1))
+                if status == 206:
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+                self.end_headers()
+                if send_body:
+                    self.wfile.write(standin.payload[start:end + 1])
+
+            def do_GET(self):
+                self._serve(send_body=True)
+
+            def do_HEAD(self):
+                self._serve(send_body=False)
+
+        return Handler
+
+    def start(self) -> "GoogleVideoStandIn":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "GoogleVideoStandIn":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve a googlevideo stand-in")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--size", type=int, default=4 * 1024 * 1024, help="Payload size in bytes")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to delay each response")
+    args = parser.parse_args()
+
+    server = GoogleVideoStandIn(make_payload(args.size), port=args.port, latency=args.latency)
+    print(f"Serving {args.size} bytes at {server.url_for('test')}")
+    server.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,173 @@
+"""
+SpotifyClone streaming relay - proxies YouTube audio through pooled upstream connections
+"""
+
+import asyncio
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+RELAY_CHUNK_SIZE = 64 * 1024
+# Upstream headers the client needs to play and seek
+PASSTHROUGH_HEADERS = (
+    "content-type", "content-length", "content-range", "accept-ranges", "last-modified", "etag"
+)
+# googlevideo answers these once a signed URL has expired
+EXPIRED_STATUSES = (403, 410)
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+
+
+class UpstreamError(Exception):
+    """Raised when the upstream cannot be reached or keeps refusing the URL"""
+
+
+class RelayStream:
+    """An open upstream response, relayed through a bounded buffer"""
+
+    def __init__(self, relay: "StreamRelay", response: "httpx.Response"):
+        self.relay = relay
+        self.response = response
+        self.status_code = response.status_code
+        self.headers: Dict[str, str] = {
+            name: response.headers[name] for name in PASSTHROUGH_HEADERS if name in response.headers
+        }
+
+    @property
+    def media_type(self) -> Optional[str]:
+        return self.headers.get("content-type")
+
+    async def body(self, strict: bool = False) -> AsyncIterator[bytes]:
+        """Yield the upstream body.
+
+        A reader task fills a queue of at most ``buffer_chunks`` chunks, so
+        a slow client holds back the upstream read instead of growing memory.
+        If upstream breaks off, a relayed response (already started) just
+        ends; with ``strict`` the caller gets an UpstreamError instead, for
+        consumers that must not mistake a truncated body for a whole one.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.relay.buffer_chunks)
+        done = object()
+        error: Optional[Exception] = None
+
+        async def pump():
+            nonlocal error
+            try:
+                async for chunk in self.response.aiter_raw(self.relay.chunk_size):
+                    await queue.put(chunk)
+            except Exception as e:
+                self.relay.upstream_errors += 1
+                logger.warning(f"Upstream stream broke off: {e}")
+                error = e
+            await queue.put(done)
+
+        self.relay.active += 1
+        reader = asyncio.ensure_future(pump())
+        try:
+            while True:
+                chunk = await queue.get()
+                if chunk is done:
+                    if strict and error is not None:
+                        raise UpstreamError(f"Upstream stream broke off: {error}") from error
+                    break
+                self.relay.bytes_relayed += len(chunk)
+                yield chunk
+        finally:
+            # Runs on completion and when the client disconnects mid-stream
+            reader.cancel()
+            await asyncio.gather(reader, return_exceptions=True)
+            self.relay.active -= 1
+            await self.response.aclose()
+
+
+class StreamRelay:
+    """Relays googlevideo audio through one pooled keep-alive HTTP client.
+
+    ``resolve(video_id)`` returns the current upstream URL (normally via the
+    extraction cache). When upstream rejects it as expired, ``invalidate``
+    drops the cached URL and the request is retried once with a fresh one.
+    """
+
+    def __init__(self, resolve: Callable[[str], Awaitable[str]],
+                 invalidate: Callable[[str], Awaitable[None]],
+                 max_connections: int = 32, max_keepalive: int = 16,
+                 buffer_chunks: int = 8, chunk_size: int = RELAY_CHUNK_SIZE,
+                 connect_timeout: float = 10.0, read_timeout: float = 30.0):
+        self.resolve = resolve
+        self.invalidate = invalidate
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.buffer_chunks = buffer_chunks
+        self.chunk_size = chunk_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._client: Optional["httpx.AsyncClient"] = None
+        self.active = 0
+        self.opened = 0
+        self.reresolved = 0
+        self.upstream_errors = 0
+        self.bytes_relayed = 0
+
+    @property
+    def client(self) -> "httpx.AsyncClient":
+        if self._client is None:
+            # Created lazily so it binds to the server's event loop
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive
+                ),
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                headers={"User-Agent": USER_AGENT},
+                follow_redirects=True
+            )
+        return self._client
+
+    async def _request(self, url: str, range_header: Optional[str]) -> "httpx.Response":
+        headers = {"Range": range_header} if range_header else {}
+        request = self.client.build_request("GET", url, headers=headers)
+        try:
+            return await self.client.send(request, stream=True)
+        except httpx.HTTPError as e:
+            self.upstream_errors += 1
+            raise UpstreamError(f"Could not reach upstream: {e}") from e
+
+    async def open(self, video_id: str, range_header: Optional[str] = None) -> RelayStream:
+        """Start relaying a video, forwarding the client's Range header"""
+        url = await self.resolve(video_id)
+        response = await self._request(url, range_header)
+
+        if response.status_code in EXPIRED_STATUSES:
+            await response.aclose()
+            logger.info(f"Upstream URL for {video_id} rejected ({response.status_code}), re-resolving")
+            self.reresolved += 1
+            await self.invalidate(video_id)
+            url = await self.resolve(video_id)
+            response = await self._request(url, range_header)
+            if response.status_code in EXPIRED_STATUSES:
+                await response.aclose()
+                self.upstream_errors += 1
+                raise UpstreamError(f"Upstream refused a freshly resolved URL ({response.status_code})")
+
+        self.opened += 1
+        return RelayStream(self, response)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "active_streams": self.active,
+            "opened": self.opened,
+            "reresolved": self.reresolved,
+            "upstream_errors": self.upstream_errors,
+            "bytes_relayed": self.bytes_relayed,
+        }
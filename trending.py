@@ -0,0 +1,188 @@
+"""
+SpotifyClone trending - background-refreshed, merged snapshot of the trending searches
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SearchFunc = Callable[[str, int], Awaitable[Dict[str, Any]]]
+
+
+def to_result(video: Dict[str, Any]) -> Dict[str, Any]:
+    """A youtube-search-python video as a SearchResult dict"""
+    return {
+        "id": video["id"],
+        "title": video["title"],
+        "channel": video["channel"]["name"],
+        "duration": video.get("duration") or "Unknown",
+        "thumbnail": video["thumbnails"][0]["url"] if video.get("thumbnails") else "",
+        "url": video["link"],
+    }
+
+
+def merge(per_query: Dict[str, List[Dict[str, Any]]], queries: List[str], limit: int) -> List[Dict[str, Any]]:
+    """Interleave the results of each query, dropping repeated videos, up to ``limit``"""
+    merged, seen = [], set()
+    columns = [per_query.get(query, []) for query in queries]
+    for row in range(max((len(column) for column in columns), default=0)):
+        for column in columns:
+            if row < len(column) and column[row]["id"] not in seen:
+                seen.add(column[row]["id"])
+                merged.append(column[row])
+                if len(merged) >= limit:
+                    return merged
+    return merged
+
+
+class Snapshot:
+    """One published trending list with its response body and ETag precomputed"""
+
+    def __init__(self, generated_at: float, per_query: Dict[str, List[Dict[str, Any]]],
+                 results: List[Dict[str, Any]]):
+        self.generated_at = generated_at
+        self.per_query = per_query
+        self.results = results
+        self.body = json.dumps({"results": results, "total": len(results)}).encode()
+        self.etag = f'"{hashlib.sha1(self.body).hexdigest()[:20]}"'
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"generated_at": self.generated_at, "queries": self.per_query, "results": self.results}
+
+
+class TrendingService:
+    """Keeps the trending list precomputed instead of searching on every request.
+
+    ``run`` searches every query in ``queries`` each ``interval`` seconds,
+    merges the results and publishes them as a new Snapshot; requests only
+    read ``snapshot``. A query that fails keeps its results from the last
+    snapshot, and a refresh where every query fails (or nothing comes back)
+    keeps the last snapshot as it is and is retried after
+    ``retry_interval``. Snapshots are written to ``path`` so a restart
+    serves the last list at once.
+    """
+
+    def __init__(self, search: SearchFunc, queries: List[str], path: Path, per_query: int = 10,
+                 max_results: int = 20, interval: float = 1800.0, retry_interval: float = 60.0):
+        self.search = search
+        self.queries = list(queries)
+        self.path = Path(path)
+        self.per_query = per_query
+        self.max_results = max_results
+        self.interval = interval
+        self.retry_interval = retry_interval
+        self.snapshot: Optional[Snapshot] = None
+        # Set after the first refresh attempt; created on the server's loop
+        self._attempted: Optional[asyncio.Event] = None
+        self._last_failed = False
+        self.refreshes = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+
+    def load(self):
+        """Publish the snapshot saved by a previous run, if any"""
+        if not self.path.exists():
+            return
+        try:
+            data = json.loads(self.path.read_text())
+            self.snapshot = Snapshot(data["generated_at"], data["queries"], data["results"])
+            logger.info(f"Loaded trending snapshot with {len(self.snapshot.results)} results "
+                        f"from {time.time() - self.snapshot.generated_at:.0f}s ago")
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.error(f"Could not read trending snapshot, starting empty: {e}")
+
+    def _save(self, snapshot: Snapshot):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+            temp_path.write_text(json.dumps(snapshot.to_dict()))
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.error(f"Could not save trending snapshot: {e}")
+
+    async def _search(self, query: str) -> List[Dict[str, Any]]:
+        results = await self.search(query, self.per_query)
+        return [to_result(video) for video in (results or {}).get("result", [])]
+
+    async def refresh(self) -> bool:
+        """Search every query and publish the merged snapshot; False keeps the old one"""
+        outcomes = await asyncio.gather(*(self._search(query) for query in self.queries),
+                                        return_exceptions=True)
+        previous = self.snapshot.per_query if self.snapshot else {}
+        per_query, errors = {}, []
+        for query, outcome in zip(self.queries, outcomes):
+            if isinstance(outcome, Exception):
+                errors.append(f"{query!r}: {outcome}")
+                if query in previous:
+                    per_query[query] = previous[query]
+            else:
+                per_query[query] = outcome
+
+        results = merge(per_query, self.queries, self.max_results)
+        if len(errors) == len(self.queries) or not results:
+            self.failures += 1
+            self.last_error = "; ".join(errors) or "No results"
+            logger.warning(f"Trending refresh failed, keeping the last snapshot: {self.last_error}")
+            return False
+        if errors:
+            logger.warning(f"Trending refresh reused old results for: {'; '.join(errors)}")
+
+        snapshot = Snapshot(time.time(), per_query, results)
+        self.snapshot = snapshot
+        self.refreshes += 1
+        await asyncio.get_running_loop().run_in_executor(None, self._save, snapshot)
+        logger.info(f"Trending snapshot refreshed: {len(results)} results from {len(self.queries)} queries")
+        return True
+
+    def _next_delay(self) -> float:
+        if self.snapshot is None:
+            return self.retry_interval if self._last_failed else 0.0
+        if self._last_failed:
+            return self.retry_interval
+        return max(0.0, self.snapshot.generated_at + self.interval - time.time())
+
+    def _attempted_event(self) -> asyncio.Event:
+        if self._attempted is None:
+            self._attempted = asyncio.Event()
+        return self._attempted
+
+    async def run(self):
+        """Refresh forever (a background task)"""
+        while True:
+            await asyncio.sleep(self._next_delay())
+            try:
+                self._last_failed = not await self.refresh()
+            except Exception as e:
+                self._last_failed = True
+                self.failures += 1
+                self.last_error = str(e)
+                logger.error(f"Trending refresh crashed: {e}")
+            self._attempted_event().set()
+
+    async def wait_for_snapshot(self, timeout: float) -> Optional[Snapshot]:
+        """The snapshot, waiting up to ``timeout`` for the first refresh after a cold start"""
+        if self.snapshot is None:
+            try:
+                await asyncio.wait_for(self._attempted_event().wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.snapshot
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self.snapshot
+        return {
+            "queries": len(self.queries),
+            "results": len(snapshot.results) if snapshot else 0,
+            "age_s": round(time.time() - snapshot.generated_at, 1) if snapshot else None,
+            "etag": snapshot.etag if snapshot else None,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,163 @@
+"""
+SpotifyClone streaming uploads - constant-memory upload handling with early size limits
+"""
+
+import hashlib
+import json
+import logging
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Iterable, Optional
+
+import aiofiles
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
+# Room for multipart boundaries and part headers around the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    """Raised as soon as an upload crosses the byte limit"""
+
+
+class StreamedUpload:
+    """A fully received upload sitting in a temp file next to its destination"""
+
+    def __init__(self, temp_path: Path, size: int, sha256: str):
+        self.temp_path = temp_path
+        self.size = size
+        self.sha256 = sha256
+
+    def discard(self):
+        try:
+            self.temp_path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+async def receive_upload(file: Any, dest_dir: Path, max_size: int,
+                         chunk_size: int = UPLOAD_CHUNK_SIZE) -> StreamedUpload:
+    """Copy an UploadFile to a temp file in ``dest_dir`` chunk by chunk.
+
+    The SHA-256 digest is computed on the way through, and the temp file is
+    removed as soon as ``max_size`` is exceeded or anything else fails.
+    """
+    temp_path = dest_dir / f".upload-{uuid.uuid4().hex}.part"
+    digest = hashlib.sha256()
+    size = 0
+
+    try:
+        async with aiofiles.open(temp_path, 'wb') as f:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadTooLarge(f"Upload exceeds {max_size} bytes")
+                digest.update(chunk)
+                await f.write(chunk)
+    except BaseException:
+        try:
+            temp_path.unlink()
+        except FileNotFoundError:
+            pass
+        raise
+
+    return StreamedUpload(temp_path, size, digest.hexdigest())
+
+
+def remove_stale_uploads(dest_dir: Path, older_than: Optional[float] = None) -> int:
+    """Delete temp files left behind by uploads interrupted by a crash.
+
+    ``older_than`` (a timestamp) spares files written since, such as
+    uploads another worker process is receiving.
+    """
+    removed = 0
+    for temp_path in dest_dir.glob(".upload-*.part"):
+        try:
+            if older_than is not None and temp_path.stat().st_mtime >= older_than:
+                continue
+            temp_path.unlink()
+            removed += 1
+        except FileNotFoundError:
+            # Finished or discarded by its worker meanwhile
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove stale upload {temp_path.name}: {e}")
+    return removed
+
+
+class UploadSizeLimitMiddleware:
+    """Rejects oversized upload bodies before they are buffered.
+
+    Requests whose Content-Length already exceeds the limit are answered
+    without reading the body; others are answered as soon as the received
+    bytes cross it, and the app sees a client disconnect, so the multipart
+    parser never spools more than the limit.
+    """
+
+    def __init__(self, app: Callable, paths: Iterable[str], max_size: int,
+                 detail: Optional[str] = None):
+        self.app = app
+        self.paths = set(paths)
+        self.max_body = max_size + MULTIPART_OVERHEAD
+        self.detail = detail or f"File too large. Maximum size: {max_size // (1024*1024)}MB"
+
+    async def _reject(self, send: Callable):
+        body = json.dumps({"detail": self.detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 400,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close"),
+                # Sent outside CORSMiddleware, so the browser needs this to read it
+                (b"access-control-allow-origin", b"*"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_body:
+            logger.warning(f"Rejected upload with Content-Length {int(content_length)}")
+            await self._reject(send)
+            return
+
+        received = 0
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body:
+                    # Answer now and make the app's body parser see a disconnect
+                    logger.warning(f"Aborted upload after {received} bytes")
+                    rejected = True
+                    await self._reject(send)
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            # Once rejected, whatever the app tries to send is dropped
+            if not rejected:
+                await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not rejected:
+                raise
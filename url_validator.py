@@ -0,0 +1,169 @@
+"""
+SpotifyClone stream URL validation - sampled async HEAD checks with a circuit breaker
+"""
+
+import logging
+import random
+import time
+from typing import Any, Dict, Optional
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+VERIFY_MODES = ("off", "first", "always")
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+
+
+class CircuitBreaker:
+    """Opens after ``threshold`` slow or failed calls in a row.
+
+    While open, calls are skipped for ``cooldown`` seconds; after that one
+    probe is let through, and its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0.0
+        self.probing = False
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        if self.failures < self.threshold:
+            return "closed"
+        return "half_open" if time.monotonic() >= self.open_until else "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def record(self, healthy: bool):
+        self.probing = False
+        if healthy:
+            self.failures = 0
+            return
+        self.failures += 1
+        if self.failures >= self.threshold:
+            if time.monotonic() >= self.open_until:
+                self.trips += 1
+                logger.warning(f"Stream URL checks suspended for {self.cooldown:.0f}s, upstream is slow")
+            self.open_until = time.monotonic() + self.cooldown
+
+
+class UrlValidator:
+    """Checks that extracted stream URLs actually serve, before they are cached.
+
+    ``check`` returns True when the URL answered, False when upstream
+    rejected it (4xx, so the caller should try another format) and None when
+    the check was inconclusive or skipped (timeouts, 5xx, open breaker).
+    Responses slower than ``slow_threshold`` count against the breaker.
+    """
+
+    def __init__(self, mode: str = "first", sample_rate: float = 1.0, timeout: float = 3.0,
+                 slow_threshold: float = 1.5, breaker: Optional[CircuitBreaker] = None,
+                 max_connections: int = 16):
+        if mode not in VERIFY_MODES:
+            raise ValueError(f"Unknown verification mode {mode!r}")
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.timeout = timeout
+        self.slow_threshold = slow_threshold
+        self.breaker = breaker or CircuitBreaker()
+        self.max_connections = max_connections
+        self._client: Optional["httpx.AsyncClient"] = None
+        self.checks = 0
+        self.passed = 0
+        self.rejected = 0
+        self.inconclusive = 0
+        self.skipped_sampling = 0
+        self.skipped_breaker = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    @property
+    def client(self) -> "httpx.AsyncClient":
+        if self._client is None:
+            # Created lazily so it binds to the server's event loop
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                timeout=self.timeout,
+                headers={"User-Agent": USER_AGENT},
+                follow_redirects=True
+            )
+        return self._client
+
+    def should_verify(self, fresh: bool) -> bool:
+        """Whether this resolution is sampled; ``fresh`` means a new extraction"""
+        if self.mode == "off" or (self.mode == "first" and not fresh):
+            return False
+        if random.random() >= self.sample_rate:
+            self.skipped_sampling += 1
+            return False
+        return True
+
+    async def check(self, url: str) -> Optional[bool]:
+        if not self.breaker.allow():
+            self.skipped_breaker += 1
+            return None
+
+        self.checks += 1
+        start = time.monotonic()
+        try:
+            response = await self.client.head(url)
+        except httpx.HTTPError as e:
+            self.inconclusive += 1
+            self.breaker.record(False)
+            logger.warning(f"Could not verify stream URL: {e}")
+            return None
+        finally:
+            # Also on cancellation or an unexpected error, so a half-open
+            # breaker is not left waiting for a probe that never reports
+            self.breaker.probing = False
+            latency = time.monotonic() - start
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+        self.breaker.record(latency < self.slow_threshold and response.status_code < 500)
+        if response.status_code < 400:
+            self.passed += 1
+            return True
+        if response.status_code < 500:
+            self.rejected += 1
+            logger.warning(f"Stream URL returned status {response.status_code}")
+            return False
+        self.inconclusive += 1
+        return None
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "sample_rate": self.sample_rate,
+            "checks": self.checks,
+            "passed": self.passed,
+            "rejected": self.rejected,
+            "inconclusive": self.inconclusive,
+            "skipped_sampling": self.skipped_sampling,
+            "skipped_breaker": self.skipped_breaker,
+            "avg_latency_ms": round(self.total_latency / self.checks * 1000, 1) if self.checks else 0.0,
+            "max_latency_ms": round(self.max_latency * 1000, 1),
+            "breaker": self.breaker.state,
+            "breaker_trips": self.breaker.trips,
+        }
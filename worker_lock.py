@@ -0,0 +1,63 @@
+"""
+SpotifyClone worker lock - picks the one worker process that does shared housekeeping
+"""
+
+import logging
+import os
+from pathlib import Path
+from typing import IO, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderLock:
+    """An exclusive lock on a file shared by the worker processes.
+
+    Whoever holds it is the leader and owns the work that must happen once
+    per directory rather than once per process: startup cleanup, library
+    rescans that queue tag reading and analysis, and the library index
+    file. The lock is held until the process exits, so when the leader
+    dies another worker can take over by calling ``acquire`` again.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._file: Optional[IO] = None
+
+    @property
+    def held(self) -> bool:
+        return self._file is not None
+
+    def acquire(self) -> bool:
+        """Try to become the leader without waiting; True if this process is"""
+        if self._file is not None:
+            return True
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        lock_file = open(self.path, "a+")
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            lock_file.close()
+            return False
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(str(os.getpid()))
+        lock_file.flush()
+        self._file = lock_file
+        logger.info(f"Process {os.getpid()} is the leader worker")
+        return True
+
+    def release(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,148 @@
+"""
+SpotifyClone YoutubeDL pool - reusable, pre-initialized yt-dlp instances
+"""
+
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class YoutubeDLPool:
+    """Keeps YoutubeDL instances built and ready for extraction threads.
+
+    Building a YoutubeDL loads the extractor registry and option state,
+    which costs tens of milliseconds per call. ``checkout`` lends an idle
+    instance to one thread at a time (instances are not thread-safe) and
+    takes it back afterwards. An instance is thrown away after ``max_uses``
+    extractions or as soon as an extraction using it raises, so state from
+    a failed run never leaks into the next one; a background thread then
+    builds its replacement, so requests are not the ones paying for it.
+    ``factory`` builds an instance and can be swapped for a stub in tests
+    and benchmarks.
+    """
+
+    def __init__(self, factory: Callable[[], Any], size: int = 4, max_uses: int = 100):
+        self.factory = factory
+        self.size = size
+        self.max_uses = max_uses
+        self._idle: List[Tuple[Any, int]] = []
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._refilling = False
+        self._closed = False
+        self.created = 0
+        self.checkouts = 0
+        self.misses = 0
+        self.recycled = 0
+        self.errors = 0
+        self.refilled = 0
+
+    def _create(self) -> Any:
+        instance = self.factory()
+        with self._lock:
+            self.created += 1
+        return instance
+
+    def _discard(self, instance: Any):
+        close = getattr(instance, "close", None)
+        if close is not None:
+            try:
+                close()
+            except Exception as e:
+                logger.warning(f"Closing a YoutubeDL instance failed: {e}")
+
+    def _refill(self):
+        try:
+            while True:
+                with self._lock:
+                    if self._closed or len(self._idle) + self._in_use >= self.size:
+                        return
+                instance = self._create()
+                with self._lock:
+                    if not self._closed:
+                        self._idle.append((instance, 0))
+                        self.refilled += 1
+                        continue
+                self._discard(instance)
+        except Exception as e:
+            logger.warning(f"Refilling the YoutubeDL pool failed: {e}")
+        finally:
+            with self._lock:
+                self._refilling = False
+
+    def _start_refill(self):
+        """Replace discarded instances on a background thread (call without the lock)"""
+        with self._lock:
+            if self._refilling or self._closed:
+                return
+            self._refilling = True
+        threading.Thread(target=self._refill, name="ydl-pool-refill", daemon=True).start()
+
+    def warm(self):
+        """Fill the pool up to ``size`` idle instances (blocking)"""
+        with self._lock:
+            self._closed = False
+            missing = self.size - len(self._idle)
+        for _ in range(missing):
+            instance = self._create()
+            with self._lock:
+                self._idle.append((instance, 0))
+        logger.info(f"YoutubeDL pool warmed with {self.size} instances")
+
+    @contextmanager
+    def checkout(self) -> Iterator[Any]:
+        with self._lock:
+            self.checkouts += 1
+            self._in_use += 1
+            entry = self._idle.pop() if self._idle else None
+            if entry is None:
+                self.misses += 1
+        try:
+            # More concurrent extractions than pooled instances: build one now
+            instance, uses = entry if entry is not None else (self._create(), 0)
+        except BaseException:
+            with self._lock:
+                self._in_use -= 1
+            raise
+
+        try:
+            yield instance
+        except BaseException:
+            with self._lock:
+                self.errors += 1
+                self._in_use -= 1
+            self._discard(instance)
+            self._start_refill()
+            raise
+
+        uses += 1
+        with self._lock:
+            self._in_use -= 1
+            if uses < self.max_uses and len(self._idle) < self.size:
+                self._idle.append((instance, uses))
+                return
+            self.recycled += 1
+        self._discard(instance)
+        self._start_refill()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for instance, _ in idle:
+            self._discard(instance)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": self.size,
+            "idle": len(self._idle),
+            "created": self.created,
+            "checkouts": self.checkouts,
+            "misses": self.misses,
+            "recycled": self.recycled,
+            "errors": self.errors,
+            "refilled": self.refilled,
+        }